@@ -1,59 +1,185 @@
+import asyncio
+import functools
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from typing import List, Optional, Union
 
 
 from ..models.models import (
     Query,
     QueryResult,
     QueryWithEmbedding,
+    SearchOptions,
 )
 
-from ..services import openai
+from ..services.embedders import Embedder, get_embedder
+from .query_cache import QueryResultCache
 
 
 class DataStore(ABC):
-    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
-        return openai.get_embeddings(texts)
+    # When True, query embeddings stay float32 np.ndarray rows all the way to the vector store
+    use_arrays = False
+    # Optional cache of query results, see enable_query_cache
+    query_cache: Optional[QueryResultCache] = None
+    # The backend embedding queries and chunks, see set_embedder, None uses the EMBEDDER default
+    embedder: Optional[Embedder] = None
+
+    def set_embedder(
+        self, embedder: Union[str, Embedder, None], output_dim: Optional[int] = None
+    ):
+        """
+        Embed queries and chunks with another backend.
+
+        Args:
+            embedder: The name of a backend in services.embedders, or an Embedder.
+            output_dim: The dimension of the vector field, checked against the embedder's.
+
+        Raises:
+            ValueError: If the embedder is unknown or its dimension is not output_dim.
+        """
+        embedder = get_embedder(embedder)
+        embedder.check_dim(output_dim)
+        self.embedder = embedder
+
+    def get_embeddings(self, texts: List[str], as_array: bool = False):
+        return get_embedder(self.embedder).get_embeddings(texts, as_array=as_array)
+
+    async def get_embeddings_async(self, texts: List[str], as_array: bool = False):
+        """
+        Async version of get_embeddings. A subclass overriding get_embeddings without
+        an async counterpart gets its embeddings computed on the default executor.
+        """
+        if type(self).get_embeddings is not DataStore.get_embeddings:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                None, functools.partial(self.get_embeddings, texts, as_array=as_array)
+            )
+        return await get_embedder(self.embedder).get_embeddings_async(
+            texts, as_array=as_array
+        )
 
     async def query(
-        self, queries: List[Query], top_k=10, partitions: List[str] = None
+        self,
+        queries: List[Query],
+        top_k=10,
+        partitions: List[str] = None,
+        options: Optional[SearchOptions] = None,
     ) -> List[QueryResult]:
         """
         Takes in a list of queries and filters and returns a list of query results with matching document chunks and scores.
+        options overrides the datastore's search settings for this call only, such as a low ef for interactive queries.
         """
         # get a list of of just the queries from the Query list
         query_texts = [query.query for query in queries]
-        query_embeddings = self.get_embeddings(query_texts)
+        query_embeddings = await self.get_embeddings_async(
+            query_texts, as_array=self.use_arrays
+        )
         # hydrate the queries with embeddings
         queries_with_embeddings = [
             QueryWithEmbedding(**query.dict(), embedding=embedding)
             for query, embedding in zip(queries, query_embeddings)
         ]
-        return await self._query(
-            queries_with_embeddings, top_k=top_k, partitions=partitions
+        if self.query_cache is None:
+            return await self._query(
+                queries_with_embeddings,
+                top_k=top_k,
+                partitions=partitions,
+                options=options,
+            )
+
+        results, keys, snapshot = self.query_cache.lookup(
+            queries_with_embeddings, top_k, partitions, *self._options_key(options)
         )
+        misses = [i for i, result in enumerate(results) if result is None]
+        if misses:
+            fetched = await self._query(
+                [queries_with_embeddings[i] for i in misses],
+                top_k=top_k,
+                partitions=partitions,
+                options=options,
+            )
+            self._fill_cached_results(results, keys, snapshot, misses, fetched)
+        return results
 
     def query_synch(
-        self, queries: List[Query], top_k=10, partitions: List[str] = None
+        self,
+        queries: List[Query],
+        top_k=10,
+        partitions: List[str] = None,
+        options: Optional[SearchOptions] = None,
     ) -> List[QueryResult]:
         """
         A synchronous version of query Takes in a list of queries and filters and returns a list of query results with matching document chunks and scores.
         """
         # get a list of of just the queries from the Query list
         query_texts = [query.query for query in queries]
-        query_embeddings = self.get_embeddings(query_texts)
+        query_embeddings = self.get_embeddings(query_texts, as_array=self.use_arrays)
         # hydrate the queries with embeddings
         queries_with_embeddings = [
             QueryWithEmbedding(**query.dict(), embedding=embedding)
             for query, embedding in zip(queries, query_embeddings)
         ]
-        return self._query_synch(
-            queries_with_embeddings, top_k=top_k, partitions=partitions
+        if self.query_cache is None:
+            return self._query_synch(
+                queries_with_embeddings,
+                top_k=top_k,
+                partitions=partitions,
+                options=options,
+            )
+
+        results, keys, snapshot = self.query_cache.lookup(
+            queries_with_embeddings, top_k, partitions, *self._options_key(options)
+        )
+        misses = [i for i, result in enumerate(results) if result is None]
+        if misses:
+            fetched = self._query_synch(
+                [queries_with_embeddings[i] for i in misses],
+                top_k=top_k,
+                partitions=partitions,
+                options=options,
+            )
+            self._fill_cached_results(results, keys, snapshot, misses, fetched)
+        return results
+
+    def enable_query_cache(self, max_entries: int = 1024, ttl: Optional[float] = 60.0):
+        """
+        Cache query results, invalidated when the datastore inserts or deletes.
+
+        Args:
+            max_entries: The number of results kept.
+            ttl: Seconds a result stays valid.
+        """
+        self.query_cache = QueryResultCache(max_entries=max_entries, ttl=ttl)
+
+    def _invalidate_query_cache(self, partition: Optional[str] = None):
+        """Called after a write to partition, None for the whole collection"""
+        if self.query_cache is not None:
+            self.query_cache.invalidate(partition)
+
+    @staticmethod
+    def _options_key(options: Optional[SearchOptions]) -> tuple:
+        """The part of a query cache key coming from the search options"""
+        if options is None:
+            return ()
+        return (tuple(sorted(options.dict(exclude_none=True).items())),)
+
+    def _fill_cached_results(self, results, keys, snapshot, misses, fetched):
+        """Cache the fetched results and fill the gaps in results with them"""
+        # Empty results may come from a failed search, do not cache them
+        self.query_cache.store(
+            [keys[i] for i, result in zip(misses, fetched) if result.results],
+            [result for result in fetched if result.results],
+            snapshot,
         )
+        for i, result in zip(misses, fetched):
+            results[i] = result
 
     @abstractmethod
     async def _query(
-        self, queries: List[QueryWithEmbedding], top_k=10, partitions: List[str] = None
+        self,
+        queries: List[QueryWithEmbedding],
+        top_k=10,
+        partitions: List[str] = None,
+        options: Optional[SearchOptions] = None,
     ) -> List[QueryResult]:
         """
         Takes in a list of queries with embeddings and filters and returns a list of query results with matching document chunks and scores.
@@ -61,7 +187,11 @@ class DataStore(ABC):
         raise NotImplementedError
 
     def _query_synch(
-        self, queries: List[QueryWithEmbedding], top_k=10, partitions: List[str] = None
+        self,
+        queries: List[QueryWithEmbedding],
+        top_k=10,
+        partitions: List[str] = None,
+        options: Optional[SearchOptions] = None,
     ) -> List[QueryResult]:
         """
         A synchronous version of query Takes in a list of queries with embeddings and filters and returns a list of query results with matching document chunks and scores.
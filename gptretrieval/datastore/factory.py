@@ -1,10 +1,19 @@
-from datastore.datastore import DataStore
+from .datastore import DataStore
+from typing import Optional
 import os
 
 
-async def get_datastore() -> DataStore:
+async def get_datastore(embedder: Optional[str] = None) -> DataStore:
+    """
+    Create the datastore selected by the DATASTORE environment variable.
+
+    Args:
+        embedder: The embedding backend, see services.embedders, defaults to the EMBEDDER environment variable.
+    """
     datastore = os.environ.get("DATASTORE")
     assert datastore is not None
+    # Only passed when given, so the providers fall back to EMBEDDER
+    kwargs = {"embedder": embedder} if embedder else {}
 
     match datastore:
         case "milvusbook":
@@ -12,10 +21,12 @@ async def get_datastore() -> DataStore:
 
             return MilvusBookDataStore()
         case "milvussource":
-            from datastore.providers.milvus_source_datastore import (
-                MilvusSourceDataStore,
-            )
+            from .providers.milvus_src_datastore import MilvusSrcDataStore
+
+            return MilvusSrcDataStore(**kwargs)
+        case "local":
+            from .providers.local_datastore import LocalDataStore
 
-            return MilvusSourceDataStore()
+            return LocalDataStore(**kwargs)
         case _:
             raise ValueError(f"Unsupported vector database: {datastore}")
@@ -0,0 +1,148 @@
+import functools
+import os
+import re
+from enum import Enum
+from typing import Callable, Dict, Optional, Tuple
+
+from ..models.models import DocumentMetadataFilter
+from ..services.date import to_unix_timestamp
+
+# Number of distinct filters whose compiled expression is memoized
+FILTER_CACHE_SIZE = int(os.environ.get("FILTER_CACHE_SIZE") or 1024)
+
+# The DocumentMetadataFilter fields, in the order their expressions are joined
+FILTER_FIELDS = (
+    "document_id",
+    "source",
+    "source_id",
+    "author",
+    "start_date",
+    "end_date",
+    "prefix",
+)
+
+_FIELD_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def canonical_filter(filter: DocumentMetadataFilter) -> Tuple:
+    """
+    Convert a filter to a hashable canonical form.
+
+    Enums are replaced by their value and IN-lists and prefixes are sorted, so
+    equivalent filters share the same form.
+    """
+    canonical = []
+    for field in FILTER_FIELDS:
+        value = getattr(filter, field, None)
+        if value is None:
+            continue
+        if field == "prefix":
+            value = tuple(sorted(value.items()))
+        elif isinstance(value, (list, tuple, set)):
+            value = tuple(sorted({_scalar(v) for v in value}))
+        else:
+            value = _scalar(value)
+        canonical.append((field, value))
+    return tuple(canonical)
+
+
+def compile_filter(filter: DocumentMetadataFilter) -> Optional[str]:
+    """
+    Convert a DocumentMetadataFilter to the expression that Milvus takes.
+
+    Args:
+        filter: The filter to convert.
+
+    Returns:
+        The expression, None if the filter is empty.
+    """
+    return _compile(canonical_filter(filter))
+
+
+def merge_filters(*filters: DocumentMetadataFilter) -> Optional[str]:
+    """Combine several filters into a single expression matching all of them"""
+    # Every expression is a conjunction of parenthesized terms, so they join as is
+    expressions = [e for e in (compile_filter(f) for f in filters if f) if e]
+    return " and ".join(expressions) or None
+
+
+@functools.lru_cache(maxsize=FILTER_CACHE_SIZE)
+def _compile(canonical: Tuple) -> Optional[str]:
+    expressions = []
+    for field, value in canonical:
+        # Convert start_date to int and add greater than or equal logic
+        if field == "start_date":
+            expressions.append(f"(created_at >= {to_unix_timestamp(value)})")
+        # Convert end_date to int and add less than or equal logic
+        elif field == "end_date":
+            expressions.append(f"(created_at <= {to_unix_timestamp(value)})")
+        # Match the start of string fields
+        elif field == "prefix":
+            for name, prefix in value:
+                if not _FIELD_NAME.match(name):
+                    raise ValueError(f"Invalid prefix filter field: {name!r}")
+                expressions.append(f"({name} like {quote(like_prefix(prefix))})")
+        # Match any of the values in the list
+        elif isinstance(value, tuple):
+            values = ", ".join(quote(v) for v in value)
+            expressions.append(f"({field} in [{values}])")
+        # Check equivalency of rest of string fields
+        else:
+            expressions.append(f"({field} == {quote(value)})")
+    # Join all our expressions with `and`
+    return " and ".join(expressions) or None
+
+
+def quote(value) -> str:
+    """Quote a string literal for a Milvus expression, escaping backslashes and quotes"""
+    value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{value}"'
+
+
+def like_prefix(prefix: str) -> str:
+    """A like pattern matching the strings that start with prefix, its wildcards taken literally"""
+    prefix = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return prefix + "%"
+
+
+def _scalar(value):
+    return value.value if isinstance(value, Enum) else value
+
+
+def compile_predicate(filter: DocumentMetadataFilter) -> Callable[[Dict], bool]:
+    """
+    Convert a DocumentMetadataFilter to a function testing a row of metadata.
+
+    Matches exactly the rows the Milvus expression of compile_filter matches, for
+    datastores filtering in process.
+
+    Args:
+        filter: The filter to convert.
+
+    Returns:
+        A function returning whether a metadata dict passes the filter.
+    """
+    return _compile_predicate(canonical_filter(filter))
+
+
+@functools.lru_cache(maxsize=FILTER_CACHE_SIZE)
+def _compile_predicate(canonical: Tuple) -> Callable[[Dict], bool]:
+    checks = []
+    for field, value in canonical:
+        if field == "start_date":
+            start = to_unix_timestamp(value)
+            checks.append(lambda row, start=start: (row.get("created_at") or -1) >= start)
+        elif field == "end_date":
+            end = to_unix_timestamp(value)
+            checks.append(lambda row, end=end: (row.get("created_at") or -1) <= end)
+        elif field == "prefix":
+            for name, prefix in value:
+                checks.append(
+                    lambda row, name=name, prefix=prefix: str(row.get(name) or "").startswith(prefix)
+                )
+        elif isinstance(value, tuple):
+            values = frozenset(value)
+            checks.append(lambda row, field=field, values=values: row.get(field) in values)
+        else:
+            checks.append(lambda row, field=field, value=value: row.get(field) == value)
+    return lambda row: all(check(row) for check in checks)
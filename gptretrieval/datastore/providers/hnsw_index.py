@@ -0,0 +1,282 @@
+import heapq
+import math
+import random
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+
+class HNSWIndex:
+    """A Hierarchical Navigable Small World graph over the rows of a vector matrix.
+
+    The index only stores the graph; the vectors stay in the datastore and are
+    passed to every call, so growing the datastore's matrix never copies them.
+    Similarity is the inner product, as for the default Milvus index. Deleted rows
+    are excluded from results through the allowed mask but kept for navigation.
+
+    Args:
+        M (int, optional): Neighbors per node on the upper layers, twice that on layer 0.
+        ef_construction (int, optional): Size of the candidate list while inserting.
+        ef (int, optional): Default size of the candidate list while searching.
+        seed (int, optional): Seed of the random level generator.
+    """
+
+    def __init__(
+        self,
+        M: int = 8,
+        ef_construction: int = 64,
+        ef: int = 10,
+        seed: Optional[int] = None,
+    ):
+        self.M = M
+        self.M0 = 2 * M
+        self.ef_construction = ef_construction
+        self.ef = ef
+        self._ml = 1 / math.log(M)
+        self._rng = random.Random(seed)
+        self.levels: Dict[int, int] = {}
+        self.graph: List[Dict[int, List[int]]] = []
+        self.entry_point: Optional[int] = None
+        self.max_level = -1
+
+    def __len__(self) -> int:
+        return len(self.levels)
+
+    def add(self, rows: Iterable[int], vectors: np.ndarray):
+        """Insert rows of vectors into the graph, one at a time"""
+        for row in rows:
+            self._add(int(row), vectors)
+
+    def _add(self, row: int, vectors: np.ndarray):
+        query = vectors[row]
+        level = int(-math.log(1.0 - self._rng.random()) * self._ml)
+        self.levels[row] = level
+        while len(self.graph) <= level:
+            self.graph.append({})
+        for lc in range(level + 1):
+            self.graph[lc][row] = []
+
+        if self.entry_point is None:
+            self.entry_point, self.max_level = row, level
+            return
+
+        # Greedy descent through the layers above the new node
+        entry_points = [self.entry_point]
+        for lc in range(self.max_level, level, -1):
+            nearest = self._search_layer(query, entry_points, 1, lc, vectors)
+            entry_points = [max(nearest)[1]]
+
+        for lc in range(min(level, self.max_level), -1, -1):
+            found = self._search_layer(
+                query, entry_points, self.ef_construction, lc, vectors
+            )
+            max_neighbors = self.M0 if lc == 0 else self.M
+            neighbors = self._select_neighbors(
+                query, [node for _, node in found], max_neighbors, vectors
+            )
+            self.graph[lc][row] = neighbors
+            for neighbor in neighbors:
+                links = self.graph[lc][neighbor]
+                links.append(row)
+                if len(links) > max_neighbors:
+                    self.graph[lc][neighbor] = self._select_neighbors(
+                        vectors[neighbor], links, max_neighbors, vectors
+                    )
+            entry_points = [node for _, node in found]
+
+        if level > self.max_level:
+            self.entry_point, self.max_level = row, level
+
+    def _select_neighbors(
+        self, query: np.ndarray, nodes: List[int], count: int, vectors: np.ndarray
+    ) -> List[int]:
+        """Pick up to count diverse neighbors among nodes, the heuristic of the HNSW paper
+
+        A node is skipped when it is closer to an already selected neighbor than to
+        the query, so links spread in every direction instead of clustering. Skipped
+        nodes fill the remaining slots, closest first.
+        """
+        candidates = vectors[nodes]
+        sims = candidates @ query
+        order = np.argsort(-sims)
+        # Similarities between the candidates, computed once
+        pairwise = candidates @ candidates.T
+        selected: List[int] = []
+        skipped: List[int] = []
+        for i in order:
+            if len(selected) >= count:
+                break
+            if selected and pairwise[i, selected].max() > sims[i]:
+                skipped.append(i)
+            else:
+                selected.append(i)
+        selected += skipped[: count - len(selected)]
+        return [nodes[i] for i in selected]
+
+    def _search_layer(
+        self,
+        query: np.ndarray,
+        entry_points: List[int],
+        ef: int,
+        level: int,
+        vectors: np.ndarray,
+        allowed: Optional[np.ndarray] = None,
+    ) -> List[Tuple[float, int]]:
+        """Best first search of a layer, returning up to ef (similarity, row) of allowed rows"""
+        graph = self.graph[level]
+        visited = set(entry_points)
+        sims = (vectors[entry_points] @ query).tolist()
+        candidates = [(-s, n) for s, n in zip(sims, entry_points)]
+        heapq.heapify(candidates)
+        results: List[Tuple[float, int]] = []
+        for s, n in zip(sims, entry_points):
+            if allowed is None or allowed[n]:
+                heapq.heappush(results, (s, n))
+                if len(results) > ef:
+                    heapq.heappop(results)
+
+        while candidates:
+            neg_sim, node = heapq.heappop(candidates)
+            if len(results) >= ef and -neg_sim < results[0][0]:
+                break
+            neighbors = [n for n in graph.get(node, ()) if n not in visited]
+            if not neighbors:
+                continue
+            visited.update(neighbors)
+            # One product for all the neighbors of the node
+            for s, n in zip((vectors[neighbors] @ query).tolist(), neighbors):
+                if len(results) < ef or s > results[0][0]:
+                    heapq.heappush(candidates, (-s, n))
+                    if allowed is None or allowed[n]:
+                        heapq.heappush(results, (s, n))
+                        if len(results) > ef:
+                            heapq.heappop(results)
+        return results
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int,
+        vectors: np.ndarray,
+        allowed: Optional[np.ndarray] = None,
+        ef: Optional[int] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Approximate top-k by inner product
+
+        Args:
+            query (np.ndarray): The query vector.
+            k (int): The number of hits.
+            vectors (np.ndarray): The matrix the rows index into.
+            allowed (np.ndarray, optional): Mask of the rows that may be returned.
+            ef (int, optional): Size of the candidate list, defaults to self.ef and is at least k.
+
+        Returns:
+            The rows and similarities of the hits, best first.
+        """
+        if self.entry_point is None or k <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        ef = max(ef or self.ef, k)
+
+        entry_points = [self.entry_point]
+        for lc in range(self.max_level, 0, -1):
+            nearest = self._search_layer(query, entry_points, 1, lc, vectors)
+            entry_points = [max(nearest)[1]]
+        found = heapq.nlargest(
+            k, self._search_layer(query, entry_points, ef, 0, vectors, allowed)
+        )
+        return (
+            np.asarray([n for _, n in found], dtype=np.int64),
+            np.asarray([s for s, _ in found], dtype=np.float32),
+        )
+
+    def save(self, path: str, vectors: np.ndarray, rows: Optional[np.ndarray] = None):
+        """Save the graph to an .npz file
+
+        Rows left out are dropped from the graph, the links that went through them
+        are replaced by links to their neighbors so the graph stays connected.
+
+        Args:
+            path (str): The file to write.
+            vectors (np.ndarray): The matrix the rows index into.
+            rows (np.ndarray, optional): The rows to keep, renumbered in this order; defaults to all of them.
+        """
+        if rows is None:
+            rows = np.asarray(sorted(self.levels), dtype=np.int64)
+        renumber = {int(row): i for i, row in enumerate(rows)}
+        arrays = {
+            "levels": np.asarray([self.levels[int(r)] for r in rows], dtype=np.int32),
+        }
+        # Each layer is stored as CSR: the nodes, their neighbor offsets and the neighbors
+        for lc, layer in enumerate(self.graph):
+            max_neighbors = self.M0 if lc == 0 else self.M
+            nodes = [n for n in layer if n in renumber]
+            neighbors = []
+            for node in nodes:
+                links = self._repair(node, layer, renumber)
+                if len(links) > max_neighbors:
+                    links = self._select_neighbors(
+                        vectors[node], links, max_neighbors, vectors
+                    )
+                neighbors.append([renumber[m] for m in links])
+            arrays[f"nodes{lc}"] = np.asarray([renumber[n] for n in nodes], dtype=np.int64)
+            arrays[f"offsets{lc}"] = np.cumsum([0] + [len(m) for m in neighbors])
+            arrays[f"neighbors{lc}"] = np.asarray(
+                [m for links in neighbors for m in links], dtype=np.int64
+            )
+        entry_point = self.entry_point if self.entry_point in renumber else None
+        if entry_point is None and len(rows):
+            # The entry point was dropped, restart from the highest remaining node
+            entry_point = int(rows[int(np.argmax(arrays["levels"]))])
+        arrays["meta"] = np.asarray(
+            [
+                self.M,
+                self.ef_construction,
+                self.ef,
+                len(self.graph),
+                -1 if entry_point is None else renumber[entry_point],
+            ],
+            dtype=np.int64,
+        )
+        np.savez(path, **arrays)
+
+    def _repair(
+        self, node: int, layer: Dict[int, List[int]], kept: Dict[int, int]
+    ) -> List[int]:
+        """The kept neighbors of node, with the kept neighbors of its dropped ones in their place"""
+        links: List[int] = []
+        for neighbor in layer[node]:
+            through = [neighbor] if neighbor in kept else layer.get(neighbor, ())
+            for m in through:
+                if m in kept and m != node and m not in links:
+                    links.append(m)
+        return links
+
+    @classmethod
+    def load(cls, path: str) -> "HNSWIndex":
+        data = np.load(path)
+        M, ef_construction, ef, layers, entry_point = (int(v) for v in data["meta"])
+        index = cls(M=M, ef_construction=ef_construction, ef=ef)
+        index.levels = {i: int(level) for i, level in enumerate(data["levels"])}
+        for lc in range(layers):
+            nodes, offsets = data[f"nodes{lc}"], data[f"offsets{lc}"]
+            neighbors = data[f"neighbors{lc}"].tolist()
+            index.graph.append(
+                {
+                    int(node): neighbors[offsets[i] : offsets[i + 1]]
+                    for i, node in enumerate(nodes)
+                }
+            )
+        if entry_point >= 0:
+            index.entry_point = entry_point
+            index.max_level = index.levels[entry_point]
+        return index
+
+
+def recall_at_k(approximate: List[np.ndarray], exact: List[np.ndarray]) -> float:
+    """Average fraction of the exact top-k rows found by the approximate search"""
+    recalls = [
+        len(set(a.tolist()) & set(e.tolist())) / len(e)
+        for a, e in zip(approximate, exact)
+        if len(e)
+    ]
+    return float(np.mean(recalls)) if recalls else 1.0
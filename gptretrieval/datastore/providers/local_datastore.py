@@ -0,0 +1,632 @@
+import asyncio
+import json
+import os
+import threading
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+from ...models.models import (
+    DocumentChunkMetadata,
+    DocumentChunkWithScore,
+    DocumentMetadataFilter,
+    QueryResult,
+    QueryWithEmbedding,
+    SearchOptions,
+    Source,
+)
+from ...datastore.datastore import DataStore
+from ...services.embedders import Embedder
+from ...datastore.filters import canonical_filter, compile_predicate
+from ...services.quantization import (
+    Quantizer,
+    load_quantizer,
+    make_quantizer,
+    rerank,
+    top_k_indices,
+)
+from ...datastore.tuning import (
+    SEARCH_TUNING_PATH,
+    TUNED_PARAMS,
+    SearchTuningStore,
+    tune_search_param,
+)
+from .hnsw_index import HNSWIndex, recall_at_k
+
+OUTPUT_DIM = int(os.environ.get("OUTPUT_DIM") or 1536)
+EMBEDDING_FIELD = "embedding"
+# The metadata fields stored with every vector, as in the Milvus schema
+FIELDS = ["text", "document_id", "source_id", "id", "source", "url", "created_at", "author"]
+DEFAULT_PARTITION = "_default"
+
+
+class LocalDataStore(DataStore):
+    def __init__(
+        self,
+        output_dim: int = OUTPUT_DIM,
+        path: Optional[str] = os.environ.get("LOCAL_DATASTORE_PATH"),
+        use_arrays: bool = False,
+        query_cache_size: int = int(os.environ.get("LOCAL_QUERY_CACHE_SIZE") or 0),
+        query_cache_ttl: float = float(os.environ.get("LOCAL_QUERY_CACHE_TTL") or 60),
+        index_type: str = os.environ.get("LOCAL_INDEX_TYPE") or "FLAT",
+        index_params: Optional[Dict] = None,
+        search_params: Optional[Dict] = None,
+        quantization: Optional[str] = os.environ.get("LOCAL_QUANTIZATION"),
+        pq_subvectors: Optional[int] = None,
+        rerank_factor: int = int(os.environ.get("LOCAL_RERANK_FACTOR") or 4),
+        keep_vectors: bool = True,
+        quantization_train_size: int = int(
+            os.environ.get("LOCAL_QUANTIZATION_TRAIN_SIZE") or 10000
+        ),
+        search_tuning_path: str = SEARCH_TUNING_PATH,
+        embedder: Union[str, Embedder, None] = os.environ.get("EMBEDDER"),
+    ):
+        """Create an in-process DataStore
+
+        Vectors are held in a float32 matrix and searched by inner product, with the
+        same filter and partition semantics as the Milvus datastores. Meant for tests,
+        benchmarks and small corpora that do not warrant running Milvus.
+
+        Args:
+            output_dim (int, optional): The dimension of the embeddings.
+            path (str, optional): A directory saved with save(), loaded memory mapped if it exists.
+            use_arrays (bool, optional): Keep query embeddings as float32 numpy rows instead of lists of floats.
+            query_cache_size (int, optional): Number of query results to cache, 0 disables the cache.
+            query_cache_ttl (float, optional): Seconds a cached query result stays valid.
+            index_type (str, optional): "FLAT" for exact search or "HNSW" for an approximate graph index.
+            index_params (Dict, optional): HNSW build parameters, defaults to those of the Milvus index.
+            search_params (Dict, optional): HNSW search parameters, defaults to those of the Milvus index.
+            quantization (str, optional): "SQ8" or "PQ" to search compressed codes, FLAT index only.
+            pq_subvectors (int, optional): Number of PQ subvectors, defaults to output_dim // 4.
+            rerank_factor (int, optional): Quantized hits re-scored with the float32 vectors, as a multiple of top_k, 0 disables it.
+            keep_vectors (bool, optional): Keep the float32 vectors once the quantizer is trained, False only keeps the codes.
+            quantization_train_size (int, optional): Rows inserted before the quantizer is trained automatically.
+            search_tuning_path (str, optional): JSON file of the search parameters chosen by tune_search_params.
+            embedder (Union[str, Embedder], optional): The embedding backend, see services.embedders, defaults to EMBEDDER. Its dimension must be output_dim.
+        """
+        self.output_dim = output_dim
+        # The default backend is checked too, a mismatch would only fail inside insert or search
+        self.set_embedder(embedder, output_dim)
+        self.path = path
+        self.use_arrays = use_arrays
+        if query_cache_size > 0:
+            self.enable_query_cache(max_entries=query_cache_size, ttl=query_cache_ttl)
+
+        self.index_type = index_type.upper()
+        self.index_params = index_params or {"M": 8, "efConstruction": 64}
+        self.search_params = search_params or {"ef": 10}
+        if self.index_type not in ("FLAT", "HNSW"):
+            raise ValueError(f"Unsupported index type: {index_type}")
+        self._index = self._new_index()
+
+        if quantization and self._index is not None:
+            raise ValueError("Quantization is only supported with the FLAT index")
+        self._quantizer: Optional[Quantizer] = (
+            make_quantizer(quantization, output_dim, pq_subvectors) if quantization else None
+        )
+        self.rerank_factor = rerank_factor
+        self.keep_vectors = keep_vectors
+        self.quantization_train_size = quantization_train_size
+        # The codes of every row, allocated once the quantizer is trained
+        self._codes: Optional[np.ndarray] = None
+
+        self._vectors = np.empty((0, output_dim), dtype=np.float32)
+        self._count = 0
+        self._rows: List[Dict] = []
+        self._alive = np.empty(0, dtype=bool)
+        self._row_partitions = np.empty(0, dtype=np.int32)
+        self._partitions: Dict[str, int] = {}
+        self._ids: Dict[str, int] = {}
+        self._lock = threading.RLock()
+
+        if path and os.path.exists(os.path.join(path, "rows.jsonl")):
+            self.load(path)
+
+        self.search_tuning = SearchTuningStore(search_tuning_path)
+        self._apply_search_params(
+            self.search_tuning.overrides(self._collection_name(), self._index_name())
+        )
+
+    def get_count(self) -> int:
+        return int(self._alive[: self._count].sum())
+
+    def insert(self, chunks, batch_size=None, partition: str = None):
+        """inserts chunks, in the format taken by MilvusSrcDataStore.insert
+
+        Chunks without an embedding are embedded from their text. A chunk whose id
+        already exists replaces it.
+        """
+        if isinstance(chunks, dict):
+            chunks = [chunks]
+        if not chunks:
+            return
+
+        missing = [chunk for chunk in chunks if chunk.get(EMBEDDING_FIELD) is None]
+        if missing:
+            embeddings = self.get_embeddings(
+                [chunk["text"] for chunk in missing], as_array=True
+            )
+            for chunk, embedding in zip(missing, embeddings):
+                chunk[EMBEDDING_FIELD] = embedding
+
+        vectors = np.asarray(
+            [np.asarray(chunk[EMBEDDING_FIELD], dtype=np.float32) for chunk in chunks]
+        )
+        if vectors.shape[1] != self.output_dim:
+            raise ValueError(
+                f"Embedding dimension {vectors.shape[1]} does not match output_dim {self.output_dim}"
+            )
+
+        with self._lock:
+            partition_id = self._partition_id(partition or DEFAULT_PARTITION)
+            start = self._count
+            self._reserve(start + len(chunks))
+            if self._stores_vectors:
+                self._vectors[start : start + len(chunks)] = vectors
+            if self._codes is not None:
+                self._codes[start : start + len(chunks)] = self._quantizer.encode(vectors)
+            self._row_partitions[start : start + len(chunks)] = partition_id
+            self._alive[start : start + len(chunks)] = True
+            for row, chunk in enumerate(chunks, start):
+                metadata = {field: chunk.get(field) for field in FIELDS}
+                # Upsert, the previous row with the same id is no longer visible
+                previous = self._ids.get(metadata["id"])
+                if previous is not None:
+                    self._alive[previous] = False
+                if metadata["id"] is not None:
+                    self._ids[metadata["id"]] = row
+                self._rows.append(metadata)
+            self._count += len(chunks)
+            self._on_insert(start, self._count)
+            if (
+                self._quantizer is not None
+                and self._codes is None
+                and self._count >= self.quantization_train_size
+            ):
+                self.train_quantizer()
+
+        self._invalidate_query_cache(partition)
+
+    def delete(
+        self,
+        ids: Optional[List[str]] = None,
+        filter: Optional[DocumentMetadataFilter] = None,
+        delete_all: Optional[bool] = False,
+        partition: str = None,
+    ) -> bool:
+        """Delete chunks by id, by filter or all of them, optionally only within a partition"""
+        partitions = [partition] if partition else None
+        with self._lock:
+            if delete_all:
+                mask = self._candidates(None, partitions)
+            elif ids:
+                mask = self._candidates(None, partitions)
+                selected = np.zeros(self._count, dtype=bool)
+                selected[[self._ids[i] for i in ids if i in self._ids]] = True
+                mask &= selected
+            elif filter is not None:
+                mask = self._candidates(filter, partitions)
+            else:
+                return False
+            self._alive[: self._count] &= ~mask
+            self._on_delete(np.flatnonzero(mask))
+
+        self._invalidate_query_cache(partition)
+        return True
+
+    async def _query(
+        self,
+        queries: List[QueryWithEmbedding],
+        top_k: int = None,
+        partitions: List[str] = None,
+        options: Optional[SearchOptions] = None,
+    ) -> List[QueryResult]:
+        """Run the search on the default executor, NumPy releases the GIL while it multiplies"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, self._query_synch, queries, top_k, partitions, options
+        )
+
+    def _query_synch(
+        self,
+        queries: List[QueryWithEmbedding],
+        top_k: int = None,
+        partitions: List[str] = None,
+        options: Optional[SearchOptions] = None,
+    ) -> List[QueryResult]:
+        """Search the queries, one matrix product per group of queries sharing a filter and top_k
+
+        Args:
+            queries (List[QueryWithEmbedding]): The list of searches to perform.
+            options (SearchOptions, optional): Only ef and output_fields apply to the local datastore.
+
+        Returns:
+            List[QueryResult]: Results for each search.
+        """
+        ef = options.ef if options is not None else None
+        output_fields = options.output_fields if options is not None else None
+        if partitions is not None and "all" in partitions:
+            partitions = None
+
+        # Queries with the same filter and top_k share one candidate mask and matrix product
+        groups: Dict[Tuple, List[int]] = {}
+        for i, query in enumerate(queries):
+            top_k_ = query.top_k if top_k is None else top_k
+            filter = canonical_filter(query.filter) if query.filter is not None else None
+            groups.setdefault((filter, top_k_), []).append(i)
+
+        hits: List[List[DocumentChunkWithScore]] = [[] for _ in queries]
+        with self._lock:
+            for (_, top_k_), indexes in groups.items():
+                try:
+                    filter = queries[indexes[0]].filter
+                    mask = self._candidates(filter, partitions)
+                    matrix = np.asarray(
+                        [np.asarray(queries[i].embedding, dtype=np.float32) for i in indexes]
+                    )
+                    rows, scores = self._search_rows(matrix, mask, top_k_, ef=ef)
+                    for i, query_rows, query_scores in zip(indexes, rows, scores):
+                        hits[i] = [
+                            self._row_to_chunk(row, score, output_fields)
+                            for row, score in zip(query_rows, query_scores)
+                        ]
+                except Exception as e:
+                    print(f"Failed to query, error: {e}")
+
+        return [
+            QueryResult(query=query.query, results=results)
+            for query, results in zip(queries, hits)
+        ]
+
+    def _search_rows(
+        self,
+        queries: np.ndarray,
+        mask: np.ndarray,
+        top_k: int,
+        ef: Optional[int] = None,
+        rerank_factor: Optional[int] = None,
+    ) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+        """Top-k over the rows in mask, through the index or the quantized codes if there are any
+
+        Returns:
+            The row indexes and scores of the hits of each query, best first.
+        """
+        if self._codes is not None:
+            return self._quantized_search_rows(queries, mask, top_k, rerank_factor)
+        if self._index is None:
+            return self._exact_search_rows(queries, mask, top_k)
+        ef = max(ef or self.search_params["ef"], top_k)
+        # A selective filter leaves few candidates, scanning them beats walking the graph
+        if int(mask.sum()) <= 4 * ef:
+            return self._exact_search_rows(queries, mask, top_k)
+        rows, scores = [], []
+        for query in queries:
+            query_rows, query_scores = self._index.search(
+                query, top_k, self._vectors, allowed=mask, ef=ef
+            )
+            rows.append(query_rows)
+            scores.append(query_scores)
+        return rows, scores
+
+    def _exact_search_rows(
+        self, queries: np.ndarray, mask: np.ndarray, top_k: int
+    ) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+        """Exact inner product top-k over the rows in mask
+
+        Returns:
+            The row indexes and scores of the hits of each query, best first.
+        """
+        candidates = np.flatnonzero(mask)
+        if len(candidates) == 0 or top_k <= 0:
+            empty = np.empty(0, dtype=np.int64)
+            return [empty] * len(queries), [np.empty(0, dtype=np.float32)] * len(queries)
+
+        if 2 * len(candidates) < self._count:
+            # A selective filter: gathering the few candidate rows is cheaper than scoring all
+            scores = queries @ self._vectors[candidates].T
+        else:
+            # Score the stored rows in place rather than copying most of the matrix,
+            # the rows outside the mask can never make the top k
+            scores = queries @ self._vectors[: self._count].T
+            if len(candidates) < self._count:
+                scores[:, ~mask] = -np.inf
+            top_k = min(top_k, len(candidates))
+            candidates = np.arange(self._count)
+        # argpartition finds the k best in linear time, only those get sorted
+        top = top_k_indices(scores, top_k)
+        return list(candidates[top]), list(np.take_along_axis(scores, top, axis=1))
+
+    def _quantized_search_rows(
+        self,
+        queries: np.ndarray,
+        mask: np.ndarray,
+        top_k: int,
+        rerank_factor: Optional[int] = None,
+    ) -> Tuple[List[np.ndarray], List[np.ndarray]]:
+        """ADC top-k over the codes of the rows in mask, re-ranked with the float32 vectors if kept
+
+        Returns:
+            The row indexes and scores of the hits of each query, best first.
+        """
+        candidates = np.flatnonzero(mask)
+        if len(candidates) == 0 or top_k <= 0:
+            empty = np.empty(0, dtype=np.int64)
+            return [empty] * len(queries), [np.empty(0, dtype=np.float32)] * len(queries)
+
+        # Without a filter every row is a candidate, skip copying the codes
+        if len(candidates) == self._count:
+            codes = self._codes[: self._count]
+        else:
+            codes = self._codes[candidates]
+        scores = self._quantizer.scores(queries, codes)
+
+        rerank_factor = self.rerank_factor if rerank_factor is None else rerank_factor
+        if rerank_factor > 0 and self._stores_vectors:
+            top = top_k_indices(scores, top_k * rerank_factor)
+            rows, top_scores = rerank(queries, candidates[top], self._vectors, top_k)
+            return list(rows), list(top_scores)
+        top = top_k_indices(scores, top_k)
+        return list(candidates[top]), list(np.take_along_axis(scores, top, axis=1))
+
+    def _candidates(
+        self, filter: Optional[DocumentMetadataFilter], partitions: Optional[List[str]]
+    ) -> np.ndarray:
+        """Mask of the live rows in the partitions that pass the filter"""
+        mask = self._alive[: self._count].copy()
+        if partitions is not None:
+            ids = [self._partitions[p] for p in partitions if p in self._partitions]
+            mask &= np.isin(self._row_partitions[: self._count], ids)
+        if filter is not None:
+            predicate = compile_predicate(filter)
+            for row in np.flatnonzero(mask):
+                if not predicate(self._rows[row]):
+                    mask[row] = False
+        return mask
+
+    def _row_to_chunk(
+        self, row: int, score: float, output_fields: Optional[List[str]] = None
+    ) -> DocumentChunkWithScore:
+        metadata = dict(self._rows[row])
+        ids = metadata.pop("id")
+        if output_fields is not None:
+            metadata = {field: metadata.get(field) for field in output_fields}
+        # If the source isn't valid, convert to None
+        if metadata.get("source") not in Source.__members__:
+            metadata["source"] = None
+        text = metadata.pop("text", None) or ""
+        return DocumentChunkWithScore(
+            id=ids,
+            score=float(score),
+            text=text,
+            metadata=DocumentChunkMetadata(**metadata),
+        )
+
+    def _partition_id(self, partition: str) -> int:
+        if partition not in self._partitions:
+            self._partitions[partition] = len(self._partitions)
+        return self._partitions[partition]
+
+    @property
+    def _stores_vectors(self) -> bool:
+        """Whether the float32 vectors are kept, they are dropped once quantized unless keep_vectors"""
+        return self.keep_vectors or self._codes is None
+
+    def _reserve(self, rows: int):
+        """Grow the storage, doubling its capacity, so inserts are amortized O(1)"""
+        capacity = len(self._alive)
+        if rows <= capacity:
+            return
+        capacity = max(rows, 2 * capacity, 1024)
+        if self._stores_vectors:
+            vectors = np.empty((capacity, self.output_dim), dtype=np.float32)
+            vectors[: self._count] = self._vectors[: self._count]
+            self._vectors = vectors
+        if self._codes is not None:
+            codes = np.zeros((capacity, self._quantizer.code_size), dtype=np.uint8)
+            codes[: self._count] = self._codes[: self._count]
+            self._codes = codes
+        self._alive = np.concatenate(
+            [self._alive[: self._count], np.zeros(capacity - self._count, dtype=bool)]
+        )
+        self._row_partitions = np.concatenate(
+            [
+                self._row_partitions[: self._count],
+                np.zeros(capacity - self._count, dtype=np.int32),
+            ]
+        )
+
+    def _new_index(self) -> Optional[HNSWIndex]:
+        if self.index_type != "HNSW":
+            return None
+        return HNSWIndex(
+            M=self.index_params["M"],
+            ef_construction=self.index_params["efConstruction"],
+            ef=self.search_params["ef"],
+        )
+
+    def _on_insert(self, start: int, end: int):
+        """Called with the rows [start, end) after an insert, links them into the index"""
+        if self._index is not None:
+            self._index.add(range(start, end), self._vectors)
+
+    def _on_delete(self, rows: np.ndarray):
+        """Called with the rows just deleted
+
+        The index keeps deleted rows as graph nodes so searches can still route
+        through them, the live mask keeps them out of results. save() drops them.
+        """
+
+    def train_quantizer(self):
+        """Train the quantizer on the live vectors and encode every row
+
+        Called automatically once quantization_train_size rows are inserted. Unless
+        keep_vectors, the float32 vectors are dropped afterwards.
+        """
+        if self._quantizer is None:
+            raise ValueError("The datastore was created without quantization")
+        with self._lock:
+            if not self._stores_vectors:
+                raise ValueError(
+                    "The float32 vectors were dropped, the quantizer cannot be retrained"
+                )
+            live = np.flatnonzero(self._alive[: self._count])
+            if len(live) == 0:
+                raise ValueError("There are no vectors to train the quantizer on")
+            self._quantizer.train(self._vectors[live])
+            codes = np.zeros((len(self._alive), self._quantizer.code_size), dtype=np.uint8)
+            # Encode in slices to bound the temporaries
+            for start in range(0, self._count, 65536):
+                end = min(start + 65536, self._count)
+                codes[start:end] = self._quantizer.encode(self._vectors[start:end])
+            self._codes = codes
+            if not self.keep_vectors:
+                self._vectors = np.empty((0, self.output_dim), dtype=np.float32)
+        self._invalidate_query_cache()
+
+    def _collection_name(self) -> str:
+        return self.path or "local"
+
+    def _index_name(self) -> str:
+        """The index searched, "HNSW", the quantization "SQ8" or "PQ", or "FLAT" """
+        if self._index is not None:
+            return "HNSW"
+        if self._quantizer is not None:
+            return self._quantizer.kind
+        return "FLAT"
+
+    def _apply_search_params(self, params: Dict[str, int]):
+        if "ef" in params:
+            # Replaced rather than updated, a query running meanwhile keeps a consistent dict
+            self.search_params = {**self.search_params, "ef": params["ef"]}
+        if "rerank_factor" in params:
+            self.rerank_factor = params["rerank_factor"]
+
+    def tune_search_params(
+        self,
+        queries: np.ndarray,
+        target_recall: float = 0.95,
+        top_k: int = 10,
+        candidates: Optional[List[int]] = None,
+        save: bool = True,
+    ) -> Dict:
+        """Pick the cheapest HNSW ef, or quantized rerank_factor, reaching target_recall on sample queries
+
+        Args:
+            queries (np.ndarray): Representative query vectors, one per row.
+            target_recall (float, optional): The recall@top_k to reach against exact search.
+            top_k (int, optional): The number of hits compared.
+            candidates (List[int], optional): The values to try, see tuning.DEFAULT_CANDIDATES.
+            save (bool, optional): Persist and apply the chosen value.
+
+        Returns:
+            Dict: The chosen value, its recall and latency, and every measurement.
+        """
+        param = TUNED_PARAMS.get(self._index_name())
+        if param is None:
+            raise ValueError("The FLAT index is exact, it has no search parameter to tune")
+        queries = np.asarray(queries, dtype=np.float32)
+        with self._lock:
+            if not self._stores_vectors:
+                raise ValueError("The float32 vectors were dropped, recall cannot be measured")
+            mask = self._alive[: self._count].copy()
+            exact, _ = self._exact_search_rows(queries, mask, top_k)
+
+        def search(value: int) -> List[List[int]]:
+            with self._lock:
+                rows, _ = self._search_rows(queries, mask, top_k, **{param: value})
+            return [r.tolist() for r in rows]
+
+        result = tune_search_param(
+            search, [r.tolist() for r in exact], param, target_recall, candidates
+        )
+        if save:
+            self.search_tuning.put(self._collection_name(), self._index_name(), result)
+            self._apply_search_params({param: result["value"]})
+            self._invalidate_query_cache()
+        return result
+
+    def measure_recall(
+        self,
+        queries: np.ndarray,
+        top_k: int = 10,
+        ef: Optional[int] = None,
+        rerank_factor: Optional[int] = None,
+    ) -> float:
+        """Recall@top_k of the index or quantized search against exact float32 search over every live row
+
+        Args:
+            queries (np.ndarray): The query vectors, one per row.
+            top_k (int, optional): The number of hits compared.
+            ef (int, optional): The HNSW ef to measure, defaults to search_params["ef"].
+            rerank_factor (int, optional): The re-ranking factor to measure, defaults to rerank_factor.
+
+        Returns:
+            float: The average fraction of the exact hits the search returned.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        with self._lock:
+            if not self._stores_vectors:
+                raise ValueError("The float32 vectors were dropped, recall cannot be measured")
+            mask = self._alive[: self._count].copy()
+            exact, _ = self._exact_search_rows(queries, mask, top_k)
+            approximate, _ = self._search_rows(
+                queries, mask, top_k, ef=ef, rerank_factor=rerank_factor
+            )
+        return recall_at_k(approximate, exact)
+
+    def save(self, path: Optional[str] = None):
+        """Save the live rows to a directory, compacting deleted ones away"""
+        path = path or self.path
+        os.makedirs(path, exist_ok=True)
+        with self._lock:
+            live = np.flatnonzero(self._alive[: self._count])
+            names = {i: name for name, i in self._partitions.items()}
+            if self._stores_vectors:
+                np.save(os.path.join(path, "vectors.npy"), self._vectors[live])
+            if self._codes is not None:
+                np.save(os.path.join(path, "codes.npy"), self._codes[live])
+                self._quantizer.save(os.path.join(path, "quantizer.npz"))
+            with open(os.path.join(path, "rows.jsonl"), "w") as f:
+                for row in live:
+                    record = dict(self._rows[row])
+                    record["partition"] = names[int(self._row_partitions[row])]
+                    f.write(json.dumps(record) + "\n")
+            if self._index is not None:
+                self._index.save(os.path.join(path, "hnsw.npz"), self._vectors, rows=live)
+
+    def load(self, path: str):
+        """Load a directory written by save(), the vectors stay memory mapped until the next insert"""
+        with self._lock:
+            if os.path.exists(os.path.join(path, "quantizer.npz")):
+                self._quantizer = load_quantizer(os.path.join(path, "quantizer.npz"))
+                self._codes = np.load(os.path.join(path, "codes.npy"), mmap_mode="r")
+            if os.path.exists(os.path.join(path, "vectors.npy")):
+                self._vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+            else:
+                # Saved without its float32 vectors, only the codes can be searched
+                self.keep_vectors = False
+            dim = self._vectors.shape[1] if self._stores_vectors else self._quantizer.dim
+            if dim != self.output_dim:
+                raise ValueError(
+                    f"Stored dimension {dim} does not match output_dim {self.output_dim}"
+                )
+            self._rows, partitions = [], []
+            with open(os.path.join(path, "rows.jsonl")) as f:
+                for line in f:
+                    record = json.loads(line)
+                    partitions.append(self._partition_id(record.pop("partition")))
+                    self._rows.append(record)
+            self._count = len(self._rows)
+            self._alive = np.ones(self._count, dtype=bool)
+            self._row_partitions = np.asarray(partitions, dtype=np.int32)
+            self._ids = {
+                row["id"]: i for i, row in enumerate(self._rows) if row["id"] is not None
+            }
+            graph = os.path.join(path, "hnsw.npz")
+            if self._index is not None and os.path.exists(graph):
+                # Reuse the saved graph, with the ef asked for rather than the saved one
+                self._index = HNSWIndex.load(graph)
+                self._index.ef = self.search_params["ef"]
+            else:
+                self._index = self._new_index()
+                self._on_insert(0, self._count)
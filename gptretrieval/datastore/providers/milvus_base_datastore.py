@@ -1,5 +1,7 @@
 import asyncio
+import json
 import os
+import threading
 from uuid import uuid4
 
 MILVUS_COLLECTION = os.environ.get("MILVUS_COLLECTION") or "c" + uuid4().hex
@@ -14,10 +16,14 @@ MILVUS_SEARCH_PARAMS = os.environ.get("MILVUS_SEARCH_PARAMS")
 MILVUS_CONSISTENCY_LEVEL = os.environ.get("MILVUS_CONSISTENCY_LEVEL")
 
 UPSERT_BATCH_SIZE = 20
+# Maximum number of vectors sent in a single search call
+MAX_SEARCH_NQ = 256
 OUTPUT_DIM = 1536
 EMBEDDING_FIELD = "embedding"
 
-from typing import Dict, List, Optional
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Set, Tuple, Union
 from pymilvus import (
     Collection,
     connections,
@@ -35,10 +41,21 @@ from ...models.models import (
     DocumentChunkWithScore,
     DocumentChunkMetadata,
     Source,
+    SearchOptions,
 )
 
 from ...datastore.datastore import DataStore
-from ...services.date import to_unix_timestamp
+from ...services.embedders import Embedder
+from .milvus_connection_pool import MilvusConnectionPool
+from ...datastore.filters import compile_filter, quote
+from ...datastore.tuning import (
+    SEARCH_TUNING_PATH,
+    TUNED_PARAMS,
+    SearchTuningStore,
+    exact_top_k_ids,
+    merge_search_params,
+    tune_search_param,
+)
 
 
 class Required:
@@ -108,6 +125,15 @@ class MilvusDataStore(DataStore):
         milvus_index_params: Optional[str] = os.environ.get("MILVUS_INDEX_PARAMS"),
         milvus_search_params: Optional[str] = os.environ.get("MILVUS_SEARCH_PARAMS"),
         upsert_batch_size: int = 20,
+        query_concurrency: int = int(os.environ.get("MILVUS_QUERY_CONCURRENCY") or 8),
+        use_arrays: bool = False,
+        pool_size: int = int(os.environ.get("MILVUS_POOL_SIZE") or 1),
+        pool_routing: str = os.environ.get("MILVUS_POOL_ROUTING") or "round_robin",
+        milvus_replicas: Optional[str] = os.environ.get("MILVUS_REPLICAS"),
+        query_cache_size: int = int(os.environ.get("MILVUS_QUERY_CACHE_SIZE") or 0),
+        query_cache_ttl: float = float(os.environ.get("MILVUS_QUERY_CACHE_TTL") or 60),
+        search_tuning_path: str = SEARCH_TUNING_PATH,
+        embedder: Union[str, Embedder, None] = os.environ.get("EMBEDDER"),
         output_dim: int = int(os.environ.get("OUTPUT_DIM") or 1536),
         embedding_field: str = "embedding",
         schema: List = SCHEMA_V2,
@@ -120,6 +146,15 @@ class MilvusDataStore(DataStore):
             create_new (Optional[bool], optional): Whether to overwrite if collection already exists. Defaults to True.
             consistency_level(str, optional): Specify the collection consistency level.
                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                                         Set to "Strong" in test cases for result validation.
+            query_concurrency (int, optional): Maximum number of Milvus searches running at once for the async query path.
+            use_arrays (bool, optional): Keep query embeddings as float32 numpy rows instead of lists of floats.
+            pool_size (int, optional): Number of connections per Milvus endpoint used for searches and inserts.
+            pool_routing (str, optional): How calls are spread over the pool, "round_robin" or "least_outstanding".
+            milvus_replicas (str, optional): Comma separated host:port list of extra endpoints used for searches.
+            query_cache_size (int, optional): Number of query results to cache, 0 disables the cache.
+            query_cache_ttl (float, optional): Seconds a cached query result stays valid.
+            search_tuning_path (str, optional): JSON file of the search parameters chosen by tune_search_params.
+            embedder (Union[str, Embedder], optional): The embedding backend, see services.embedders, defaults to EMBEDDER. Its dimension must be output_dim.
         """
         self.create_new = create_new
         self.consistency_level = consistency_level
@@ -135,13 +170,42 @@ class MilvusDataStore(DataStore):
         self.milvus_index_params = milvus_index_params
         self.milvus_search_params = milvus_search_params
         self.upsert_batch_size = upsert_batch_size
+        self.query_concurrency = query_concurrency
+        self.use_arrays = use_arrays
+        if query_cache_size > 0:
+            self.enable_query_cache(max_entries=query_cache_size, ttl=query_cache_ttl)
+        self.pool_size = pool_size
+        self.pool_routing = pool_routing
+        self.milvus_replicas = [
+            (host, int(port))
+            for host, port in (
+                replica.strip().rsplit(":", 1)
+                for replica in (milvus_replicas or "").split(",")
+                if replica.strip()
+            )
+        ]
         self.output_dim = output_dim
         self.embedding_field = embedding_field
+        # The default backend is checked too, a mismatch would only fail inside insert or search
+        self.set_embedder(embedder, output_dim)
 
         self.index_params = milvus_index_params
         self.search_params = milvus_search_params
+        # Applied on top of search_params to every search, see _request_search_params
+        self.search_param_overrides: Dict = {}
+        self.search_tuning = SearchTuningStore(search_tuning_path)
         self.col = None
         self.alias = ""
+        self._pool: Optional[MilvusConnectionPool] = None
+        # Collection handles bound to each pooled alias
+        self._collections: Dict[str, Collection] = {}
+        # Names of the partitions known to exist in the collection, see _ensure_partition
+        self._partitions: Set[str] = set()
+        self._partition_lock = threading.Lock()
+        # Blocking Milvus calls made from the async path run here, bounded by query_concurrency
+        self._executor = ThreadPoolExecutor(
+            max_workers=query_concurrency, thread_name_prefix="milvus-search"
+        )
         self.schema = schema
         # Adjust schema based on output_dim
         schema[0] = (
@@ -159,6 +223,28 @@ class MilvusDataStore(DataStore):
         self._create_connection()
         self._create_collection(self.milvus_collection, self.create_new)  # type: ignore
         self._create_index()
+        self._load_partitions()
+        self._load_tuned_params()
+
+    def _load_partitions(self):
+        """Load the names of the existing partitions into the partition registry"""
+        try:
+            with self._partition_lock:
+                self._partitions = {p.name for p in self.col.partitions}
+        except Exception as e:
+            print(f"Failed to list partitions, error: {e}")
+
+    def _ensure_partition(self, partition: str):
+        """Create the partition unless the registry already knows it exists"""
+        if partition in self._partitions:
+            return
+        with self._partition_lock:
+            # Another insert may have created it while we waited
+            if partition in self._partitions:
+                return
+            if not self.col.has_partition(partition):
+                self.col.create_partition(partition_name=partition)
+            self._partitions.add(partition)
 
     def _get_schema(self):
         """Get the schema for the Milvus collection"""
@@ -168,11 +254,51 @@ class MilvusDataStore(DataStore):
         """inserts data into the milvus collection"""
         pass
 
+    def delete(
+        self,
+        ids: Optional[List[str]] = None,
+        filter: Optional[DocumentMetadataFilter] = None,
+        delete_all: Optional[bool] = False,
+        partition: str = None,
+    ) -> bool:
+        """Delete chunks by id, by filter or all of them
+
+        Args:
+            ids (Optional[List[str]], optional): The ids of the chunks to delete.
+            filter (Optional[DocumentMetadataFilter], optional): Delete the chunks matching the filter.
+            delete_all (Optional[bool], optional): Delete every chunk.
+            partition (str, optional): Only delete within this partition.
+
+        Returns:
+            bool: Whether the delete succeeded.
+        """
+        if delete_all:
+            expr = 'id != ""'
+        elif ids:
+            expr = "id in [" + ", ".join(quote(i) for i in ids) + "]"
+        elif filter is not None:
+            expr = compile_filter(filter)
+        else:
+            expr = None
+        if not expr:
+            return False
+
+        try:
+            with self._collection(read_only=False) as col:
+                col.delete(expr, partition_name=partition)
+            return True
+        except Exception as e:
+            print(f"Failed to delete, error: {e}")
+            return False
+        finally:
+            self._invalidate_query_cache(partition)
+
     async def _query(
         self,
         queries: List[QueryWithEmbedding],
         top_k: int = None,
         partitions: List[str] = None,
+        options: Optional[SearchOptions] = None,
     ) -> List[QueryResult]:
         """Query the QueryWithEmbedding against the MilvusDocumentSearch
 
@@ -180,81 +306,36 @@ class MilvusDataStore(DataStore):
 
         Args:
                 queries (List[QueryWithEmbedding]): The list of searches to perform.
+                options (SearchOptions, optional): Search settings of this call only.
 
         Returns:
                 List[QueryResult]: Results for each search.
         """
-
-        # Async to perform the query, adapted from pinecone implementation
-        async def _single_query(
-            query: QueryWithEmbedding, partitions: List[str] = None
-        ) -> QueryResult:
-            try:
-                filter = None
-                # Set the filter to expression that is valid for Milvus
-                if query.filter is not None:
-                    # Either a valid filter or None will be returned
-                    filter = self._get_filter(query.filter)
-
-                # check partitions, None will search everything so filter out all
-                if partitions is not None:
-                    if "all" in partitions:
-                        partitions = None
-
-                # Perform our search
-                top_k_ = query.top_k if top_k is None else top_k
-                res = self.col.search(
-                    data=[query.embedding],
-                    anns_field=EMBEDDING_FIELD,
-                    param=self.search_params,
-                    limit=top_k_,
-                    expr=filter,
-                    output_fields=[
-                        field[0] for field in self._get_schema()[1:]
-                    ],  # Ignoring pk, embedding
-                    partition_names=partitions,
+        batches = self._search_batches(
+            queries, top_k=top_k, partitions=[partitions] * len(queries)
+        )
+        # Run the blocking searches on the bounded executor so the event loop stays free
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(
+            *[
+                loop.run_in_executor(
+                    self._executor,
+                    self._search,
+                    [queries[i].embedding for i in indexes],
+                    *key,
+                    options,
                 )
-                # Results that will hold our DocumentChunkWithScores
-                results = []
-                # Parse every result for our search
-                for hit in res[0]:  # type: ignore
-                    # The distance score for the search result, falls under DocumentChunkWithScore
-                    score = hit.score
-                    # Our metadata info, falls under DocumentChunkMetadata
-                    metadata = {}
-                    # Grab the values that correspond to our fields, ignore pk and embedding.
-                    for x in [field[0] for field in self._get_schema()[1:]]:
-                        metadata[x] = hit.entity.get(x)
-                    # If the source isn't valid, convert to None
-                    if metadata["source"] not in Source.__members__:
-                        metadata["source"] = None
-                    # Text falls under the DocumentChunk
-                    text = metadata.pop("text")
-                    # Id falls under the DocumentChunk
-                    ids = metadata.pop("id")
-                    chunk = DocumentChunkWithScore(
-                        id=ids,
-                        score=score,
-                        text=text,
-                        metadata=DocumentChunkMetadata(**metadata),
-                    )
-                    results.append(chunk)
-
-                return QueryResult(query=query.query, results=results)
-            except Exception as e:
-                print(f"Failed to query, error: {e}")
-                return QueryResult(query=query.query, results=[])
-
-        results: List[QueryResult] = await asyncio.gather(
-            *[_single_query(query, partitions) for query in queries]
+                for indexes, key in batches
+            ]
         )
-        return results
+        return self._scatter_results(queries, batches, results)
 
     def _query_synch(
         self,
         queries: List[QueryWithEmbedding],
         top_k: int = None,
         partitions: List[str] = None,
+        options: Optional[SearchOptions] = None,
     ) -> List[QueryResult]:
         """A sychnronous vresion of _query. Query the QueryWithEmbedding against the MilvusDocumentSearch
 
@@ -262,98 +343,288 @@ class MilvusDataStore(DataStore):
 
         Args:
             queries (List[QueryWithEmbedding]): The list of searches to perform.
+            options (SearchOptions, optional): Search settings of this call only.
 
         Returns:
             List[QueryResult]: Results for each search.
         """
+        batches = self._search_batches(
+            queries, top_k=top_k, partitions=[partitions] * len(queries)
+        )
+        results = [
+            self._search([queries[i].embedding for i in indexes], *key, options)
+            for indexes, key in batches
+        ]
+        return self._scatter_results(queries, batches, results)
+
+    def _search_batches(
+        self,
+        queries: List[QueryWithEmbedding],
+        top_k: int = None,
+        partitions: List[Optional[List[str]]] = None,
+    ) -> List[Tuple[List[int], Tuple]]:
+        """Split the queries into batches that can each be sent as one Milvus search call
+
+        Args:
+            queries (List[QueryWithEmbedding]): The list of searches to perform.
+            top_k (int, optional): Overrides the top_k of every query.
+            partitions (List[Optional[List[str]]], optional): The partitions to search for each query.
+
+        Returns:
+            List[Tuple[List[int], Tuple]]: The query indexes of each batch and its (expr, limit, partitions) search key.
+        """
+        if partitions is None:
+            partitions = [None] * len(queries)
+
+        batches = []
+        for key, indexes in self._group_queries(queries, top_k, partitions).items():
+            for start in range(0, len(indexes), MAX_SEARCH_NQ):
+                batches.append((indexes[start : start + MAX_SEARCH_NQ], key))
+        return batches
+
+    def _scatter_results(
+        self,
+        queries: List[QueryWithEmbedding],
+        batches: List[Tuple[List[int], Tuple]],
+        results: List[List[List[DocumentChunkWithScore]]],
+    ) -> List[QueryResult]:
+        """Scatter the hits of every batch back to the query they belong to"""
+        hits: List[List[DocumentChunkWithScore]] = [[] for _ in queries]
+        for (indexes, _), batch_results in zip(batches, results):
+            for i, chunks in zip(indexes, batch_results):
+                hits[i] = chunks
+
+        return [
+            QueryResult(query=query.query, results=results)
+            for query, results in zip(queries, hits)
+        ]
+
+    def _group_queries(
+        self,
+        queries: List[QueryWithEmbedding],
+        top_k: int,
+        partitions: List[Optional[List[str]]],
+    ) -> Dict[Tuple, List[int]]:
+        """Group the query indexes by (filter expression, top_k, partitions)
 
-        def _single_query(
-            query: QueryWithEmbedding, partitions: List[str] = None
-        ) -> QueryResult:
+        Queries within a group can be sent to Milvus as a single multi-vector search.
+        """
+        groups: Dict[Tuple, List[int]] = {}
+        for i, (query, query_partitions) in enumerate(zip(queries, partitions)):
             try:
-                filter = None
+                expr = None
+                # Set the filter to expression that is valid for Milvus
                 if query.filter is not None:
-                    filter = self._get_filter(query.filter)
+                    expr = self._get_filter(query.filter) or None
+            except Exception as e:
+                print(f"Failed to query, error: {e}")
+                continue
 
-                # check partitions, None will search everything so filter out all
-                if partitions is not None:
-                    if "all" in partitions:
-                        partitions = None
+            # check partitions, None will search everything so filter out all
+            if query_partitions is not None:
+                if "all" in query_partitions:
+                    query_partitions = None
+                else:
+                    query_partitions = tuple(sorted(query_partitions))
 
-                top_k_ = query.top_k if top_k is None else top_k
-                res = self.col.search(
-                    data=[query.embedding],
+            top_k_ = query.top_k if top_k is None else top_k
+            groups.setdefault((expr, top_k_, query_partitions), []).append(i)
+        return groups
+
+    def _search(
+        self,
+        embeddings: List[List[float]],
+        expr: Optional[str],
+        limit: int,
+        partitions: Optional[Tuple[str, ...]],
+        options: Optional[SearchOptions] = None,
+    ) -> List[List[DocumentChunkWithScore]]:
+        """Perform a single multi-vector search and parse the hits of every vector
+
+        Returns:
+            List[List[DocumentChunkWithScore]]: The hits for each embedding, empty if the search failed.
+        """
+        try:
+            output_fields = self._get_output_fields(options)  # Ignoring pk, embedding
+            with self._collection() as col:
+                res = col.search(
+                    data=embeddings,
                     anns_field=EMBEDDING_FIELD,
-                    param=self.search_params,
-                    limit=top_k_,
-                    expr=filter,
-                    output_fields=[field[0] for field in self._get_schema()[1:]],
-                    partition_names=partitions,
+                    limit=limit,
+                    expr=expr,
+                    partition_names=list(partitions) if partitions else None,
+                    **self._search_kwargs(limit, output_fields, options),
                 )
+            return [
+                [self._hit_to_chunk(hit, output_fields) for hit in hits] for hits in res  # type: ignore
+            ]
+        except Exception as e:
+            print(f"Failed to query, error: {e}")
+            return [[] for _ in embeddings]
+
+    def _index_type(self) -> Optional[str]:
+        if isinstance(self.index_params, dict):
+            return self.index_params.get("index_type")
+        return None
+
+    def _load_tuned_params(self):
+        """Apply the search parameters saved by tune_search_params for this collection and index"""
+        tuned = self.search_tuning.overrides(self.milvus_collection, self._index_type())
+        if tuned:
+            self.search_param_overrides = {**self.search_param_overrides, **tuned}
+            print(f"Milvus tuned search parameters: {tuned}")
+
+    def _request_search_params(
+        self, limit: int, options: Optional[SearchOptions] = None
+    ) -> Dict:
+        """The search params of one request, a new dict so the shared search_params are never modified
 
-                results = []
-                for hit in res[0]:
-                    score = hit.score
-                    metadata = {
-                        x: hit.entity.get(x)
-                        for x in [field[0] for field in self._get_schema()[1:]]
-                    }
-                    if metadata["source"] not in Source.__members__:
-                        metadata["source"] = None
-                    text = metadata.pop("text")
-                    ids = metadata.pop("id")
-                    chunk = DocumentChunkWithScore(
-                        id=ids,
-                        score=score,
-                        text=text,
-                        metadata=DocumentChunkMetadata(**metadata),
-                    )
-                    results.append(chunk)
+        Args:
+            limit (int): The top_k of the search, HNSW needs an ef of at least that.
+            options (SearchOptions, optional): Settings of this request only, such as ef=64.
+        """
+        param = merge_search_params(
+            self.search_params,
+            self.search_param_overrides,
+            options.index_params() if options is not None else None,
+        )
+        if "ef" in param["params"] and param["params"]["ef"] < limit:
+            param["params"]["ef"] = limit
+        return param
 
-                return QueryResult(query=query.query, results=results)
-            except Exception as e:
-                print(f"Failed to query, error: {e}")
-                return QueryResult(query=query.query, results=[])
+    def _search_kwargs(
+        self,
+        limit: int,
+        output_fields: List[str],
+        options: Optional[SearchOptions] = None,
+    ) -> Dict:
+        """The per request keyword arguments of Collection.search"""
+        kwargs = {
+            "param": self._request_search_params(limit, options),
+            "output_fields": output_fields,
+        }
+        if options is not None:
+            if options.consistency_level is not None:
+                kwargs["consistency_level"] = options.consistency_level
+            if options.timeout is not None:
+                kwargs["timeout"] = options.timeout
+        return kwargs
+
+    def tune_search_params(
+        self,
+        embeddings: List[List[float]],
+        target_recall: float = 0.95,
+        top_k: int = 10,
+        candidates: Optional[List[int]] = None,
+        exact: Optional[List[List[str]]] = None,
+        save: bool = True,
+    ) -> Dict:
+        """Pick the cheapest ef or nprobe whose recall@top_k reaches target_recall on sample queries
+
+        The choice is saved per collection and index type, and applied to every later
+        search of this datastore and of datastores created on the same collection.
 
-        results = []
-        for query in queries:
-            result = _single_query(query, partitions=partitions)
-            results.append(result)
+        Args:
+            embeddings (List[List[float]]): Embeddings of representative queries.
+            target_recall (float, optional): The recall@top_k to reach against exact search.
+            top_k (int, optional): The number of hits compared.
+            candidates (List[int], optional): The values to try, see tuning.DEFAULT_CANDIDATES.
+            exact (List[List[str]], optional): The exact hit ids of each query, computed by brute force if not given.
+            save (bool, optional): Persist and apply the chosen value.
 
-        return results
+        Returns:
+            Dict: The chosen value, its recall and latency, and every measurement.
+        """
+        index_type = self._index_type()
+        param = TUNED_PARAMS.get(index_type)
+        if param is None or param not in (self.search_params or {}).get("params", {}):
+            raise ValueError(f"Index type {index_type} has no search parameter to tune")
+        if exact is None:
+            exact = self._exact_search_ids(embeddings, top_k)
+
+        def search(value: int) -> List[List[str]]:
+            hits = []
+            for start in range(0, len(embeddings), MAX_SEARCH_NQ):
+                batch = embeddings[start : start + MAX_SEARCH_NQ]
+                results = self._search(
+                    batch, None, top_k, None, SearchOptions(**{param: value})
+                )
+                hits += [[chunk.id for chunk in chunks] for chunks in results]
+            return hits
+
+        result = tune_search_param(search, exact, param, target_recall, candidates)
+        if save:
+            self.search_tuning.put(self.milvus_collection, index_type, result)
+            self.search_param_overrides = {
+                **self.search_param_overrides,
+                param: result["value"],
+            }
+            self._invalidate_query_cache()
+        return result
+
+    def _exact_search_ids(
+        self, embeddings: List[List[float]], top_k: int, batch_size: int = 4096
+    ) -> List[List[str]]:
+        """Brute force top_k ids of the embeddings, reading every vector of the collection"""
+
+        def batches():
+            with self._collection() as col:
+                iterator = col.query_iterator(
+                    batch_size=batch_size,
+                    expr='id != ""',
+                    output_fields=["id", EMBEDDING_FIELD],
+                )
+                try:
+                    while True:
+                        rows = iterator.next()
+                        if not rows:
+                            break
+                        yield [r["id"] for r in rows], [r[EMBEDDING_FIELD] for r in rows]
+                finally:
+                    iterator.close()
+
+        metric_type = (self.search_params or {}).get("metric_type", "IP")
+        return exact_top_k_ids(embeddings, batches(), top_k, metric_type)
+
+    def _get_output_fields(self, options: Optional[SearchOptions] = None) -> List[str]:
+        """The fields returned by a search, those of options or all of them but the embedding"""
+        if options is not None and options.output_fields is not None:
+            return list(options.output_fields)
+        return [field[0] for field in self._get_schema()[1:]]
+
+    def _hit_to_chunk(
+        self, hit, output_fields: Optional[List[str]] = None
+    ) -> DocumentChunkWithScore:
+        """Convert a Milvus search hit to a DocumentChunkWithScore"""
+        # Grab the values that correspond to our fields, ignore pk and embedding.
+        metadata = {x: hit.entity.get(x) for x in output_fields or self._get_output_fields()}
+        # If the source isn't valid, convert to None
+        if metadata.get("source") not in Source.__members__:
+            metadata["source"] = None
+        # Text falls under the DocumentChunk, empty when it was not requested
+        text = metadata.pop("text", "")
+        # Id falls under the DocumentChunk, the primary key is returned with every hit
+        ids = metadata.pop("id", None) or hit.id
+        return DocumentChunkWithScore(
+            id=ids,
+            # The distance score for the search result, falls under DocumentChunkWithScore
+            score=hit.score,
+            text=text,
+            metadata=DocumentChunkMetadata(**metadata),
+        )
 
     def _get_filter(self, filter: DocumentMetadataFilter) -> Optional[str]:
         """Converts a DocumentMetdataFilter to the expression that Milvus takes.
 
+        The compiled expression is memoized on the filter's canonical form, see datastore.filters.
+
         Args:
                         filter (DocumentMetadataFilter): The Filter to convert to Milvus expression.
 
         Returns:
                         Optional[str]: The filter if valid, otherwise None.
         """
-        filters = []
-        # Go through all the fields and their values
-        for field, value in filter.dict().items():
-            # Check if the Value is empty
-            if value is not None:
-                # Convert start_date to int and add greater than or equal logic
-                if field == "start_date":
-                    filters.append(
-                        "(created_at >= " + str(to_unix_timestamp(value)) + ")"
-                    )
-                # Convert end_date to int and add less than or equal logic
-                elif field == "end_date":
-                    filters.append(
-                        "(created_at <= " + str(to_unix_timestamp(value)) + ")"
-                    )
-                # Convert Source to its string value and check equivalency
-                elif field == "source":
-                    filters.append("(" + field + ' == "' + str(value.value) + '")')
-                # Check equivalency of rest of string fields
-                else:
-                    filters.append("(" + field + ' == "' + str(value) + '")')
-        # Join all our expressions with `and``
-        return " and ".join(filters)
+        return compile_filter(filter)
 
     def _create_connection(self):
         """
@@ -396,6 +667,18 @@ class MilvusDataStore(DataStore):
                         self.milvus_host, self.milvus_port, self.alias
                     )
                 )
+
+            # Spread searches and inserts over a pool of connections, reusing the alias above
+            self._pool = MilvusConnectionPool(
+                primary=(self.milvus_host, self.milvus_port),
+                replicas=self.milvus_replicas,
+                pool_size=self.pool_size,
+                routing=self.pool_routing,
+                user=self.milvus_user,
+                password=self.milvus_password,
+                secure=self.milvus_use_security,
+                existing_alias=self.alias,
+            )
         except Exception as e:
             print(
                 "Failed to create connection to Milvus server '{}:{}', error: {}".format(
@@ -403,6 +686,34 @@ class MilvusDataStore(DataStore):
                 )
             )
 
+    @contextmanager
+    def _collection(self, read_only: bool = True) -> Iterator[Collection]:
+        """Lease a pooled connection and yield the collection bound to it
+
+        Args:
+            read_only (bool, optional): Whether the call may go to a read replica.
+        """
+        if self._pool is None:
+            yield self.col
+            return
+        with self._pool.lease(read_only=read_only) as alias:
+            col = self._collections.get(alias)
+            if col is None:
+                if alias == self.alias:
+                    col = self.col
+                else:
+                    col = Collection(self.milvus_collection, using=alias)
+                self._collections[alias] = col
+            yield col
+
+    def close(self):
+        """Stop the connection pool's health checks, disconnect its connections and stop the search threads"""
+        if self._pool is not None:
+            self._pool.close()
+            self._pool = None
+            self._collections.clear()
+        self._executor.shutdown(wait=False)
+
     def _connect_to_collection(self, collection_name: str):
         """used to just connect to an existin collection"""
         self.col = Collection(collection_name, using=self.alias)
@@ -0,0 +1,193 @@
+import itertools
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Tuple
+from uuid import uuid4
+
+import grpc
+from pymilvus import connections, utility
+from pymilvus.exceptions import ConnectionNotExistException, MilvusUnavailableException
+
+
+class _Connection:
+    def __init__(self, alias: str, host: str, port: int, writable: bool):
+        self.alias = alias
+        self.host = host
+        self.port = port
+        self.writable = writable
+        self.outstanding = 0
+        self.healthy = True
+
+
+def _is_connection_error(e: Exception) -> bool:
+    """Whether an error means the connection is down, rather than a bad request"""
+    if isinstance(
+        e, (ConnectionError, ConnectionNotExistException, MilvusUnavailableException)
+    ):
+        return True
+    return isinstance(e, grpc.RpcError) and e.code() == grpc.StatusCode.UNAVAILABLE
+
+
+class MilvusConnectionPool:
+    """A pool of Milvus connection aliases spread over one or more endpoints.
+
+    Each endpoint gets pool_size aliases, each one its own gRPC channel. Searches
+    may use any endpoint, inserts only the primary one. When there is more than one
+    connection to fail over to, a background thread checks them every
+    health_check_interval seconds and reconnects the ones the pool created.
+
+    Args:
+        primary (Tuple[str, int]): The host and port of the primary endpoint.
+        replicas (List[Tuple[str, int]], optional): Read only endpoints used for searches.
+        pool_size (int, optional): Number of aliases per endpoint.
+        routing (str, optional): "round_robin" or "least_outstanding".
+        existing_alias (str, optional): An alias already connected to the primary endpoint to reuse.
+        health_check_interval (float, optional): Seconds between health checks, 0 disables them.
+    """
+
+    def __init__(
+        self,
+        primary: Tuple[str, int],
+        replicas: Optional[List[Tuple[str, int]]] = None,
+        pool_size: int = 1,
+        routing: str = "round_robin",
+        user: Optional[str] = None,
+        password: Optional[str] = None,
+        secure: bool = False,
+        existing_alias: Optional[str] = None,
+        health_check_interval: float = 30.0,
+    ):
+        if routing not in ("round_robin", "least_outstanding"):
+            raise ValueError(f"Unsupported routing: {routing}")
+        self.routing = routing
+        self.user = user
+        self.password = password
+        self.secure = secure
+        self._connections: List[_Connection] = []
+        # Aliases connected by the pool, the only ones close() disconnects
+        self._owned: List[str] = []
+        self._lock = threading.Lock()
+        self._counter = itertools.count()
+        self._closed = threading.Event()
+
+        endpoints = [(primary, True)] + [(r, False) for r in replicas or []]
+        for (host, port), writable in endpoints:
+            for i in range(pool_size):
+                if writable and i == 0 and existing_alias:
+                    alias = existing_alias
+                else:
+                    alias = uuid4().hex
+                    self._connect(alias, host, port)
+                    self._owned.append(alias)
+                self._connections.append(_Connection(alias, host, port, writable))
+
+        # A lone connection has nothing to fail over to, so it is left to pymilvus
+        if health_check_interval > 0 and len(self._connections) > 1:
+            threading.Thread(
+                target=self._health_loop,
+                args=(health_check_interval,),
+                name="milvus-health",
+                daemon=True,
+            ).start()
+
+    @property
+    def aliases(self) -> List[str]:
+        return [c.alias for c in self._connections]
+
+    def _connect(self, alias: str, host: str, port: int):
+        connections.connect(
+            alias=alias,
+            host=host,
+            port=port,
+            user=self.user,  # type: ignore
+            password=self.password,  # type: ignore
+            secure=self.secure,
+        )
+
+    def _acquire(self, read_only: bool) -> _Connection:
+        with self._lock:
+            candidates = [
+                c for c in self._connections if (read_only or c.writable) and c.healthy
+            ]
+            # With every candidate unhealthy, try them anyway rather than failing outright
+            if not candidates:
+                candidates = [c for c in self._connections if read_only or c.writable]
+            if self.routing == "least_outstanding":
+                connection = min(candidates, key=lambda c: c.outstanding)
+            else:
+                connection = candidates[next(self._counter) % len(candidates)]
+            connection.outstanding += 1
+            return connection
+
+    @contextmanager
+    def lease(self, read_only: bool = True) -> Iterator[str]:
+        """Borrow a connection alias for the duration of a call
+
+        Args:
+            read_only (bool, optional): Whether replica endpoints may be used.
+
+        Yields:
+            str: The alias to pass as `using` to pymilvus.
+        """
+        connection = self._acquire(read_only)
+        try:
+            yield connection.alias
+        except Exception as e:
+            # Route around a lost connection until the health check reconnects it,
+            # a failed request on a working connection leaves it in rotation
+            if _is_connection_error(e):
+                connection.healthy = False
+            raise
+        finally:
+            with self._lock:
+                connection.outstanding -= 1
+
+    def check_health(self):
+        """Ping every connection, reconnecting the ones created by the pool that do not answer"""
+        for connection in self._connections:
+            try:
+                utility.get_server_version(using=connection.alias)
+                connection.healthy = True
+                continue
+            except Exception as e:
+                connection.healthy = False
+                print(
+                    "Milvus connection '{}' to '{}:{}' failed health check, error: {}".format(
+                        connection.alias, connection.host, connection.port, e
+                    )
+                )
+            # An alias passed in as existing_alias belongs to the caller
+            if connection.alias not in self._owned:
+                continue
+            try:
+                connections.disconnect(connection.alias)
+                self._connect(connection.alias, connection.host, connection.port)
+                utility.get_server_version(using=connection.alias)
+                connection.healthy = True
+                print(
+                    "Reconnected to Milvus server '{}:{}' with alias '{}'".format(
+                        connection.host, connection.port, connection.alias
+                    )
+                )
+            except Exception as e:
+                connection.healthy = False
+                print(
+                    "Failed to reconnect to Milvus server '{}:{}', error: {}".format(
+                        connection.host, connection.port, e
+                    )
+                )
+
+    def _health_loop(self, interval: float):
+        while not self._closed.wait(interval):
+            self.check_health()
+
+    def close(self):
+        """Stop the health checks and disconnect the aliases created by the pool"""
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        for alias in self._owned:
+            try:
+                connections.disconnect(alias)
+            except Exception as e:
+                print(f"Failed to disconnect Milvus alias '{alias}', error: {e}")
@@ -1,25 +1,36 @@
-from typing import List
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 import asyncio
+import functools
+import os
+import time
 
 from .milvus_base_datastore import (
     MilvusDataStore,
     SCHEMA_V2,
 )
 
-try:
-    from ...services.openai import get_embeddings
-    from ...services.classification import (
-        classify_code,
-        classify_question,
-        select_partition,
-    )
-except ImportError:
-    print("Failed to import openai and classification services")
+from ...services.local_classifier import NearestCentroidClassifier
 
 
 UPSERT_BATCH_SIZE = 20
+# Approximate size of each insert call made by insert_stream
+INSERT_BATCH_BYTES = int(os.environ.get("MILVUS_INSERT_BATCH_BYTES") or 8 * 1024 * 1024)
 EMBEDDING_FIELD = "embedding"
+# The 'ef' parameter in Milvus search queries stands for "size of the dynamic candidate list"
+# and is crucial for controlling the trade-off between search accuracy and performance.
+# Used until tune_search_params finds the smallest ef reaching the target recall.
 EF_VALUE = 1000
+# Maximum number of concurrent classify_code calls used to re-rank hits
+RERANK_CONCURRENCY = int(os.environ.get("RERANK_CONCURRENCY") or 8)
+# Seconds a query may spend classifying and re-ranking before falling back to vector order
+RERANK_BUDGET = float(os.environ.get("RERANK_BUDGET") or 10.0)
+# A saved NearestCentroidClassifier (.npz) used to classify questions locally instead of with GPT
+QUESTION_CLASSIFIER_PATH = os.environ.get("QUESTION_CLASSIFIER_PATH")
+# Below this confidence the local classifier falls back to GPT
+QUESTION_CLASSIFIER_THRESHOLD = float(
+    os.environ.get("QUESTION_CLASSIFIER_THRESHOLD") or 0.5
+)
 
 from ...models.models import (
     QueryResult,
@@ -28,6 +39,7 @@ from ...models.models import (
     DocumentChunkWithScore,
     DocumentChunkMetadata,
     Source,
+    SearchOptions,
 )
 
 
@@ -38,7 +50,28 @@ class MilvusSrcDataStore(MilvusDataStore):
         self._create_connection()
         self._create_collection(self.milvus_collection, self.create_new)  # type: ignore
         self._create_index()
+        self._load_partitions()
+        # Searches use a large ef unless tune_search_params found a cheaper one
+        if "ef" in (self.search_params or {}).get("params", {}):
+            self.search_param_overrides = {"ef": EF_VALUE}
+        self._load_tuned_params()
         self.use_classification = True
+        self.rerank_budget = RERANK_BUDGET
+        # None classifies every question with GPT
+        self.question_classifier = (
+            NearestCentroidClassifier.load(QUESTION_CLASSIFIER_PATH)
+            if QUESTION_CLASSIFIER_PATH
+            else None
+        )
+        self.question_classifier_threshold = QUESTION_CLASSIFIER_THRESHOLD
+        self._rerank_executor = ThreadPoolExecutor(
+            max_workers=RERANK_CONCURRENCY, thread_name_prefix="rerank"
+        )
+
+    def close(self):
+        """Stop the re-ranking threads, then close the connections and search threads"""
+        self._rerank_executor.shutdown(wait=False)
+        super().close()
 
     def get_count(self):
         return self.col.num_entities
@@ -46,52 +79,121 @@ class MilvusSrcDataStore(MilvusDataStore):
     def flush(self):
         self.col.flush()
 
-    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
-        return get_embeddings(texts)
-
     def insert(self, chunks, batch_size=UPSERT_BATCH_SIZE, partition: str = None):
         """inserts data into the milvus collection"""
         # If chunks is a single dictionary, convert it to a list of dictionaries
         if isinstance(chunks, dict):
             chunks = [chunks]
 
-        # Convert the keys of the dictionary to a list of field names
-        fields = [field[1].name for field in SCHEMA_V2]
-
         for i in range(0, len(chunks), batch_size):
-            batch = chunks[i : i + batch_size]
+            self._insert_batch(chunks[i : i + batch_size], partition=partition)
 
-            # Initialize a dictionary to hold the field values
-            data = {field: [] for field in fields}
+    def insert_stream(
+        self,
+        chunks: Iterable[Dict],
+        partition: str = None,
+        max_batch_bytes: int = INSERT_BATCH_BYTES,
+    ) -> Dict[str, float]:
+        """Stream chunks into the milvus collection without holding them all in memory
 
-            # Convert each dictionary in batch to the correct format
-            for chunk in batch:
-                # Add the values of the dictionary to the corresponding lists in the data dictionary
-                for field in fields:
-                    data[field].append(chunk.get(field, "None"))
+        Chunks are grouped into batches of about max_batch_bytes. Chunks without an
+        embedding are embedded from their text, and the next batch is embedded while
+        the previous one is being inserted.
 
-            # Convert the data dictionary to a list of lists
-            data = list(data.values())
+        Args:
+            chunks (Iterable[Dict]): The chunks to insert, in the format taken by insert.
+            partition (str, optional): The partition to insert into.
+            max_batch_bytes (int, optional): The approximate size of each insert call.
 
-            if partition:
-                partitions = self.col.partitions
-                partition_names = [p.name for p in partitions]
-                if partition not in partition_names:
-                    # Create the partition
-                    self.col.create_partition(partition_name=partition)
+        Returns:
+            Dict[str, float]: Throughput statistics of the ingest.
+        """
+        stats = {"rows": 0, "bytes": 0, "batches": 0}
+        start = time.monotonic()
+        pending = None
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="insert") as executor:
+            for batch, size in self._byte_batches(chunks, max_batch_bytes):
+                batch = self._embed_missing(batch)
+                # Only one insert in flight, so at most two batches are held in memory
+                if pending is not None:
+                    pending.result()
+                pending = executor.submit(self._insert_batch, batch, partition)
+                stats["rows"] += len(batch)
+                stats["bytes"] += size
+                stats["batches"] += 1
+            if pending is not None:
+                pending.result()
+
+        stats["seconds"] = time.monotonic() - start
+        stats["rows_per_second"] = stats["rows"] / max(stats["seconds"], 1e-9)
+        stats["mb_per_second"] = stats["bytes"] / 1e6 / max(stats["seconds"], 1e-9)
+        print(
+            "Inserted {rows} rows in {batches} batches, {seconds:.1f}s, "
+            "{rows_per_second:.0f} rows/s, {mb_per_second:.2f} MB/s".format(**stats)
+        )
+        return stats
+
+    def _byte_batches(
+        self, chunks: Iterable[Dict], max_batch_bytes: int
+    ) -> Iterator[Tuple[List[Dict], int]]:
+        """Group the chunks into batches of about max_batch_bytes, with their size"""
+        batch, batch_bytes = [], 0
+        vector_bytes = self.output_dim * 4
+        for chunk in chunks:
+            size = vector_bytes + sum(
+                len(value.encode("utf-8")) if isinstance(value, str) else 8
+                for key, value in chunk.items()
+                if key != EMBEDDING_FIELD
+            )
+            if batch and batch_bytes + size > max_batch_bytes:
+                yield batch, batch_bytes
+                batch, batch_bytes = [], 0
+            batch.append(chunk)
+            batch_bytes += size
+        if batch:
+            yield batch, batch_bytes
+
+    def _embed_missing(self, batch: List[Dict]) -> List[Dict]:
+        """The batch with the text of the chunks without an embedding embedded
+
+        Embedded chunks are shallow copies, the caller's dicts are left untouched.
+        """
+        missing = [i for i, chunk in enumerate(batch) if chunk.get(EMBEDDING_FIELD) is None]
+        if not missing:
+            return batch
+        embeddings = self.get_embeddings([batch[i]["text"] for i in missing], as_array=True)
+        batch = list(batch)
+        for i, embedding in zip(missing, embeddings):
+            batch[i] = {**batch[i], EMBEDDING_FIELD: embedding}
+        return batch
+
+    def _insert_batch(self, batch: List[Dict], partition: str = None):
+        """Insert a single batch of chunks with one col.insert call"""
+        # Convert the keys of the dictionary to a list of field names
+        fields = [field[1].name for field in SCHEMA_V2]
+
+        # Convert each dictionary in batch to a list of values per field
+        data = [[chunk.get(field, "None") for chunk in batch] for field in fields]
+
+        if partition:
+            self._ensure_partition(partition)
 
-            # Insert the data into the collection
-            self.col.insert(data, partition_name=partition)
+        # Insert the data into the collection
+        with self._collection(read_only=False) as col:
+            col.insert(data, partition_name=partition)
+        self._invalidate_query_cache(partition)
 
     async def _query(
         self,
         queries: List[QueryWithEmbedding],
         top_k: int = None,
         partitions: List[str] = None,
+        options: Optional[SearchOptions] = None,
     ) -> List[QueryResult]:
         """Query the QueryWithEmbedding against the MilvusDocumentSearch
 
-        Search the embedding and its filter in the collection.
+        Search the embedding and its filter in the collection. Each query blocks on
+        GPT classification and Milvus, so they run concurrently on the bounded executor.
 
         Args:
                         queries (List[QueryWithEmbedding]): The list of searches to perform.
@@ -99,100 +201,19 @@ class MilvusSrcDataStore(MilvusDataStore):
         Returns:
                         List[QueryResult]: Results for each search.
         """
-
-        # Async to perform the query, adapted from pinecone implementation
-        async def _single_query(
-            query: QueryWithEmbedding,
-            max_attempts: int = 1,
-            partitions: List[str] = None,
-        ) -> QueryResult:
-            try:
-                if self.use_classification:
-                    question_label = classify_question(query.query)
-            except Exception as e:
-                print(f"Failed to classify question, error: {e}")
-                return QueryResult(query=query.query, results=[])
-
-            for _ in range(max_attempts):
-                try:
-                    filter = None
-                    # Set the filter to expression that is valid for Milvus
-                    if query.filter is not None:
-                        # Either a valid filter or None will be returned
-                        filter = self._get_filter(query.filter)
-
-                    # Perform our search
-                    top_k_ = query.top_k if top_k is None else top_k
-
-                    # check partitions, None will search everything so filter out all
-                    if partitions is not None:
-                        if "all" in partitions:
-                            partitions = None
-                        else:
-                            partitions = select_partition(query.query, partitions)
-
-                    # The 'ef' parameter in Milvus search queries stands for "size of the dynamic candidate list"
-                    # and is crucial for controlling the trade-off between search accuracy and performance.
-                    self.search_params["params"]["ef"] = EF_VALUE
-
-                    res = self.col.search(
-                        data=[query.embedding],
-                        anns_field=EMBEDDING_FIELD,
-                        param=self.search_params,
-                        limit=top_k_,
-                        expr=filter,
-                        output_fields=[field[0] for field in self._get_schema()[1:]],
-                        partitions=partitions,
-                    )
-
-                    # Results that will hold our DocumentChunkWithScores
-                    results = []
-                    # Parse every result for our search
-                    for hit in res[0]:  # type: ignore
-                        # The distance score for the search result, falls under DocumentChunkWithScore
-                        score = hit.score
-                        # Our metadata info, falls under DocumentChunkMetadata
-                        metadata = {}
-                        # Grab the values that correspond to our fields, ignore pk and embedding.
-                        for x in [field[0] for field in self._get_schema()[1:]]:
-                            metadata[x] = hit.entity.get(x)
-
-                        source = metadata.pop("source")
-                        # Text falls under the DocumentChunk
-                        text = metadata.pop("text")
-                        # Id falls under the DocumentChunk
-                        ids = metadata.pop("id")
-
-                        # if the resonse is not relvant, skip it
-                        if self.use_classification:
-                            code_relevance = classify_code(
-                                code=text,
-                                question=query.query,
-                                question_label=question_label,
-                            )
-                            if code_relevance["function_args"]["code_label"] == 0:
-                                continue
-
-                        chunk = DocumentChunkWithScore(
-                            id=ids,
-                            score=score,
-                            text=source + ": " + text,
-                            metadata=DocumentChunkMetadata(**metadata),
-                        )
-                        results.append(chunk)
-
-                    if results:
-                        return QueryResult(query=query.query, results=results)
-
-                except Exception as e:
-                    print(f"Failed to query, error: {e}")
-
-                return QueryResult(query=query.query, results=[])
-
-        max_attempts = 1 if not self.use_classification else 3
+        loop = asyncio.get_running_loop()
         results: List[QueryResult] = await asyncio.gather(
             *[
-                _single_query(query, max_attempts=max_attempts, partitions=partitions)
+                loop.run_in_executor(
+                    self._executor,
+                    functools.partial(
+                        self._single_query,
+                        query,
+                        top_k=top_k,
+                        partitions=partitions,
+                        options=options,
+                    ),
+                )
                 for query in queries
             ]
         )
@@ -203,6 +224,7 @@ class MilvusSrcDataStore(MilvusDataStore):
         queries: List[QueryWithEmbedding],
         top_k: int = None,
         partitions: List[str] = None,
+        options: Optional[SearchOptions] = None,
     ) -> List[QueryResult]:
         """Query the QueryWithEmbedding against the MilvusDocumentSearch
 
@@ -214,86 +236,170 @@ class MilvusSrcDataStore(MilvusDataStore):
         Returns:
             List[QueryResult]: Results for each search.
         """
+        results = [
+            self._single_query(
+                query,
+                top_k=top_k,
+                partitions=partitions,
+                options=options,
+            )
+            for query in queries
+        ]
+        return results
 
-        def _single_query(
-            query: QueryWithEmbedding,
-            max_attempts: int = 1,
-            partitions: List[str] = None,
-        ) -> QueryResult:
-            try:
-                if self.use_classification:
-                    question_label = classify_question(query.query)
-            except Exception as e:
-                print(f"Failed to classify question, error: {e}")
-                return QueryResult(query=query.query, results=[])
-
-            for _ in range(max_attempts):
-                try:
-                    filter = None
-                    if query.filter is not None:
-                        filter = self._get_filter(query.filter)
-
-                    top_k_ = query.top_k if top_k is None else top_k
-                    # check partitions, None will search everything so filter out all
-                    if partitions is not None:
-                        if "all" in partitions:
-                            partitions = None
-                        else:
-                            partitions = select_partition(
-                                question=query.query, partitions=partitions
-                            )
-
-                    self.search_params["params"]["ef"] = EF_VALUE
-
-                    res = self.col.search(
-                        data=[query.embedding],
-                        anns_field=EMBEDDING_FIELD,
-                        param=self.search_params,
-                        limit=top_k_,
-                        # expr=filter,
-                        output_fields=[field[0] for field in self._get_schema()[1:]],
-                        partitions=partitions,
+    def _single_query(
+        self,
+        query: QueryWithEmbedding,
+        top_k: int = None,
+        partitions: List[str] = None,
+        options: Optional[SearchOptions] = None,
+    ) -> QueryResult:
+        """Classify, search and re-rank the hits of a single query"""
+        start = time.monotonic()
+        try:
+            if self.use_classification:
+                question_label = self._classify_question(query)
+        except Exception as e:
+            print(f"Failed to classify question, error: {e}")
+            return QueryResult(query=query.query, results=[])
+
+        try:
+            filter = None
+            # Set the filter to expression that is valid for Milvus
+            if query.filter is not None:
+                # Either a valid filter or None will be returned
+                filter = self._get_filter(query.filter) or None
+
+            top_k_ = query.top_k if top_k is None else top_k
+            # check partitions, None will search everything so filter out all
+            if partitions is not None:
+                if "all" in partitions:
+                    partitions = None
+                else:
+                    from ...services.classification import select_partition
+
+                    selected = select_partition(
+                        question=query.query, partitions=partitions
                     )
+                    # The model may answer "all" or name partitions that do not
+                    # exist, either of which Milvus rejects, so search everything
+                    if not selected or "all" in selected:
+                        partitions = None
+                    else:
+                        partitions = [p for p in selected if p in self._partitions]
+                        partitions = partitions or None
+
+            output_fields = self._get_output_fields(options)
+            with self._collection() as col:
+                res = col.search(
+                    data=[query.embedding],
+                    anns_field=EMBEDDING_FIELD,
+                    limit=top_k_,
+                    expr=filter,
+                    partition_names=partitions,
+                    **self._search_kwargs(top_k_, output_fields, options),
+                )
+
+            # Results that will hold our DocumentChunkWithScores
+            chunks = []
+            # Parse every result for our search
+            for hit in res[0]:  # type: ignore
+                # Grab the values that correspond to our fields, ignore pk and embedding.
+                metadata = {x: hit.entity.get(x) for x in output_fields}
+
+                source = metadata.pop("source", None)
+                # Text falls under the DocumentChunk
+                text = metadata.pop("text", "")
+                # Id falls under the DocumentChunk
+                ids = metadata.pop("id", None) or hit.id
+
+                chunk = DocumentChunkWithScore(
+                    id=ids,
+                    # The distance score for the search result, falls under DocumentChunkWithScore
+                    score=hit.score,
+                    text=source + ": " + text if source is not None else text,
+                    metadata=DocumentChunkMetadata(**metadata),
+                )
+                chunks.append((chunk, text))
+        except Exception as e:
+            print(f"Failed to query, error: {e}")
+            return QueryResult(query=query.query, results=[])
 
-                    results = []
-                    for hit in res[0]:
-                        score = hit.score
-                        metadata = {}
-                        for x in [field[0] for field in self._get_schema()[1:]]:
-                            metadata[x] = hit.entity.get(x)
-
-                        source = metadata.pop("source")
-                        text = metadata.pop("text")
-                        ids = metadata.pop("id")
-
-                        if self.use_classification:
-                            code_relevance = classify_code(
-                                code=text,
-                                question=query.query,
-                                question_label=question_label,
-                            )
-                            if code_relevance["function_args"]["code_label"] == 0:
-                                continue
-
-                        chunk = DocumentChunkWithScore(
-                            id=ids,
-                            score=score,
-                            text=source + ": " + text,
-                            metadata=DocumentChunkMetadata(**metadata),
-                        )
-                        results.append(chunk)
-
-                    if results:
-                        return QueryResult(query=query.query, results=results)
-
-                except Exception as e:
-                    print(f"Failed to query, error: {e}")
+        if not self.use_classification:
+            return QueryResult(query=query.query, results=[c for c, _ in chunks])
 
-            return QueryResult(query=query.query, results=[])
+        # Re-ranked once: a hit that cannot be classified is kept, and past the
+        # deadline the hits come back in vector order, so a retry would only repeat it
+        results = self._rerank(
+            query.query, question_label, chunks, deadline=start + self.rerank_budget
+        )
+        return QueryResult(query=query.query, results=results)
 
-        max_attempts = 1 if not self.use_classification else 3
-        results = [
-            _single_query(query, max_attempts=max_attempts, partitions=partitions)
-            for query in queries
+    def _classify_question(self, query: QueryWithEmbedding):
+        """Classify the question with the local classifier, falling back to GPT when it is unsure
+
+        Returns:
+            The classification in the format returned by classify_question.
+        """
+        if self.question_classifier is not None:
+            label, confidence = self.question_classifier.predict(query.embedding)
+            if confidence >= self.question_classifier_threshold:
+                return {
+                    "function_name": "classify_question",
+                    "function_args": {"question_label": str(label)},
+                }
+        from ...services.classification import classify_question
+
+        return classify_question(query.query)
+
+    def _rerank(
+        self,
+        question: str,
+        question_label,
+        chunks: List[Tuple[DocumentChunkWithScore, str]],
+        deadline: float,
+    ) -> List[DocumentChunkWithScore]:
+        """Drop the hits GPT classifies as irrelevant to the question
+
+        The hits are classified concurrently on the re-rank executor. If the deadline
+        passes first, the hits are returned unfiltered, in vector order. Only the
+        classify_code calls still queued are cancelled, the ones already running keep
+        their executor thread until the OpenAI request returns.
+
+        Args:
+            question (str): The question being answered.
+            question_label: The classification of the question.
+            chunks (List[Tuple[DocumentChunkWithScore, str]]): The hits and their raw code text.
+            deadline (float): The time.monotonic() by which re-ranking must be done.
+
+        Returns:
+            List[DocumentChunkWithScore]: The relevant hits, in vector order.
+        """
+        from ...services.classification import classify_code
+
+        futures = [
+            self._rerank_executor.submit(
+                classify_code,
+                code=text,
+                question=question,
+                question_label=question_label,
+            )
+            for _, text in chunks
         ]
+        _, not_done = wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+        if not_done:
+            for future in not_done:
+                future.cancel()
+            print("Re-ranking exceeded its latency budget, using vector order")
+            return [chunk for chunk, _ in chunks]
+
+        results = []
+        for (chunk, _), future in zip(chunks, futures):
+            try:
+                if future.result()["function_args"]["code_label"] == 0:
+                    continue
+            except Exception as e:
+                # Keep the hit if it could not be classified
+                print(f"Failed to classify code, error: {e}")
+            results.append(chunk)
         return results
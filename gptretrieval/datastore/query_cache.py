@@ -0,0 +1,109 @@
+import hashlib
+import threading
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from ..models.models import QueryResult, QueryWithEmbedding
+from ..services.cache import LRUCache
+from .filters import canonical_filter
+
+
+class QueryResultCache:
+    """A TTL + LRU cache of query results, invalidated by writes to the datastore.
+
+    Results are keyed by the query text, a hash of its embedding, its filter, top_k
+    and the partitions searched. Every entry remembers the write versions of the
+    partitions it searched, so an insert or delete into a partition invalidates the
+    results that searched it, and every result that searched all partitions.
+
+    Args:
+        max_entries: The number of results kept.
+        ttl: Seconds a result stays valid, None keeps results until they are evicted.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = 60.0):
+        self._cache = LRUCache(max_entries, ttl=ttl)
+        self._lock = threading.Lock()
+        # Bumped by writes that may touch every partition
+        self._version = 0
+        # Bumped by any write, results over all partitions depend on it
+        self._any_version = 0
+        self._partition_versions: Dict[str, int] = defaultdict(int)
+
+    @staticmethod
+    def partition_names(partitions) -> Optional[Tuple[str, ...]]:
+        """The partition names searched, None for all of them
+
+        Accepts a list of names or the {type: {"name": ..., "description": ...}}
+        mapping used by select_partition.
+        """
+        if partitions is None:
+            return None
+        if isinstance(partitions, dict):
+            partitions = [value["name"] for value in partitions.values()]
+        if "all" in partitions:
+            return None
+        return tuple(sorted(partitions))
+
+    def make_key(
+        self, query: QueryWithEmbedding, top_k: Optional[int], partitions, *extra
+    ) -> str:
+        embedding = np.asarray(query.embedding, dtype=np.float32).tobytes()
+        digest = hashlib.sha256(embedding)
+        filter = canonical_filter(query.filter) if query.filter is not None else None
+        top_k = query.top_k if top_k is None else top_k
+        digest.update(
+            repr(
+                (query.query, filter, top_k, self.partition_names(partitions)) + extra
+            ).encode("utf-8")
+        )
+        return digest.hexdigest()
+
+    def snapshot(self, partitions) -> Tuple:
+        """The write versions a result over the partitions depends on"""
+        names = self.partition_names(partitions)
+        with self._lock:
+            if names is None:
+                return (self._version, self._any_version)
+            return (self._version,) + tuple(self._partition_versions[p] for p in names)
+
+    def lookup(
+        self,
+        queries: List[QueryWithEmbedding],
+        top_k: Optional[int],
+        partitions,
+        *extra,
+    ) -> Tuple[List[Optional[QueryResult]], List[str], Tuple]:
+        """Return the cached results (None where missing), the keys and the current snapshot
+
+        The snapshot must be taken before the missing queries run, and passed to store,
+        so a write racing with the query cannot leave a stale result behind.
+        """
+        snapshot = self.snapshot(partitions)
+        keys = [self.make_key(query, top_k, partitions, *extra) for query in queries]
+        results = []
+        for key in keys:
+            entry = self._cache.get(key)
+            results.append(entry[1] if entry is not None and entry[0] == snapshot else None)
+        return results, keys, snapshot
+
+    def store(self, keys: List[str], results: List[QueryResult], snapshot: Tuple):
+        for key, result in zip(keys, results):
+            self._cache.put(key, (snapshot, result))
+
+    def invalidate(self, partition: Optional[str] = None):
+        """Invalidate the results affected by a write to partition, None for the whole collection"""
+        with self._lock:
+            self._any_version += 1
+            if partition is None:
+                self._version += 1
+            else:
+                self._partition_versions[partition] += 1
+
+    def clear(self):
+        self._cache.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return self._cache.stats()
@@ -0,0 +1,204 @@
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, Hashable, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+from ..services.quantization import top_k_indices
+
+# JSON file holding the tuned search parameter of every collection and index type
+SEARCH_TUNING_PATH = os.environ.get("SEARCH_TUNING_PATH") or "search_tuning.json"
+
+# The search parameter trading recall for latency, for each index type
+TUNED_PARAMS = {
+    "HNSW": "ef",
+    "RHNSW_FLAT": "ef",
+    "RHNSW_SQ": "ef",
+    "RHNSW_PQ": "ef",
+    "IVF_FLAT": "nprobe",
+    "IVF_SQ8": "nprobe",
+    "IVF_PQ": "nprobe",
+    "IVF_HNSW": "nprobe",
+    # The local datastore's quantized FLAT index re-ranks rerank_factor * top_k candidates
+    "SQ8": "rerank_factor",
+    "PQ": "rerank_factor",
+}
+
+# Values tried for each parameter, in increasing order of cost
+DEFAULT_CANDIDATES = {
+    "ef": [10, 16, 32, 64, 128, 256, 512, 1000],
+    "nprobe": [1, 2, 4, 8, 16, 32, 64, 128, 256],
+    "rerank_factor": [0, 1, 2, 4, 8, 16],
+}
+
+
+def recall(hits: Sequence[Sequence[Hashable]], exact: Sequence[Sequence[Hashable]]) -> float:
+    """Average fraction of the exact hits of each query found in its hits"""
+    recalls = [len(set(h) & set(e)) / len(e) for h, e in zip(hits, exact) if len(e)]
+    return sum(recalls) / len(recalls) if recalls else 1.0
+
+
+def tune_search_param(
+    search: Callable[[int], Sequence[Sequence[Hashable]]],
+    exact: Sequence[Sequence[Hashable]],
+    param: str,
+    target_recall: float = 0.95,
+    candidates: Optional[Iterable[int]] = None,
+    repeats: int = 3,
+) -> Dict:
+    """Find the cheapest value of a search parameter reaching the target recall
+
+    Values are tried in increasing order, each searched repeats times and timed on
+    the fastest run. The sweep stops at the first value reaching target_recall,
+    larger values only cost more. If none does, the value with the best recall wins.
+
+    Args:
+        search (Callable[[int], Sequence[Sequence[Hashable]]]): Runs the sample queries with a value, returning the hit ids of each.
+        exact (Sequence[Sequence[Hashable]]): The exact hit ids of each sample query.
+        param (str): The name of the parameter, "ef", "nprobe" or "rerank_factor".
+        target_recall (float, optional): The recall@k to reach.
+        candidates (Iterable[int], optional): The values to try, defaults to DEFAULT_CANDIDATES[param].
+        repeats (int, optional): Runs per value, the fastest is kept.
+
+    Returns:
+        Dict: The chosen value with its recall and latency, and every measurement.
+    """
+    candidates = sorted(candidates or DEFAULT_CANDIDATES[param])
+    measurements = []
+    for value in candidates:
+        latencies = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            hits = search(value)
+            latencies.append(time.perf_counter() - start)
+        measurements.append(
+            {
+                "value": value,
+                "recall": recall(hits, exact),
+                "latency_ms": 1000 * min(latencies) / max(len(exact), 1),
+            }
+        )
+        print(
+            "{}={}: recall {:.4f}, {:.2f} ms per query".format(
+                param, value, measurements[-1]["recall"], measurements[-1]["latency_ms"]
+            )
+        )
+        if measurements[-1]["recall"] >= target_recall:
+            break
+
+    reached = [m for m in measurements if m["recall"] >= target_recall]
+    chosen = reached[0] if reached else max(measurements, key=lambda m: m["recall"])
+    return {
+        "param": param,
+        "value": chosen["value"],
+        "recall": chosen["recall"],
+        "latency_ms": chosen["latency_ms"],
+        "target_recall": target_recall,
+        "queries": len(exact),
+        "measurements": measurements,
+        "tuned_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
+
+
+class SearchTuningStore:
+    """The tuned search parameters, persisted as JSON keyed by collection and index type.
+
+    Args:
+        path: The JSON file, created on the first put.
+    """
+
+    _lock = threading.Lock()
+
+    def __init__(self, path: str = SEARCH_TUNING_PATH):
+        self.path = path
+
+    @staticmethod
+    def _key(collection: str, index_type: str) -> str:
+        return f"{collection}/{index_type}"
+
+    def _read(self) -> Dict[str, Dict]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            return json.load(f)
+
+    def get(self, collection: str, index_type: str) -> Optional[Dict]:
+        try:
+            return self._read().get(self._key(collection, index_type))
+        except (OSError, ValueError) as e:
+            print(f"Failed to read search tuning from '{self.path}', error: {e}")
+            return None
+
+    def put(self, collection: str, index_type: str, result: Dict):
+        with self._lock:
+            tuned = self._read()
+            tuned[self._key(collection, index_type)] = result
+            # Write then rename, so a reader never sees a partial file
+            tmp = f"{self.path}.tmp"
+            with open(tmp, "w") as f:
+                json.dump(tuned, f, indent=2, sort_keys=True)
+            os.replace(tmp, self.path)
+
+    def overrides(self, collection: str, index_type: str) -> Dict[str, int]:
+        """The tuned {param: value} of a collection, empty if it was never tuned"""
+        result = self.get(collection, index_type)
+        return {result["param"]: result["value"]} if result else {}
+
+
+def merge_search_params(search_params: Optional[Dict], *overrides: Optional[Dict]) -> Dict:
+    """A new Milvus search param dict with the overrides applied to its "params"
+
+    The inputs are never modified, so a shared search_params can be specialized per request.
+    """
+    search_params = search_params or {}
+    params = dict(search_params.get("params") or {})
+    for override in overrides:
+        params.update(override or {})
+    return {**search_params, "params": params}
+
+
+def exact_top_k_ids(
+    queries,
+    batches: Iterable,
+    top_k: int,
+    metric_type: str = "IP",
+) -> List[List[Hashable]]:
+    """Brute force top-k ids of the queries over batches of (ids, vectors)
+
+    Args:
+        queries (array like): The query vectors, one per row.
+        batches (Iterable): (ids, vectors) pairs covering the whole collection.
+        top_k (int): The number of hits.
+        metric_type (str, optional): "IP", "COSINE" or "L2", as in the Milvus index.
+
+    Returns:
+        List[List[Hashable]]: The exact hit ids of each query, best first.
+    """
+    queries = np.asarray(queries, dtype=np.float32)
+    if metric_type == "COSINE":
+        # Clamped so a zero vector scores 0 instead of NaN
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+    best_scores = np.empty((len(queries), 0), dtype=np.float32)
+    best_ids = np.empty((len(queries), 0), dtype=object)
+    for ids, vectors in batches:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) == 0:
+            continue
+        if metric_type == "COSINE":
+            vectors = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        scores = queries @ vectors.T
+        if metric_type == "L2":
+            # Higher is better, so the negated squared distance without the constant |q|^2
+            scores = 2 * scores - (vectors**2).sum(axis=1)
+        # Merge the batch into the running top-k
+        scores = np.concatenate([best_scores, scores], axis=1)
+        ids = np.concatenate(
+            [best_ids, np.broadcast_to(np.asarray(ids, dtype=object), (len(queries), len(ids)))],
+            axis=1,
+        )
+        top = top_k_indices(scores, top_k)
+        best_scores = np.take_along_axis(scores, top, axis=1)
+        best_ids = np.take_along_axis(ids, top, axis=1)
+    return best_ids.tolist()
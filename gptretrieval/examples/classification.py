@@ -3,6 +3,7 @@ import sys
 
 sys.path.append("/Users/dtolley/Documents/Projects/gptretrieval")
 from gptretrieval.services import openai
+from gptretrieval.services.local_classifier import NearestCentroidClassifier
 from typing import List
 
 GPT_TOKEN_LENGTH = 4096
@@ -377,6 +378,19 @@ def select_partition(
     )
 
 
+def train_local_classifier(path: str = "question_classifier.npz"):
+    """Train the local question classifier from test_cases, load it with QUESTION_CLASSIFIER_PATH"""
+    classifier = NearestCentroidClassifier.from_examples(
+        test_cases, openai.get_embeddings
+    )
+    classifier.save(path)
+    for label, test_case in test_cases.items():
+        for case in test_case:
+            embedding = openai.get_embeddings([case["question"]])[0]
+            print(case["question"], label, classifier.predict(embedding))
+    return classifier
+
+
 # create a main entry point
 def main():
     # Test get_embeddings function
@@ -2,6 +2,8 @@ from pydantic import BaseModel
 from typing import List, Optional, Union, Dict
 from enum import Enum
 
+import numpy as np
+
 
 class Source(str, Enum):
     email = "email"
@@ -25,7 +27,11 @@ class DocumentChunk(BaseModel):
     id: Optional[str] = None
     text: str
     metadata: DocumentChunkMetadata
-    embedding: Optional[List[float]] = None
+    # A float32 np.ndarray row is kept as is when the datastore runs in array mode
+    embedding: Optional[Union[np.ndarray, List[float]]] = None
+
+    class Config:
+        arbitrary_types_allowed = True
 
 
 class DocumentChunkWithScore(DocumentChunk):
@@ -43,12 +49,14 @@ class DocumentWithChunks(Document):
 
 
 class DocumentMetadataFilter(BaseModel):
-    document_id: Optional[str] = None
-    source: Optional[Source] = None
-    source_id: Optional[str] = None
-    author: Optional[str] = None
+    # A list of values matches any of them
+    document_id: Optional[Union[str, List[str]]] = None
+    source: Optional[Union[Source, List[Source]]] = None
+    source_id: Optional[Union[str, List[str]]] = None
+    author: Optional[Union[str, List[str]]] = None
     start_date: Optional[str] = None  # any date string format
     end_date: Optional[str] = None  # any date string format
+    prefix: Optional[Dict[str, str]] = None  # field name -> prefix its value starts with
 
 
 class Query(BaseModel):
@@ -58,7 +66,27 @@ class Query(BaseModel):
 
 
 class QueryWithEmbedding(Query):
-    embedding: List[float]
+    embedding: Union[np.ndarray, List[float]]
+
+    class Config:
+        arbitrary_types_allowed = True
+
+
+class SearchOptions(BaseModel):
+    # Per request search settings, None keeps the datastore's own
+    ef: Optional[int] = None  # HNSW candidate list size
+    nprobe: Optional[int] = None  # IVF lists searched
+    consistency_level: Optional[str] = None  # "Strong", "Bounded", "Session" or "Eventually"
+    output_fields: Optional[List[str]] = None  # metadata fields returned with each hit
+    timeout: Optional[float] = None  # seconds
+
+    def index_params(self) -> Dict[str, int]:
+        """The index search params set, to merge into the Milvus search "params" """
+        return {
+            name: value
+            for name, value in (("ef", self.ef), ("nprobe", self.nprobe))
+            if value is not None
+        }
 
 
 class QueryResult(BaseModel):
@@ -0,0 +1,350 @@
+import hashlib
+import os
+import re
+import shelve
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .quantization import compress_vector, decompress_vector
+
+
+class LRUCache:
+    """A thread safe least recently used cache that evicts by total size.
+
+    Args:
+        max_size: The maximum total size of the cached values.
+        sizeof: Returns the size of a value, defaults to counting entries.
+        ttl: Seconds an entry stays valid, None keeps entries until they are evicted.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        sizeof: Callable[[Any], int] = None,
+        ttl: Optional[float] = None,
+    ):
+        self.max_size = max_size
+        self.sizeof = sizeof or (lambda value: 1)
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, Tuple[Any, int, Optional[float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """Return the cached value and mark it as recently used"""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[2] is not None and entry[2] < time.time():
+                # Expired, drop it
+                del self._data[key]
+                self.size -= entry[1]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, expires_at: Optional[float] = None) -> None:
+        """Cache a value, evicting the least recently used entries to make room
+
+        Args:
+            key: The key of the value.
+            value: The value to cache.
+            expires_at: The time.time() the entry expires at, defaults to now plus the ttl.
+        """
+        size = self.sizeof(value)
+        if size > self.max_size:
+            return
+        if expires_at is None and self.ttl is not None:
+            expires_at = time.time() + self.ttl
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= old[1]
+            self._data[key] = (value, size, expires_at)
+            self.size += size
+            while self.size > self.max_size:
+                _, (_, evicted, _) = self._data.popitem(last=False)
+                self.size -= evicted
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                return default
+            self.size -= entry[1]
+            return entry[0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters and current occupancy"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._data),
+            "size": self.size,
+        }
+
+
+class DiskEmbeddingStore:
+    """An append-only on-disk embedding store read through memory maps.
+
+    Vectors are appended to one raw float32 file per dimension and their keys to
+    an index file, so the store survives restarts without rewriting anything.
+    Only one process should write to a given directory.
+
+    Args:
+        path: The directory holding the store, created if missing.
+    """
+
+    INDEX_FILE = "index.txt"
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._index: Dict[str, Tuple[int, int]] = {}
+        self._rows: Dict[int, int] = {}
+        self._maps: Dict[int, np.memmap] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def _vectors_file(self, dim: int) -> str:
+        return os.path.join(self.path, f"vectors-{dim}.f32")
+
+    def _load(self):
+        index_file = os.path.join(self.path, self.INDEX_FILE)
+        if not os.path.exists(index_file):
+            return
+        with open(index_file) as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) != 3:
+                    continue
+                key, dim, row = parts[0], int(parts[1]), int(parts[2])
+                if dim not in self._rows:
+                    self._rows[dim] = self._count_rows(dim)
+                # Skip keys whose vector never made it to disk
+                if row < self._rows[dim]:
+                    self._index[key] = (dim, row)
+
+    def _count_rows(self, dim: int) -> int:
+        """Number of complete vectors on disk, dropping a partially written one"""
+        vectors_file = self._vectors_file(dim)
+        if not os.path.exists(vectors_file):
+            return 0
+        row_bytes = dim * np.dtype(np.float32).itemsize
+        size = os.path.getsize(vectors_file)
+        if size % row_bytes:
+            with open(vectors_file, "r+b") as f:
+                f.truncate(size - size % row_bytes)
+        return size // row_bytes
+
+    def _vectors(self, dim: int) -> np.memmap:
+        vectors = self._maps.get(dim)
+        rows = self._rows[dim]
+        # Remap once the file has grown past the current mapping
+        if vectors is None or vectors.shape[0] < rows:
+            vectors = np.memmap(
+                self._vectors_file(dim), dtype=np.float32, mode="r", shape=(rows, dim)
+            )
+            self._maps[dim] = vectors
+        return vectors
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                return None
+            dim, row = entry
+            return np.array(self._vectors(dim)[row])
+
+    def put_many(self, keys: Sequence[str], vectors: Sequence[np.ndarray]) -> None:
+        with self._lock:
+            lines = []
+            for key, vector in zip(keys, vectors):
+                if key in self._index:
+                    continue
+                vector = np.asarray(vector, dtype=np.float32).ravel()
+                dim = vector.shape[0]
+                if dim not in self._rows:
+                    self._rows[dim] = self._count_rows(dim)
+                # The vector is written before its key so the index never points past the data
+                with open(self._vectors_file(dim), "ab") as f:
+                    f.write(vector.tobytes())
+                row = self._rows[dim]
+                self._rows[dim] = row + 1
+                self._index[key] = (dim, row)
+                lines.append(f"{key} {dim} {row}\n")
+            if lines:
+                with open(os.path.join(self.path, self.INDEX_FILE), "a") as f:
+                    f.writelines(lines)
+
+
+class EmbeddingCache:
+    """A content addressed embedding cache keyed by (model name, text hash).
+
+    Embeddings are held as float32 arrays in an in-process LRU tier bounded by
+    max_bytes, backed by an optional DiskEmbeddingStore that survives restarts.
+    With quantize, the in-process tier holds them as 8-bit codes instead, fitting
+    about 4x as many in the same budget at a small loss of precision.
+
+    Args:
+        max_bytes: The size of the in-process tier, 0 disables it.
+        path: The directory of the on-disk tier, None disables it.
+        quantize: Hold the in-process tier as SQ8 codes.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 256 * 1024 * 1024,
+        path: Optional[str] = None,
+        quantize: bool = False,
+    ):
+        self.quantize = quantize
+        self.memory = LRUCache(
+            max_bytes,
+            sizeof=lambda entry: entry[0].nbytes + 16 if quantize else entry.nbytes,
+        )
+        self.disk = DiskEmbeddingStore(path) if path else None
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        """Hash the model name and the exact text sent to the API, which embeds any difference"""
+        return hashlib.sha256(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, model: str, texts: Sequence[str]) -> List[Optional[np.ndarray]]:
+        """Look up the embeddings of the texts, None for the ones not cached"""
+        embeddings = []
+        for text in texts:
+            key = self.make_key(model, text)
+            embedding = self._get_memory(key)
+            if embedding is None and self.disk is not None:
+                embedding = self.disk.get(key)
+                if embedding is not None:
+                    # Promote to the in-process tier
+                    self._put_memory(key, embedding)
+            if embedding is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            embeddings.append(embedding)
+        return embeddings
+
+    def put_many(self, model: str, texts: Sequence[str], embeddings: Sequence) -> None:
+        keys = [self.make_key(model, text) for text in texts]
+        vectors = [np.asarray(e, dtype=np.float32) for e in embeddings]
+        for key, vector in zip(keys, vectors):
+            self._put_memory(key, vector)
+        if self.disk is not None:
+            self.disk.put_many(keys, vectors)
+
+    def _get_memory(self, key: str) -> Optional[np.ndarray]:
+        entry = self.memory.get(key)
+        if entry is not None and self.quantize:
+            return decompress_vector(*entry)
+        return entry
+
+    def _put_memory(self, key: str, vector: np.ndarray):
+        self.memory.put(key, compress_vector(vector) if self.quantize else vector)
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters of the cache and occupancy of each tier"""
+        stats = {
+            "hits": self.hits,
+            "misses": self.misses,
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory.size,
+        }
+        if self.disk is not None:
+            stats["disk_entries"] = len(self.disk)
+        return stats
+
+
+def normalize_question(question: str) -> str:
+    """Lower case, collapse whitespace and drop trailing punctuation so near-identical questions match"""
+    question = unicodedata.normalize("NFC", question).lower()
+    return re.sub(r"\s+", " ", question).strip().rstrip("?!. ")
+
+
+class ResultCache:
+    """A TTL + LRU cache of small picklable results, such as GPT classifications.
+
+    Results are held in an in-process LRUCache, backed by an optional shelve file
+    so they survive restarts. Expired entries are dropped from both tiers on read.
+
+    Args:
+        max_entries: The number of results held in memory.
+        ttl: Seconds a result stays valid, None keeps results until they are evicted.
+        path: The shelve file of the persistent tier, None disables it.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        ttl: Optional[float] = None,
+        path: Optional[str] = None,
+    ):
+        self.memory = LRUCache(max_entries, ttl=ttl)
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._shelf = shelve.open(path) if path else None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        return hashlib.sha256("\0".join(map(str, parts)).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Any:
+        """Return the cached result, None if it is missing or expired"""
+        value = self.memory.get(key)
+        if value is None and self._shelf is not None:
+            with self._lock:
+                entry = self._shelf.get(key)
+                if entry is not None and entry[0] is not None and entry[0] < time.time():
+                    del self._shelf[key]
+                    entry = None
+            if entry is not None:
+                expires_at, value = entry
+                # Promote to the in-process tier
+                self.memory.put(key, value, expires_at=expires_at)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        expires_at = None if self.ttl is None else time.time() + self.ttl
+        self.memory.put(key, value, expires_at=expires_at)
+        if self._shelf is not None:
+            with self._lock:
+                self._shelf[key] = (expires_at, value)
+
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss counters of the cache and occupancy of the in-process tier"""
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self.memory)}
@@ -1,10 +1,29 @@
+import json
 import os
 from . import openai
+from .cache import ResultCache, normalize_question
 from typing import List
 
 # get gpt model env variable, or set default
 GPT_MODEL = os.getenv("GPT_MODEL", "gpt-4")
 
+# Number of question classifications / partition selections kept in memory, 0 disables caching
+CLASSIFICATION_CACHE_SIZE = int(os.getenv("CLASSIFICATION_CACHE_SIZE", "10000"))
+# Seconds a cached result stays valid
+CLASSIFICATION_CACHE_TTL = float(os.getenv("CLASSIFICATION_CACHE_TTL", "86400"))
+# Shelve file persisting the cached results across restarts, unset keeps them in memory only
+CLASSIFICATION_CACHE_PATH = os.getenv("CLASSIFICATION_CACHE_PATH")
+
+classification_cache = (
+    ResultCache(
+        max_entries=CLASSIFICATION_CACHE_SIZE,
+        ttl=CLASSIFICATION_CACHE_TTL,
+        path=CLASSIFICATION_CACHE_PATH,
+    )
+    if CLASSIFICATION_CACHE_SIZE > 0
+    else None
+)
+
 
 labels_dict = {
     0: {
@@ -74,10 +93,40 @@ def create_prompt_for_gpt(labels_dict):
 prompt_text = create_prompt_for_gpt(labels_dict)
 
 
+def _cached(name: str, model: str, question: str, context: str, compute):
+    """
+    Return the cached result of a GPT call about a question, or compute and cache it.
+
+    The key is (name, model, normalized question, hash of the label or partition set
+    in context), so a changed prompt never reuses stale results.
+    """
+    if classification_cache is None:
+        return compute()
+    key = ResultCache.make_key(
+        name, model, normalize_question(question), ResultCache.make_key(context)
+    )
+    result = classification_cache.get(key)
+    if result is None:
+        result = compute()
+        # Only cache parsed function calls, not raw responses
+        if isinstance(result, (dict, list)):
+            classification_cache.put(key, result)
+    return result
+
+
 def classify_question(question: str, model=GPT_MODEL, token_length=4096):
-    """Call OpenAI to classify the given question."""
+    """Call OpenAI to classify the given question, results are cached in classification_cache."""
     question = question[:token_length]
+    return _cached(
+        "classify_question",
+        model,
+        question,
+        prompt_text,
+        lambda: _classify_question(question, model),
+    )
+
 
+def _classify_question(question: str, model: str):
     messages = [
         {
             "role": "system",
@@ -180,9 +229,20 @@ def select_partition(
 
         type : { name of partition , description of partition}
         the type is what is used by tree sitter to parse the code so we do not need to worry about that
+
+    Results are cached in classification_cache.
     """
     question = question[:token_length]
+    return _cached(
+        "select_partition",
+        model,
+        question,
+        json.dumps(partitions, sort_keys=True),
+        lambda: _select_partition(question, partitions, model),
+    )
+
 
+def _select_partition(question: str, partitions, model: str):
     partition_text = "The following are the partitions available.\n"
     for _, value in partitions.items():
         partition_text += f"Partition Name: {value['name']}, Partition Description: {value['description']}\n"
@@ -0,0 +1,602 @@
+import functools
+import hashlib
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from ..models.models import DocumentChunk, DocumentChunkMetadata, DocumentMetadataFilter
+
+# Maximum characters per chunk, larger definitions are split
+CHUNK_MAX_CHARS = int(os.getenv("CHUNK_MAX_CHARS", "4000"))
+# Chunks shorter than this are merged into the previous chunk of the file
+CHUNK_MIN_CHARS = int(os.getenv("CHUNK_MIN_CHARS", "100"))
+# Lines repeated at the start of the next piece when a chunk is split
+CHUNK_OVERLAP_LINES = int(os.getenv("CHUNK_OVERLAP_LINES", "5"))
+# Files larger than this are skipped, they are almost always generated
+CHUNK_MAX_FILE_BYTES = int(os.getenv("CHUNK_MAX_FILE_BYTES", str(1024 * 1024)))
+# Processes chunking files in parallel, 0 uses every core and 1 chunks in the calling process
+CHUNK_WORKERS = int(os.getenv("CHUNK_WORKERS", "0"))
+
+# File extension to language, docs are chunked by lines without a parser
+LANGUAGES = {
+    ".py": "python",
+    ".c": "c",
+    ".h": "cpp",
+    ".cc": "cpp",
+    ".cpp": "cpp",
+    ".cxx": "cpp",
+    ".hh": "cpp",
+    ".hpp": "cpp",
+    ".java": "java",
+    ".js": "javascript",
+    ".jsx": "javascript",
+    ".ts": "typescript",
+    ".go": "go",
+    ".rs": "rust",
+    ".md": "docs",
+    ".rst": "docs",
+    ".txt": "docs",
+}
+
+# Language to partition, in the format taken by classification.select_partition
+PARTITIONS = {
+    "python": {"name": "pythoncode", "description": "Python code"},
+    "c": {"name": "ccode", "description": "C code"},
+    "cpp": {"name": "cppcode", "description": "C++ code"},
+    "java": {"name": "javacode", "description": "Java code"},
+    "javascript": {"name": "javascriptcode", "description": "JavaScript code"},
+    "typescript": {"name": "typescriptcode", "description": "TypeScript code"},
+    "go": {"name": "gocode", "description": "Go code"},
+    "rust": {"name": "rustcode", "description": "Rust code"},
+    "docs": {"name": "docs", "description": "Documentation"},
+}
+
+# The tree-sitter node types chunked on their own, and the kind of chunk they make
+DEFINITIONS = {
+    "python": {
+        "function_definition": "function",
+        "class_definition": "class",
+        "decorated_definition": None,  # the kind of the decorated definition
+    },
+    "c": {"function_definition": "function", "struct_specifier": "class"},
+    "cpp": {
+        "function_definition": "function",
+        "class_specifier": "class",
+        "struct_specifier": "class",
+    },
+    "java": {
+        "method_declaration": "function",
+        "constructor_declaration": "function",
+        "class_declaration": "class",
+        "interface_declaration": "class",
+        "enum_declaration": "class",
+    },
+    "javascript": {
+        "function_declaration": "function",
+        "generator_function_declaration": "function",
+        "method_definition": "function",
+        "class_declaration": "class",
+    },
+    "typescript": {
+        "function_declaration": "function",
+        "method_definition": "function",
+        "class_declaration": "class",
+        "interface_declaration": "class",
+    },
+    "go": {
+        "function_declaration": "function",
+        "method_declaration": "function",
+        "type_declaration": "class",
+    },
+    "rust": {
+        "function_item": "function",
+        "impl_item": "class",
+        "trait_item": "class",
+        "struct_item": "class",
+        "enum_item": "class",
+        "mod_item": "class",
+    },
+}
+
+# Directories never worth indexing
+SKIP_DIRS = {".git", "node_modules", "__pycache__", "venv", ".venv", "build", "dist"}
+
+# tree-sitter parsers of this process, by language, None when tree-sitter is missing
+_parsers: Dict[str, object] = {}
+
+
+def _parser(language: str):
+    if language not in _parsers:
+        try:
+            from tree_sitter_languages import get_parser
+
+            _parsers[language] = get_parser(language)
+        except ImportError:
+            print("tree_sitter_languages is not installed, chunking code by lines")
+            _parsers[language] = None
+    return _parsers[language]
+
+
+def list_files(root: str, languages: Optional[Iterable[str]] = None) -> List[str]:
+    """
+    The files under root in a supported language, in a stable order.
+
+    Args:
+        root: The directory to walk, hidden and vendored directories are skipped.
+        languages: Only list these languages, defaults to all of LANGUAGES.
+
+    Returns:
+        The paths, relative to root.
+    """
+    languages = set(languages or LANGUAGES.values())
+    paths = []
+    for directory, dirs, files in os.walk(root):
+        dirs[:] = sorted(d for d in dirs if d not in SKIP_DIRS and not d.startswith("."))
+        for name in sorted(files):
+            if LANGUAGES.get(os.path.splitext(name)[1].lower()) in languages:
+                paths.append(os.path.relpath(os.path.join(directory, name), root))
+    return paths
+
+
+def chunk_source(
+    source: str,
+    language: str,
+    max_chars: int = CHUNK_MAX_CHARS,
+    min_chars: int = CHUNK_MIN_CHARS,
+    overlap_lines: int = CHUNK_OVERLAP_LINES,
+) -> List[Dict]:
+    """
+    Split the source of one file into function, class and module chunks.
+
+    Every definition becomes a chunk. The code between definitions (imports,
+    constants, top-level statements) is gathered into module chunks. A class larger
+    than max_chars is chunked by its methods, and anything else larger than max_chars
+    is split into pieces of whole lines overlapping by overlap_lines. Without a
+    parser for the language the whole file is split by lines.
+
+    Args:
+        source: The content of the file.
+        language: The language of the file, a key of PARTITIONS.
+        max_chars: The maximum number of characters of a chunk.
+        min_chars: Chunks shorter than this are merged into the previous one of their kind.
+        overlap_lines: The lines shared by consecutive pieces of a split chunk.
+
+    Returns:
+        The chunks, as dicts with text, kind, symbol, start_line and end_line (1-based).
+    """
+    parser = _parser(language) if language in DEFINITIONS else None
+    if parser is None:
+        return _merge_small(
+            _split_lines(source, 1, "module", "", max_chars, overlap_lines),
+            min_chars,
+            max_chars,
+        )
+    data = source.encode("utf-8")
+    chunker = _TreeChunker(data, DEFINITIONS[language], max_chars, overlap_lines)
+    tree = parser.parse(data)
+    chunks = chunker.region(tree.root_node, "module", "")
+    chunks.sort(key=lambda chunk: chunk["start_line"])
+    return _merge_small(chunks, min_chars, max_chars)
+
+
+class _TreeChunker:
+    """Chunks a parsed file, see chunk_source"""
+
+    def __init__(self, data: bytes, definitions: Dict, max_chars: int, overlap_lines: int):
+        self.data = data
+        self.definitions = definitions
+        self.max_chars = max_chars
+        self.overlap_lines = overlap_lines
+
+    def text(self, start: int, end: int) -> str:
+        return self.data[start:end].decode("utf-8", errors="replace")
+
+    def nested(self, node) -> list:
+        """The outermost definitions below node"""
+        found, stack = [], list(reversed(node.children))
+        while stack:
+            child = stack.pop()
+            if child.type in self.definitions:
+                found.append(child)
+            else:
+                stack.extend(reversed(child.children))
+        return found
+
+    def kind(self, node) -> str:
+        kind = self.definitions[node.type]
+        if kind is None:
+            inner = node.child_by_field_name("definition")
+            kind = self.definitions.get(inner.type) if inner is not None else None
+        return kind or "function"
+
+    def name(self, node) -> str:
+        """The name of a definition, looked up through wrappers and declarators"""
+        for _ in range(4):
+            named = node.child_by_field_name("name")
+            if named is not None:
+                return self.text(named.start_byte, named.end_byte)
+            inner = None
+            for field in ("definition", "declarator", "type"):
+                inner = node.child_by_field_name(field)
+                if inner is not None:
+                    break
+            if inner is None:
+                inner = next(
+                    (c for c in node.named_children if c.type.endswith("spec")), None
+                )
+            if inner is None:
+                break
+            if inner.type in ("identifier", "type_identifier", "field_identifier"):
+                return self.text(inner.start_byte, inner.end_byte)
+            node = inner
+        return ""
+
+    def region(self, node, kind: str, symbol: str) -> List[Dict]:
+        """Chunk the definitions below node, and gather the code between them into kind chunks"""
+        chunks: List[Dict] = []
+        gaps: List[Dict] = []
+        position = node.start_byte
+        line = node.start_point[0]
+
+        def add_gap(start: int, end: int, start_line: int):
+            lines = self.text(start, end).split("\n")
+            # Trim the blank lines around the code so line numbers point at it
+            first = next((i for i, l in enumerate(lines) if l.strip()), None)
+            if first is None:
+                return
+            last = max(i for i, l in enumerate(lines) if l.strip())
+            start_line += first
+            text = "\n".join(lines[first : last + 1])
+            gaps.append(
+                {
+                    "text": text,
+                    "kind": kind,
+                    "symbol": symbol,
+                    "start_line": start_line + 1,
+                    "end_line": start_line + text.count("\n") + 1,
+                }
+            )
+
+        for definition in self.nested(node):
+            add_gap(position, definition.start_byte, line)
+            chunks.extend(self.definition(definition, symbol))
+            position, line = definition.end_byte, definition.end_point[0]
+        add_gap(position, node.end_byte, line)
+        return self.gather(gaps) + chunks
+
+    def gather(self, gaps: List[Dict]) -> List[Dict]:
+        """Join the code between definitions into as few chunks of at most max_chars as possible"""
+        chunks: List[Dict] = []
+        for gap in gaps:
+            if len(gap["text"]) > self.max_chars:
+                chunks.extend(
+                    _split_lines(
+                        gap["text"],
+                        gap["start_line"],
+                        gap["kind"],
+                        gap["symbol"],
+                        self.max_chars,
+                        self.overlap_lines,
+                    )
+                )
+            elif (
+                chunks
+                and chunks[-1]["kind"] == gap["kind"]
+                and len(chunks[-1]["text"]) + len(gap["text"]) + 1 <= self.max_chars
+            ):
+                chunks[-1]["text"] += "\n" + gap["text"]
+                chunks[-1]["end_line"] = gap["end_line"]
+            else:
+                chunks.append(dict(gap))
+        return chunks
+
+    def definition(self, node, parent: str) -> List[Dict]:
+        kind = self.kind(node)
+        name = self.name(node)
+        symbol = f"{parent}.{name}" if parent and name else name or parent
+        text = self.text(node.start_byte, node.end_byte)
+        start_line = node.start_point[0] + 1
+        if len(text) <= self.max_chars:
+            return [
+                {
+                    "text": text,
+                    "kind": kind,
+                    "symbol": symbol,
+                    "start_line": start_line,
+                    "end_line": node.end_point[0] + 1,
+                }
+            ]
+        if kind == "class" and self.nested(node):
+            # The class header and attributes, then each method on its own
+            return self.region(node, "class", symbol)
+        return _split_lines(text, start_line, kind, symbol, self.max_chars, self.overlap_lines)
+
+
+def _split_lines(
+    text: str, start_line: int, kind: str, symbol: str, max_chars: int, overlap_lines: int
+) -> List[Dict]:
+    """Split text into pieces of whole lines of at most max_chars, overlapping by overlap_lines"""
+    lines = text.split("\n")
+    chunks = []
+    first = 0
+    while first < len(lines):
+        last, size = first, 0
+        while last < len(lines) and (last == first or size + len(lines[last]) + 1 <= max_chars):
+            size += len(lines[last]) + 1
+            last += 1
+        piece = "\n".join(lines[first:last])[:max_chars]
+        if piece.strip():
+            chunks.append(
+                {
+                    "text": piece,
+                    "kind": kind,
+                    "symbol": symbol,
+                    "start_line": start_line + first,
+                    "end_line": start_line + last - 1,
+                }
+            )
+        if last >= len(lines):
+            break
+        first = max(last - overlap_lines, first + 1)
+    return chunks
+
+
+def _merge_small(chunks: List[Dict], min_chars: int, max_chars: int) -> List[Dict]:
+    """Merge each chunk shorter than min_chars into the previous one of its kind, when it follows it and fits"""
+    merged: List[Dict] = []
+    for chunk in chunks:
+        if (
+            merged
+            and len(chunk["text"]) < min_chars
+            and chunk["kind"] == merged[-1]["kind"]
+            and chunk["start_line"] <= merged[-1]["end_line"] + 2
+            and len(merged[-1]["text"]) + len(chunk["text"]) + 1 <= max_chars
+        ):
+            merged[-1]["text"] += "\n" + chunk["text"]
+            merged[-1]["end_line"] = max(merged[-1]["end_line"], chunk["end_line"])
+        else:
+            merged.append(chunk)
+    return merged
+
+
+def chunk_file(
+    root: str,
+    path: str,
+    previous_digest: Optional[str] = None,
+    max_chars: int = CHUNK_MAX_CHARS,
+    min_chars: int = CHUNK_MIN_CHARS,
+    overlap_lines: int = CHUNK_OVERLAP_LINES,
+) -> Tuple[str, Optional[str], List[Dict]]:
+    """
+    Chunk one file into insert-ready rows.
+
+    Args:
+        root: The root of the repository.
+        path: The path of the file, relative to root, stored as the document_id of its rows.
+        previous_digest: The digest of the file when it was last chunked, unchanged files are skipped.
+        max_chars: See chunk_source.
+        min_chars: See chunk_source.
+        overlap_lines: See chunk_source.
+
+    Returns:
+        The path, the digest of its content (None if the file was skipped) and its rows,
+        empty when the file is unchanged. Rows have the fields of the Milvus schema, but
+        the embedding, and the partition of their language.
+    """
+    full_path = os.path.join(root, path)
+    try:
+        if os.path.getsize(full_path) > CHUNK_MAX_FILE_BYTES:
+            return path, None, []
+        with open(full_path, "rb") as f:
+            data = f.read()
+        created_at = int(os.path.getmtime(full_path))
+    except OSError as e:
+        print(f"Failed to read {full_path}, error: {e}")
+        return path, None, []
+    if b"\0" in data[:8192]:
+        # Binary
+        return path, None, []
+    digest = hashlib.sha256(data).hexdigest()
+    if digest == previous_digest:
+        return path, digest, []
+
+    language = LANGUAGES[os.path.splitext(path)[1].lower()]
+    source = data.decode("utf-8", errors="replace")
+    document_id = path.replace(os.sep, "/")
+    rows = []
+    for chunk in chunk_source(source, language, max_chars, min_chars, overlap_lines):
+        symbol = chunk["symbol"]
+        rows.append(
+            {
+                # Stable across runs, so re-chunking an unchanged definition gives the same id
+                "id": hashlib.sha256(
+                    f"{document_id}\0{symbol}\0{chunk['text']}".encode("utf-8")
+                ).hexdigest()[:32],
+                "text": chunk["text"],
+                "document_id": document_id,
+                "source_id": f"{document_id}::{symbol}" if symbol else document_id,
+                "source": "file",
+                "url": f"{document_id}#L{chunk['start_line']}-L{chunk['end_line']}",
+                "created_at": created_at,
+                "partition": PARTITIONS[language]["name"],
+            }
+        )
+    return path, digest, rows
+
+
+def _bounded_map(executor, fn, items: Iterable, window: int) -> Iterator:
+    """executor.map that keeps at most window items in flight, so results are not buffered unboundedly"""
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def iter_file_chunks(
+    root: str,
+    paths: Optional[Iterable[str]] = None,
+    digests: Optional[Dict[str, str]] = None,
+    workers: int = CHUNK_WORKERS,
+    **options,
+) -> Iterator[Tuple[str, Optional[str], List[Dict]]]:
+    """
+    Chunk files in parallel, yielding (path, digest, rows) per file in order.
+
+    Args:
+        root: The root of the repository.
+        paths: The files to chunk, relative to root, defaults to list_files(root).
+        digests: The digests of the files when they were last chunked, to skip the unchanged ones.
+        workers: The number of processes, 0 uses every core and 1 chunks in this process.
+        options: max_chars, min_chars and overlap_lines, see chunk_source.
+    """
+    paths = list_files(root) if paths is None else paths
+    digests = digests or {}
+
+    def task(path: str):
+        return path, digests.get(path)
+
+    if workers == 1:
+        for path in paths:
+            yield chunk_file(root, path, digests.get(path), **options)
+        return
+    workers = workers or os.cpu_count() or 1
+    fn = functools.partial(_chunk_task, root, options)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from _bounded_map(executor, fn, map(task, paths), window=4 * workers)
+
+
+def _chunk_task(root: str, options: Dict, task: Tuple[str, Optional[str]]):
+    path, previous_digest = task
+    return chunk_file(root, path, previous_digest, **options)
+
+
+def iter_chunks(root: str, **kwargs) -> Iterator[DocumentChunk]:
+    """
+    Stream the chunks of a repository as DocumentChunks.
+
+    Args:
+        root: The root of the repository.
+        kwargs: See iter_file_chunks.
+    """
+    for _, _, rows in iter_file_chunks(root, **kwargs):
+        for row in rows:
+            yield DocumentChunk(
+                id=row["id"],
+                text=row["text"],
+                metadata=DocumentChunkMetadata(
+                    document_id=row["document_id"],
+                    source_id=row["source_id"],
+                    source=row["source"],
+                    url=row["url"],
+                    created_at=row["created_at"],
+                ),
+            )
+
+
+def ingest_repository(
+    datastore,
+    root: str,
+    manifest_path: Optional[str] = None,
+    languages: Optional[Iterable[str]] = None,
+    batch_size: int = 256,
+    **kwargs,
+) -> Dict[str, int]:
+    """
+    Chunk a repository and insert each language into its partition.
+
+    With a manifest only the files changed since the last run are chunked; the old
+    chunks of changed and removed files are deleted first, by document_id, so the
+    datastore matches the tree. Files that can no longer be chunked (too large,
+    binary or unreadable) count as removed. All the files are chunked by one pool
+    and their rows are routed to the partition of their language in batches.
+
+    Args:
+        datastore: The datastore to insert into.
+        root: The root of the repository.
+        manifest_path: A JSON file of the file digests of the last run, updated at the end.
+        languages: Only ingest these languages, defaults to all of them. The other
+            languages are left as they are, in the datastore and in the manifest.
+        batch_size: The number of rows of a partition inserted at once.
+        kwargs: See iter_file_chunks.
+
+    Returns:
+        Dict[str, int]: The number of files chunked, skipped as unchanged and removed, and of rows.
+    """
+    previous: Dict[str, str] = {}
+    if manifest_path and os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            previous = json.load(f)
+    selected = set(languages or LANGUAGES.values())
+    paths = list_files(root, selected)
+    # Only the selected languages can be removed, the others were not looked at
+    removed = {p for p in previous if _language(p) in selected} - set(paths)
+    stats = {"files": 0, "unchanged": 0, "removed": 0, "rows": 0}
+    digests = {p: d for p, d in previous.items() if _language(p) not in selected}
+    batches: Dict[str, List[Dict]] = {}
+
+    for path, digest, file_rows in iter_file_chunks(root, paths, digests=previous, **kwargs):
+        if digest is None:
+            if path in previous:
+                removed.add(path)
+            continue
+        digests[path] = digest
+        if digest == previous.get(path):
+            stats["unchanged"] += 1
+            continue
+        stats["files"] += 1
+        partition = PARTITIONS[_language(path)]["name"]
+        if path in previous:
+            _delete_document(datastore, path, partition)
+        stats["rows"] += len(file_rows)
+        batch = batches.setdefault(partition, [])
+        batch.extend(file_rows)
+        if len(batch) >= batch_size:
+            _insert_rows(datastore, batch, partition)
+            batches[partition] = []
+    for partition, batch in batches.items():
+        if batch:
+            _insert_rows(datastore, batch, partition)
+
+    for path in sorted(removed):
+        language = _language(path)
+        _delete_document(datastore, path, PARTITIONS[language]["name"] if language else None)
+    stats["removed"] = len(removed)
+    if manifest_path:
+        with open(manifest_path, "w") as f:
+            json.dump(digests, f, indent=2, sort_keys=True)
+    print(
+        "Chunked {files} files into {rows} rows, {unchanged} unchanged, {removed} removed".format(
+            **stats
+        )
+    )
+    return stats
+
+
+def _language(path: str) -> Optional[str]:
+    return LANGUAGES.get(os.path.splitext(path)[1].lower())
+
+
+def _delete_document(datastore, path: str, partition: Optional[str]):
+    datastore.delete(
+        filter=DocumentMetadataFilter(document_id=path.replace(os.sep, "/")),
+        partition=partition,
+    )
+
+
+def _insert_rows(datastore, rows: List[Dict], partition: str):
+    if hasattr(datastore, "insert_stream"):
+        datastore.insert_stream(rows, partition=partition)
+    else:
+        datastore.insert(rows, partition=partition)
+
+
+if __name__ == "__main__":
+    # Chunk this package and print a summary of the chunks
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    for path, _, rows in iter_file_chunks(root):
+        print(path, len(rows), [row["source_id"] for row in rows][:5])
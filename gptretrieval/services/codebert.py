@@ -1,46 +1,106 @@
-from transformers import RobertaModel, RobertaTokenizer
-import torch
-from typing import List
+import numpy as np
+import threading
+from typing import TYPE_CHECKING, List
 import os
 
-model_dir = os.getenv("TRANSFORMERS_MODEL_DIR")
+if TYPE_CHECKING:
+    import torch
 
-device = torch.device(
-    "cuda"
-    if torch.cuda.is_available()
-    else ("mps" if torch.backends.mps.is_available() else "cpu")
-)
+model_dir = os.getenv("TRANSFORMERS_MODEL_DIR")
+# Number of texts run through the model at once
+BATCH_SIZE = int(os.getenv("CODEBERT_BATCH_SIZE", "32"))
+MAX_LENGTH = 512
 
-# Load the CodeBERT model and tokenizer
 model_name = "microsoft/codebert-base"
-if model_dir:
-    print(f"Loading from local disk {model_dir}")
-    tokenizer = RobertaTokenizer.from_pretrained(model_dir, local_files_only=True)
-    model = RobertaModel.from_pretrained(model_dir, local_files_only=True)
-else:
-    print("Loading from Huggyface")
-    tokenizer = RobertaTokenizer.from_pretrained(model_name)
-    model = RobertaModel.from_pretrained(model_name).to(device)
+# Size of the embeddings, the hidden size of the model
+EMBEDDING_DIM = 768
+
+# Loaded on first use by load_model, so importing this module does not import torch
+_tokenizer = None
+_model = None
+_device = None
+_lock = threading.Lock()
+
+
+def load_model():
+    """
+    Load the CodeBERT model and tokenizer, once, on the first call.
+
+    Returns:
+        The tokenizer, the model and the device the model runs on.
+    """
+    global _tokenizer, _model, _device
+    with _lock:
+        if _model is None:
+            import torch
+            from transformers import RobertaModel, RobertaTokenizer
 
+            device = torch.device(
+                "cuda"
+                if torch.cuda.is_available()
+                else ("mps" if torch.backends.mps.is_available() else "cpu")
+            )
+            if model_dir:
+                print(f"Loading from local disk {model_dir}")
+                tokenizer = RobertaTokenizer.from_pretrained(model_dir, local_files_only=True)
+                model = RobertaModel.from_pretrained(model_dir, local_files_only=True)
+            else:
+                print("Loading from Huggyface")
+                tokenizer = RobertaTokenizer.from_pretrained(model_name)
+                model = RobertaModel.from_pretrained(model_name)
+            _tokenizer, _model, _device = tokenizer, model.to(device), device
+    return _tokenizer, _model, _device
 
-def get_embeddings(texts: List[str]) -> List[List[float]]:
+
+def warmup():
+    """Load the model now rather than on the first get_embeddings call"""
+    load_model()
+
+
+def __getattr__(name):
+    # Keep codebert.model, codebert.tokenizer and codebert.device working, loading on access
+    if name in ("tokenizer", "model", "device"):
+        return dict(zip(("tokenizer", "model", "device"), load_model()))[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_embeddings(
+    texts: List[str], batch_size: int = BATCH_SIZE, as_array: bool = False
+):
     """
-    Embed texts using either OpenAI's ada model or CodeBERT.
+    Embed texts using CodeBERT.
+
+    Texts are sorted by token length so each batch pads to similar lengths, and
+    restored to their original order afterwards.
 
     Args:
         texts: The list of texts to embed.
-        use_openai: If True, use OpenAI's ada model. Otherwise, use CodeBERT.
+        batch_size: The number of texts run through the model at once.
+        as_array: If True, return a float32 numpy matrix instead of nested lists.
 
     Returns:
-        A list of embeddings, each of which is a list of floats.
+        A list of embeddings, each of which is a list of floats, or a (len(texts), dim) matrix.
     """
+    import torch
+
     if isinstance(texts, str):
         texts = [texts]
+    tokenizer, model, device = load_model()
 
-    embeddings = []
-    for text in texts:
-        # Tokenize the text
-        inputs = tokenizer(text, return_tensors="pt", truncation=True, max_length=512)
+    # Tokenize everything once, padding is added per batch
+    encodings = tokenizer(texts, truncation=True, max_length=MAX_LENGTH)
+    order = sorted(range(len(texts)), key=lambda i: len(encodings["input_ids"][i]))
+
+    embeddings = np.empty((len(texts), model.config.hidden_size), dtype=np.float32)
+    for start in range(0, len(order), batch_size):
+        batch = order[start : start + batch_size]
+        inputs = tokenizer.pad(
+            {
+                "input_ids": [encodings["input_ids"][i] for i in batch],
+                "attention_mask": [encodings["attention_mask"][i] for i in batch],
+            },
+            return_tensors="pt",
+        )
         # Move the inputs to the device
         inputs = {name: tensor.to(device) for name, tensor in inputs.items()}
 
@@ -48,12 +108,20 @@ def get_embeddings(texts: List[str]) -> List[List[float]]:
         with torch.no_grad():
             outputs = model(**inputs)
 
-        # The embeddings are the average of the token embeddings
-        embedding = outputs.last_hidden_state.mean(dim=1).cpu().numpy().tolist()
+        pooled = mean_pool(outputs.last_hidden_state, inputs["attention_mask"])
+        # Scatter the batch back to the original order
+        embeddings[batch] = pooled.float().cpu().numpy()
+
+    return embeddings if as_array else embeddings.tolist()
 
-        embeddings.append(embedding[0])
 
-    return embeddings
+def mean_pool(
+    last_hidden_state: "torch.Tensor", attention_mask: "torch.Tensor"
+) -> "torch.Tensor":
+    """The average of the token embeddings, ignoring padding tokens"""
+    mask = attention_mask.unsqueeze(-1).to(last_hidden_state.dtype)
+    summed = (last_hidden_state * mask).sum(dim=1)
+    return summed / mask.sum(dim=1).clamp(min=1e-9)
 
 
 # setup a main function so we can run this file to test the code
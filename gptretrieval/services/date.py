@@ -1,22 +1,59 @@
-import arrow
+import functools
+import os
+import re
+from datetime import datetime, timezone
 
+# Number of recently converted date strings to memoize
+DATE_CACHE_SIZE = int(os.getenv("DATE_CACHE_SIZE", "1024"))
 
+_EPOCH = re.compile(r"^[+-]?\d+(\.\d+)?$")
+# Digit-only strings that are ISO-8601 dates rather than epoch seconds: a year or YYYYMMDD
+_ISO_DIGITS = {4: "%Y", 8: "%Y%m%d"}
+
+
+@functools.lru_cache(maxsize=DATE_CACHE_SIZE)
 def to_unix_timestamp(date_str: str) -> int:
     """
     Convert a date string to a unix timestamp (seconds since epoch).
 
+    Epoch seconds and ISO-8601 strings are parsed directly, dates without a timezone
+    are taken as UTC. Four and eight digit strings are read as a year and as YYYYMMDD,
+    not as epoch seconds. Other formats fall back to arrow, imported on first use.
+
     Args:
         date_str: The date string to convert.
 
     Returns:
         The unix timestamp corresponding to the date string.
 
-    If the date string cannot be parsed as a valid date format, returns the current unix timestamp and prints a warning.
+    Raises:
+        ValueError: If the date string cannot be parsed as a valid date format.
     """
-    # Try to parse the date string using arrow, which supports many common date formats
+    if isinstance(date_str, (int, float)):
+        return int(date_str)
+    value = str(date_str).strip()
+
+    if value.isdigit() and len(value) in _ISO_DIGITS:
+        date_obj = datetime.strptime(value, _ISO_DIGITS[len(value)])
+        return int(date_obj.replace(tzinfo=timezone.utc).timestamp())
+    if _EPOCH.match(value):
+        return int(float(value))
+
     try:
-        date_obj = arrow.get(date_str)
+        # fromisoformat only accepts a trailing Z from python 3.11
+        if value[-1:] in ("Z", "z"):
+            value = value[:-1] + "+00:00"
+        date_obj = datetime.fromisoformat(value)
+        if date_obj.tzinfo is None:
+            date_obj = date_obj.replace(tzinfo=timezone.utc)
         return int(date_obj.timestamp())
-    except arrow.parser.ParserError:
-        # If the parsing fails, return the current unix timestamp and print a warning
-        print(f"Invalid date format: {date_str}")
+    except ValueError:
+        pass
+
+    # Try to parse the date string using arrow, which supports many common date formats
+    import arrow
+
+    try:
+        return int(arrow.get(date_str).timestamp())
+    except (ValueError, TypeError) as e:
+        raise ValueError(f"Invalid date format: {date_str!r}") from e
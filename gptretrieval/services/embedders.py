@@ -0,0 +1,163 @@
+import asyncio
+import functools
+import importlib
+import os
+import threading
+from types import ModuleType
+from typing import Dict, List, Optional, Union
+
+# The embedding backend used when none is named
+EMBEDDER = os.getenv("EMBEDDER", "openai")
+
+# Embedding backends by name. Each module exposes get_embeddings(texts, as_array),
+# warmup() and EMBEDDING_DIM, and is only imported when first asked for, so an
+# unused backend never imports torch, transformers, onnxruntime or openai.
+EMBEDDER_MODULES = {
+    "openai": ".openai",
+    "codebert": ".codebert",
+    "msmarco": ".sentence_msmarco_bert",
+    # codebert or msmarco exported by onnx_embedder.export_onnx, run with onnxruntime
+    "onnx": ".onnx_embedder",
+}
+# The backends running in this process, which an EmbeddingPool can spread over processes
+LOCAL_EMBEDDERS = ("codebert", "msmarco", "onnx")
+# Worker processes serving each local backend, 0 runs them in the calling process
+EMBEDDING_POOL_WORKERS = int(os.getenv("EMBEDDING_POOL_WORKERS", "0"))
+
+
+class Embedder:
+    """An embedding backend: texts in, one float32 vector per text out.
+
+    Subclasses implement get_embeddings and may override get_embeddings_async,
+    which otherwise runs get_embeddings on the default executor.
+
+    Args:
+        name: The name the embedder is registered under.
+        dim: The dimension of the embeddings, None if unknown.
+    """
+
+    def __init__(self, name: str, dim: Optional[int] = None):
+        self.name = name
+        self._dim = dim
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.name!r}, dim={self.dim})"
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self._dim
+
+    def get_embeddings(self, texts: List[str], as_array: bool = False):
+        """
+        Embed texts.
+
+        Args:
+            texts: The list of texts to embed.
+            as_array: If True, return a float32 numpy matrix instead of nested lists.
+
+        Returns:
+            A list of embeddings, each of which is a list of floats, or a (len(texts), dim) matrix.
+        """
+        raise NotImplementedError
+
+    async def get_embeddings_async(self, texts: List[str], as_array: bool = False):
+        """Async version of get_embeddings"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(self.get_embeddings, texts, as_array=as_array)
+        )
+
+    def warmup(self):
+        """Load the model or client now rather than on the first request"""
+
+    def check_dim(self, output_dim: Optional[int]):
+        """
+        Check the embeddings fit a vector field of output_dim dimensions.
+
+        Raises:
+            ValueError: If both dimensions are known and differ.
+        """
+        if self.dim is not None and output_dim is not None and self.dim != output_dim:
+            raise ValueError(
+                f"Embedder {self.name} produces {self.dim} dimensions but output_dim is {output_dim}"
+            )
+
+
+class ModuleEmbedder(Embedder):
+    """An Embedder backed by one of the service modules, imported on first use.
+
+    Args:
+        name: The name the embedder is registered under.
+        module: The module, relative to this package, as in EMBEDDER_MODULES.
+    """
+
+    def __init__(self, name: str, module: str):
+        super().__init__(name)
+        self.module_name = module
+
+    @property
+    def module(self) -> ModuleType:
+        return importlib.import_module(self.module_name, __package__)
+
+    @property
+    def dim(self) -> Optional[int]:
+        return getattr(self.module, "EMBEDDING_DIM", None)
+
+    def get_embeddings(self, texts: List[str], as_array: bool = False):
+        return self.module.get_embeddings(texts, as_array=as_array)
+
+    async def get_embeddings_async(self, texts: List[str], as_array: bool = False):
+        module = self.module
+        if hasattr(module, "get_embeddings_async"):
+            return await module.get_embeddings_async(texts, as_array=as_array)
+        return await super().get_embeddings_async(texts, as_array=as_array)
+
+    def warmup(self):
+        self.module.warmup()
+
+
+_embedders: Dict[str, Embedder] = {}
+_lock = threading.Lock()
+
+
+def register_embedder(embedder: Embedder):
+    """Make an embedder available to get_embedder under its name, replacing any other"""
+    with _lock:
+        _embedders[embedder.name] = embedder
+
+
+def get_embedder(embedder: Union[str, Embedder, None] = None) -> Embedder:
+    """
+    Look up an embedding backend, its model is still loaded on first use.
+
+    Args:
+        embedder: The name of the backend, defaults to EMBEDDER. An Embedder is returned as is.
+
+    Returns:
+        The Embedder.
+    """
+    if isinstance(embedder, Embedder):
+        return embedder
+    name = embedder or EMBEDDER
+    with _lock:
+        if name not in _embedders:
+            if name not in EMBEDDER_MODULES:
+                raise ValueError(f"Unsupported embedder: {name}")
+            if EMBEDDING_POOL_WORKERS > 0 and name in LOCAL_EMBEDDERS:
+                from .embedding_pool import EmbeddingPool
+
+                _embedders[name] = EmbeddingPool(name, workers=EMBEDDING_POOL_WORKERS)
+            else:
+                _embedders[name] = ModuleEmbedder(name, EMBEDDER_MODULES[name])
+        return _embedders[name]
+
+
+def warmup(*names: str):
+    """
+    Load the models and clients of embedding backends ahead of the first request.
+
+    Args:
+        names: The names of the backends, defaults to EMBEDDER.
+    """
+    for name in names or (EMBEDDER,):
+        get_embedder(name).warmup()
@@ -0,0 +1,285 @@
+import atexit
+import itertools
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+from multiprocessing.shared_memory import SharedMemory
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from .embedders import EMBEDDER_MODULES, Embedder, ModuleEmbedder
+
+# Threads each worker gives torch / onnxruntime, defaults to the cores divided among the workers
+EMBEDDING_POOL_THREADS = int(os.getenv("EMBEDDING_POOL_THREADS", "0"))
+# Number of texts in each task sent to a worker
+EMBEDDING_POOL_BATCH_SIZE = int(os.getenv("EMBEDDING_POOL_BATCH_SIZE", "64"))
+# Tasks queued ahead of the workers before callers block, defaults to twice the workers
+EMBEDDING_POOL_MAX_PENDING = int(os.getenv("EMBEDDING_POOL_MAX_PENDING", "0"))
+
+
+class _Request:
+    """The tasks of one get_embeddings call still being worked on"""
+
+    def __init__(self, tasks: int):
+        self.remaining = tasks
+        self.error: Optional[str] = None
+        self.done = threading.Event()
+
+
+class EmbeddingPool(Embedder):
+    """A local embedding backend run by a pool of worker processes.
+
+    Each worker loads the model once and embeds batches of texts, so tokenization
+    and inference use every core instead of one interpreter. Texts are sent over a
+    bounded task queue, and the embeddings are written straight into a shared memory
+    matrix of the caller, so the float32 output is never pickled. Callers block while
+    the task queue is full, which keeps a fast producer from queueing unbounded work.
+
+    Workers are started on the first call, or by start().
+
+    Args:
+        name: The local backend, "codebert", "msmarco" or "onnx".
+        workers: The number of worker processes.
+        threads_per_worker: Threads each worker gives torch / onnxruntime.
+        batch_size: The number of texts in each task.
+        max_pending: Tasks queued ahead of the workers before callers block.
+        module: The backend module, defaults to EMBEDDER_MODULES[name].
+    """
+
+    def __init__(
+        self,
+        name: str,
+        workers: int = 2,
+        threads_per_worker: int = EMBEDDING_POOL_THREADS,
+        batch_size: int = EMBEDDING_POOL_BATCH_SIZE,
+        max_pending: int = EMBEDDING_POOL_MAX_PENDING,
+        module: Optional[str] = None,
+    ):
+        super().__init__(name)
+        self.module_name = module or EMBEDDER_MODULES[name]
+        self.workers = max(1, workers)
+        self.threads_per_worker = threads_per_worker or max(
+            1, (os.cpu_count() or 1) // self.workers
+        )
+        self.batch_size = batch_size
+        self.max_pending = max_pending or 2 * self.workers
+        self._processes: List[multiprocessing.Process] = []
+        self._requests: Dict[int, _Request] = {}
+        self._request_ids = itertools.count()
+        # Released once by each worker when its model is loaded
+        self._ready = threading.Semaphore(0)
+        # Set once every worker has loaded the model, later warmups return at once
+        self._warmed = threading.Event()
+        self._lock = threading.Lock()
+        # Serializes warmups, so concurrent callers do not split the workers' releases
+        self._warmup_lock = threading.Lock()
+        self._closed = False
+
+    @property
+    def dim(self) -> Optional[int]:
+        return ModuleEmbedder(self.name, self.module_name).dim
+
+    def start(self):
+        """Start the workers, does nothing if they are running"""
+        with self._lock:
+            if self._processes:
+                return
+            if self._closed:
+                raise RuntimeError("The embedding pool is closed")
+            # spawn, so workers never inherit a parent's torch threads or CUDA context
+            ctx = multiprocessing.get_context("spawn")
+            self._tasks = ctx.Queue(maxsize=self.max_pending)
+            self._results = ctx.Queue()
+            self._processes = [
+                ctx.Process(
+                    target=_worker,
+                    args=(
+                        self.name,
+                        self.module_name,
+                        self.threads_per_worker,
+                        self._tasks,
+                        self._results,
+                    ),
+                    name=f"embedding-{self.name}-{i}",
+                    daemon=True,
+                )
+                for i in range(self.workers)
+            ]
+            for process in self._processes:
+                process.start()
+            self._collector = threading.Thread(
+                target=self._collect, name="embedding-pool-results", daemon=True
+            )
+            self._collector.start()
+            atexit.register(self.close)
+
+    def warmup(self):
+        """Start the workers and wait until each has loaded the model"""
+        self.start()
+        with self._warmup_lock:
+            if self._warmed.is_set():
+                return
+            for _ in range(self.workers):
+                while not self._ready.acquire(timeout=1.0):
+                    if not self._alive():
+                        raise RuntimeError("Embedding workers died while loading the model")
+            self._warmed.set()
+
+    def get_embeddings(
+        self, texts: List[str], as_array: bool = False, batch_size: Optional[int] = None
+    ):
+        """
+        Embed texts on the workers, blocking while the task queue is full.
+
+        Args:
+            texts: The list of texts to embed.
+            as_array: If True, return a float32 numpy matrix instead of nested lists.
+            batch_size: The number of texts in each task, defaults to self.batch_size.
+
+        Returns:
+            A list of embeddings, each of which is a list of floats, or a (len(texts), dim) matrix.
+
+        Raises:
+            RuntimeError: If a worker failed to embed a batch or died.
+        """
+        if isinstance(texts, str):
+            texts = [texts]
+        dim = self.dim
+        if dim is None:
+            raise ValueError(f"The dimension of embedder {self.name} is unknown")
+        if not texts:
+            # Nothing to embed, so no reason to start the workers
+            embeddings = np.empty((0, dim), dtype=np.float32)
+            return embeddings if as_array else embeddings.tolist()
+        self.start()
+        if not self._alive():
+            raise RuntimeError("Embedding workers died, the pool must be recreated")
+
+        batch_size = batch_size or self.batch_size
+        # Similar lengths in a batch pad less, rows are written back in the original order
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        batches = [order[i : i + batch_size] for i in range(0, len(order), batch_size)]
+        shape = (len(texts), dim)
+        shm = SharedMemory(create=True, size=int(np.prod(shape)) * 4)
+        request_id = next(self._request_ids)
+        request = _Request(len(batches))
+        with self._lock:
+            self._requests[request_id] = request
+        try:
+            for rows in batches:
+                self._put((request_id, shm.name, shape, rows, [texts[i] for i in rows]))
+            request.done.wait()
+            if request.error is not None:
+                raise RuntimeError(f"Embedding worker failed: {request.error}")
+            embeddings = np.ndarray(shape, dtype=np.float32, buffer=shm.buf).copy()
+        finally:
+            with self._lock:
+                self._requests.pop(request_id, None)
+            shm.close()
+            shm.unlink()
+        return embeddings if as_array else embeddings.tolist()
+
+    def _put(self, task):
+        """Queue a task, waiting for room, and fail if the workers died in the meantime"""
+        while True:
+            try:
+                self._tasks.put(task, timeout=1.0)
+                return
+            except queue.Full:
+                if not self._alive():
+                    raise RuntimeError("Embedding workers died")
+
+    def _alive(self) -> bool:
+        return all(process.is_alive() for process in self._processes)
+
+    def _collect(self):
+        """Route the workers' results to the waiting requests"""
+        while not self._closed:
+            try:
+                request_id, error = self._results.get(timeout=1.0)
+            except queue.Empty:
+                if not self._alive() and not self._closed:
+                    self._fail_all("a worker process died")
+                continue
+            if request_id is None:
+                # A worker finished loading its model
+                self._ready.release()
+                continue
+            with self._lock:
+                request = self._requests.get(request_id)
+            if request is None:
+                continue
+            if error is not None:
+                request.error = error
+            request.remaining -= 1
+            if request.remaining == 0:
+                request.done.set()
+
+    def _fail_all(self, error: str):
+        with self._lock:
+            requests = list(self._requests.values())
+        for request in requests:
+            request.error = error
+            request.done.set()
+
+    def close(self):
+        """Stop the workers, waiting for the queued tasks to finish"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            processes, self._processes = self._processes, []
+        if not processes:
+            return
+        try:
+            for _ in processes:
+                self._tasks.put(None, timeout=1.0)
+        except queue.Full:
+            # The workers are stuck or dead, they are terminated below
+            pass
+        for process in processes:
+            process.join(timeout=30)
+            if process.is_alive():
+                process.terminate()
+        self._fail_all("the embedding pool was closed")
+
+    def __enter__(self) -> "EmbeddingPool":
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _worker(name, module, threads, tasks, results):
+    """Load the backend once, then embed tasks into the callers' shared memory until None"""
+    # Set before the backend imports torch / onnxruntime, which size their thread pools on import
+    for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "ONNX_THREADS"):
+        os.environ[variable] = str(threads)
+    os.environ["TOKENIZERS_PARALLELISM"] = "false"
+    embedder = ModuleEmbedder(name, module)
+    embedder.warmup()
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+    results.put((None, None))
+
+    while True:
+        task = tasks.get()
+        if task is None:
+            return
+        request_id, shm_name, shape, rows, texts = task
+        try:
+            embeddings = embedder.get_embeddings(texts, as_array=True)
+            shm = SharedMemory(name=shm_name)
+            try:
+                out = np.ndarray(shape, dtype=np.float32, buffer=shm.buf)
+                out[rows] = embeddings
+                del out
+            finally:
+                shm.close()
+            results.put((request_id, None))
+        except Exception as e:
+            results.put((request_id, repr(e)))
@@ -0,0 +1,99 @@
+from typing import Callable, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+
+class NearestCentroidClassifier:
+    """Classifies question embeddings by cosine similarity to the mean embedding of each label.
+
+    A local, microsecond alternative to classification.classify_question for the
+    labels in classification.labels_dict. Confidences are a softmax over the
+    similarities, so callers can fall back to GPT when the classifier is unsure.
+
+    Args:
+        temperature: Softmax temperature applied to the cosine similarities.
+    """
+
+    def __init__(self, temperature: float = 0.05):
+        self.temperature = temperature
+        self.labels = np.empty(0, dtype=np.int64)
+        self.centroids = np.empty((0, 0), dtype=np.float32)
+
+    def fit(self, embeddings, labels: Sequence[int]) -> "NearestCentroidClassifier":
+        """
+        Compute one normalized centroid per label.
+
+        Args:
+            embeddings: The (n, dim) embeddings of the labelled examples.
+            labels: The label of each example.
+
+        Returns:
+            The fitted classifier.
+        """
+        embeddings = _normalize(np.asarray(embeddings, dtype=np.float32))
+        labels = np.asarray(labels)
+        self.labels = np.unique(labels)
+        self.centroids = _normalize(
+            np.stack([embeddings[labels == label].mean(axis=0) for label in self.labels])
+        )
+        return self
+
+    def predict_proba(self, embeddings) -> np.ndarray:
+        """Return the (n, n_labels) probability of each label, in the order of self.labels"""
+        embeddings = _normalize(np.atleast_2d(np.asarray(embeddings, dtype=np.float32)))
+        logits = embeddings @ self.centroids.T / self.temperature
+        logits -= logits.max(axis=1, keepdims=True)
+        probabilities = np.exp(logits)
+        return probabilities / probabilities.sum(axis=1, keepdims=True)
+
+    def predict(self, embedding) -> Tuple[int, float]:
+        """Return the most likely label of a single embedding and its probability"""
+        probabilities = self.predict_proba(embedding)[0]
+        best = int(probabilities.argmax())
+        return int(self.labels[best]), float(probabilities[best])
+
+    def save(self, path: str) -> None:
+        np.savez(
+            path,
+            labels=self.labels,
+            centroids=self.centroids,
+            temperature=self.temperature,
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "NearestCentroidClassifier":
+        data = np.load(path)
+        classifier = cls(temperature=float(data["temperature"]))
+        classifier.labels = data["labels"]
+        classifier.centroids = data["centroids"]
+        return classifier
+
+    @classmethod
+    def from_examples(
+        cls,
+        examples: Dict[int, List[Dict]],
+        get_embeddings: Callable,
+        temperature: float = 0.05,
+    ) -> "NearestCentroidClassifier":
+        """
+        Train from labelled questions, such as test_cases in examples/classification.py.
+
+        Args:
+            examples: Lists of {"question": ...} examples keyed by label.
+            get_embeddings: The embedding function the queries are embedded with.
+            temperature: Softmax temperature applied to the cosine similarities.
+
+        Returns:
+            The fitted classifier.
+        """
+        questions, labels = [], []
+        for label, cases in examples.items():
+            for case in cases:
+                questions.append(case["question"])
+                labels.append(int(label))
+        return cls(temperature=temperature).fit(get_embeddings(questions), labels)
+
+
+def _normalize(embeddings: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(embeddings, axis=-1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
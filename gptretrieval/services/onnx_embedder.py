@@ -0,0 +1,286 @@
+import importlib
+import json
+import os
+import sys
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Directory written by export_onnx, holding the model, its tokenizer and embedder.json
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR")
+# Threads used by one inference session, 0 lets onnxruntime use every core
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+# Number of texts run through the model at once
+BATCH_SIZE = int(os.getenv("ONNX_BATCH_SIZE", "32"))
+
+# The PyTorch backends that can be exported, by embedder name
+EXPORTABLE = {"codebert": ".codebert", "msmarco": ".sentence_msmarco_bert"}
+METADATA_FILE = "embedder.json"
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model.int8.onnx"
+
+# Loaded on first use by load_model, so importing this module does not import onnxruntime
+_session = None
+_tokenizer = None
+_metadata: Optional[Dict] = None
+_lock = threading.Lock()
+
+
+def export_onnx(
+    backend: str,
+    output_dir: str,
+    quantize: bool = False,
+    max_length: Optional[int] = None,
+    opset: int = 14,
+) -> str:
+    """
+    Export a PyTorch embedder to ONNX, mean pooling included, so inference only needs onnxruntime.
+
+    Args:
+        backend: The embedder to export, "codebert" or "msmarco".
+        output_dir: The directory to write the model, its tokenizer and embedder.json to.
+        quantize: Also write a dynamically int8 quantized model, used instead of the float one.
+        max_length: The maximum number of tokens per text, defaults to the backend's.
+        opset: The ONNX opset version.
+
+    Returns:
+        The path of the model inference will use.
+    """
+    import torch
+
+    if backend not in EXPORTABLE:
+        raise ValueError(f"Unsupported embedder for ONNX export: {backend}")
+    module = importlib.import_module(EXPORTABLE[backend], __package__)
+    os.makedirs(output_dir, exist_ok=True)
+
+    if backend == "codebert":
+        tokenizer, model, _ = module.load_model()
+        max_length = max_length or module.MAX_LENGTH
+
+        class Pooled(torch.nn.Module):
+            def __init__(self, model):
+                super().__init__()
+                self.model = model
+
+            def forward(self, input_ids, attention_mask):
+                outputs = self.model(input_ids=input_ids, attention_mask=attention_mask)
+                return module.mean_pool(outputs.last_hidden_state, attention_mask)
+
+    else:
+        model = module.load_model()
+        tokenizer = model.tokenizer
+        max_length = max_length or model.max_seq_length
+
+        class Pooled(torch.nn.Module):
+            def __init__(self, model):
+                super().__init__()
+                self.model = model
+
+            def forward(self, input_ids, attention_mask):
+                features = {"input_ids": input_ids, "attention_mask": attention_mask}
+                return self.model(features)["sentence_embedding"]
+
+    wrapper = Pooled(model).eval()
+    # The graph does not depend on the device the sample runs on
+    device = next(wrapper.parameters()).device
+    sample = tokenizer(["def f(): pass"], return_tensors="pt")
+    model_path = os.path.join(output_dir, MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            wrapper,
+            (sample["input_ids"].to(device), sample["attention_mask"].to(device)),
+            model_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["embedding"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "embedding": {0: "batch"},
+            },
+            opset_version=opset,
+        )
+    tokenizer.save_pretrained(output_dir)
+
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        # Weights stored as int8, activations quantized on the fly at inference
+        quantize_dynamic(
+            model_path,
+            os.path.join(output_dir, QUANTIZED_MODEL_FILE),
+            weight_type=QuantType.QInt8,
+        )
+        model_path = os.path.join(output_dir, QUANTIZED_MODEL_FILE)
+
+    metadata = {
+        "backend": backend,
+        "model": os.path.basename(model_path),
+        "dim": module.EMBEDDING_DIM,
+        "max_length": max_length,
+        "quantized": quantize,
+    }
+    with open(os.path.join(output_dir, METADATA_FILE), "w") as f:
+        json.dump(metadata, f, indent=2)
+    print(f"Exported {backend} to {model_path}")
+    return model_path
+
+
+def read_metadata(model_dir: Optional[str] = ONNX_MODEL_DIR) -> Dict:
+    """The embedder.json written by export_onnx"""
+    if not model_dir:
+        raise ValueError("ONNX_MODEL_DIR must be set to use the onnx embedder")
+    with open(os.path.join(model_dir, METADATA_FILE)) as f:
+        return json.load(f)
+
+
+def create_session(model_path: str, threads: int = ONNX_THREADS):
+    """An onnxruntime CPU inference session with graph optimizations enabled"""
+    import onnxruntime
+
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    options.intra_op_num_threads = threads
+    return onnxruntime.InferenceSession(
+        model_path, sess_options=options, providers=["CPUExecutionProvider"]
+    )
+
+
+def load_model():
+    """
+    Load the exported model of ONNX_MODEL_DIR, once, on the first call.
+
+    Returns:
+        The tokenizer, the inference session and the metadata of the export.
+    """
+    global _session, _tokenizer, _metadata
+    with _lock:
+        if _session is None:
+            from transformers import AutoTokenizer
+
+            metadata = read_metadata()
+            _tokenizer = AutoTokenizer.from_pretrained(ONNX_MODEL_DIR)
+            _session = create_session(os.path.join(ONNX_MODEL_DIR, metadata["model"]))
+            _metadata = metadata
+    return _tokenizer, _session, _metadata
+
+
+def warmup():
+    """Load the model now rather than on the first get_embeddings call"""
+    load_model()
+
+
+def __getattr__(name):
+    # The dimension comes from the export, read without loading the model
+    if name == "EMBEDDING_DIM":
+        return read_metadata()["dim"] if ONNX_MODEL_DIR else None
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def get_embeddings(
+    texts: List[str], batch_size: int = BATCH_SIZE, as_array: bool = False
+):
+    """
+    Embed texts with the exported ONNX model.
+
+    Texts are sorted by token length so each batch pads to similar lengths, and
+    restored to their original order afterwards.
+
+    Args:
+        texts: The list of texts to embed.
+        batch_size: The number of texts run through the model at once.
+        as_array: If True, return a float32 numpy matrix instead of nested lists.
+
+    Returns:
+        A list of embeddings, each of which is a list of floats, or a (len(texts), dim) matrix.
+    """
+    if isinstance(texts, str):
+        texts = [texts]
+    tokenizer, session, metadata = load_model()
+    return _run(tokenizer, session, metadata, texts, batch_size, as_array)
+
+
+def _run(tokenizer, session, metadata, texts, batch_size, as_array):
+    encodings = tokenizer(texts, truncation=True, max_length=metadata["max_length"])
+    order = sorted(range(len(texts)), key=lambda i: len(encodings["input_ids"][i]))
+
+    embeddings = np.empty((len(texts), metadata["dim"]), dtype=np.float32)
+    for start in range(0, len(order), batch_size):
+        batch = order[start : start + batch_size]
+        inputs = tokenizer.pad(
+            {
+                "input_ids": [encodings["input_ids"][i] for i in batch],
+                "attention_mask": [encodings["attention_mask"][i] for i in batch],
+            },
+            return_tensors="np",
+        )
+        (pooled,) = session.run(
+            ["embedding"],
+            {
+                "input_ids": inputs["input_ids"].astype(np.int64),
+                "attention_mask": inputs["attention_mask"].astype(np.int64),
+            },
+        )
+        # Scatter the batch back to the original order
+        embeddings[batch] = pooled
+
+    return embeddings if as_array else embeddings.tolist()
+
+
+def check_parity(
+    model_dir: str, texts: List[str], min_cosine: float = 0.99
+) -> Dict[str, float]:
+    """
+    Compare the embeddings of an export with those of the PyTorch model it came from.
+
+    Args:
+        model_dir: The directory written by export_onnx.
+        texts: Sample texts, ideally like the ones embedded in production.
+        min_cosine: The lowest cosine similarity accepted for any text.
+
+    Returns:
+        The minimum and mean cosine similarity, and whether the minimum reached min_cosine.
+    """
+    from transformers import AutoTokenizer
+
+    metadata = read_metadata(model_dir)
+    module = importlib.import_module(EXPORTABLE[metadata["backend"]], __package__)
+    expected = module.get_embeddings(texts, as_array=True)
+    actual = _run(
+        AutoTokenizer.from_pretrained(model_dir),
+        create_session(os.path.join(model_dir, metadata["model"])),
+        metadata,
+        texts,
+        BATCH_SIZE,
+        True,
+    )
+    cosine = (expected * actual).sum(axis=1) / (
+        np.linalg.norm(expected, axis=1) * np.linalg.norm(actual, axis=1)
+    )
+    report = {
+        "min_cosine": float(cosine.min()),
+        "mean_cosine": float(cosine.mean()),
+        "passed": bool(cosine.min() >= min_cosine),
+    }
+    print(
+        "ONNX parity of {}: min cosine {:.5f}, mean {:.5f}, {}".format(
+            metadata["model"],
+            report["min_cosine"],
+            report["mean_cosine"],
+            "passed" if report["passed"] else "FAILED",
+        )
+    )
+    return report
+
+
+# Export a model and check it, e.g. python -m gptretrieval.services.onnx_embedder codebert onnx/codebert int8
+if __name__ == "__main__":
+    backend = sys.argv[1] if len(sys.argv) > 1 else "codebert"
+    output_dir = sys.argv[2] if len(sys.argv) > 2 else os.path.join("onnx", backend)
+    export_onnx(backend, output_dir, quantize="int8" in sys.argv[3:])
+    code = [
+        "def hello_world():\n    print('Hello, world!')",
+        "class Point:\n    def __init__(self, x, y):\n        self.x, self.y = x, y",
+        "How do I read a file line by line?",
+    ]
+    check_parity(output_dir, code)
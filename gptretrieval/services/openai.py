@@ -1,19 +1,97 @@
 from typing import List
-from openai import OpenAI, OpenAIError
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import base64
 import os
 import json
 import re
+import threading
+import weakref
 
-try:
-    client = OpenAI(api_key=os.environ.get("client_API_KEY"))
-    assert client.api_key is not None, "client_API_KEY environment variable must be set"
-    # get gpt model env variable, or set default
-    EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
-except OpenAIError as e:
-    print("Error: {}".format(e))
-
+import numpy as np
 from tenacity import retry, wait_random_exponential, stop_after_attempt
 
+from .cache import EmbeddingCache
+
+# get gpt model env variable, or set default
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+# Size of the embeddings of EMBEDDING_MODEL, None for a model not listed here
+EMBEDDING_DIM = {
+    "text-embedding-3-small": 1536,
+    "text-embedding-3-large": 3072,
+    "text-embedding-ada-002": 1536,
+}.get(EMBEDDING_MODEL)
+
+# Per request limits used to pack texts into embedding batches
+EMBEDDING_BATCH_MAX_ITEMS = int(os.getenv("EMBEDDING_BATCH_MAX_ITEMS", "2048"))
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "250000"))
+# Maximum number of embedding requests in flight at once
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+
+# Size of the in-process embedding cache, 0 disables caching
+EMBEDDING_CACHE_MB = int(os.getenv("EMBEDDING_CACHE_MB", "256"))
+# Directory of the persistent embedding cache, unset keeps the cache in memory only
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR")
+# Hold the in-process cache tier as 8-bit codes, about 4x the entries for the same size
+EMBEDDING_CACHE_QUANTIZE = os.getenv("EMBEDDING_CACHE_QUANTIZE", "").lower() in ("1", "true")
+
+embedding_cache = (
+    EmbeddingCache(
+        max_bytes=EMBEDDING_CACHE_MB * 1024 * 1024,
+        path=EMBEDDING_CACHE_DIR,
+        quantize=EMBEDDING_CACHE_QUANTIZE,
+    )
+    if EMBEDDING_CACHE_MB > 0 or EMBEDDING_CACHE_DIR
+    else None
+)
+
+# Created on first use by get_client, so importing this module does not import openai
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    """
+    The OpenAI client, created on the first call.
+
+    Raises:
+        OpenAIError: If the client can not be created, e.g. without an API key.
+    """
+    global _client, _async_client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from openai import AsyncOpenAI, OpenAI
+
+                client = OpenAI(api_key=os.environ.get("client_API_KEY"))
+                assert client.api_key is not None, "client_API_KEY environment variable must be set"
+                # Non-blocking client used by the async query path
+                _async_client = AsyncOpenAI(api_key=client.api_key)
+                _client = client
+    return _client
+
+
+def get_async_client():
+    """The AsyncOpenAI client, created with the client on the first call"""
+    get_client()
+    return _async_client
+
+
+def __getattr__(name):
+    # Keep openai.client and openai.async_client working, creating them on access
+    if name == "client":
+        return get_client()
+    if name == "async_client":
+        return get_async_client()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def warmup():
+    """Create the clients and load the tokenizer now rather than on the first request"""
+    get_client()
+    _get_encoding()
+
 
 def clean_str(message):
     # Preserving line breaks but removing extra whitespace from each line
@@ -36,32 +114,187 @@ def clean_escape_chars(json_string):
     return json_string
 
 
-@retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(3))
-def get_embeddings(texts: List[str]) -> List[List[float]]:
+def get_embeddings(texts: List[str], as_array: bool = False):
+    """
+    Embed texts using client's ada model, skipping the ones found in embedding_cache.
+
+    Args:
+        texts: The list of texts to embed.
+        as_array: If True, return a float32 numpy matrix instead of nested lists.
+
+    Returns:
+        A list of embeddings, each of which is a list of floats, or a (len(texts), dim) matrix.
+
+    Raises:
+        Exception: If the client API call fails.
     """
-    Embed texts using client's ada model.
+    if isinstance(texts, str):
+        texts = [texts]
+    embeddings, missing = _lookup_cache(texts)
+    new_embeddings = _embed_batches(missing) if missing else None
+    return _assemble(texts, embeddings, missing, new_embeddings, as_array)
+
+
+async def get_embeddings_async(texts: List[str], as_array: bool = False):
+    """
+    Async version of get_embeddings, does not block the event loop while waiting on the API.
 
     Args:
         texts: The list of texts to embed.
+        as_array: If True, return a float32 numpy matrix instead of nested lists.
 
     Returns:
-        A list of embeddings, each of which is a list of floats.
+        A list of embeddings, each of which is a list of floats, or a (len(texts), dim) matrix.
 
     Raises:
         Exception: If the client API call fails.
     """
     if isinstance(texts, str):
         texts = [texts]
-    # Call the client API to get the embeddings
-    response = client.embeddings.create(input=texts, model=EMBEDDING_MODEL)
+    embeddings, missing = _lookup_cache(texts)
+    new_embeddings = await _embed_batches_async(missing) if missing else None
+    return _assemble(texts, embeddings, missing, new_embeddings, as_array)
+
 
-    # Extract the embedding data from the response
-    data = response.data  # type: ignore
+def _lookup_cache(texts: List[str]):
+    """Return the cached embeddings (None where missing) and the distinct texts to embed"""
+    if embedding_cache is None:
+        return [None] * len(texts), list(dict.fromkeys(texts))
+    embeddings = embedding_cache.get_many(EMBEDDING_MODEL, texts)
+    missing = [text for text, e in zip(texts, embeddings) if e is None]
+    return embeddings, list(dict.fromkeys(missing))
 
-    # Return the embeddings as a list of lists of floats
 
-    # return [np.random.rand(1536).tolist() for _ in range(len(texts))]
-    return [result.embedding for result in data]
+def _assemble(texts, embeddings, missing, new_embeddings, as_array):
+    """Store the new embeddings in the cache and stack all the embeddings in the order of texts"""
+    if missing:
+        if embedding_cache is not None:
+            embedding_cache.put_many(EMBEDDING_MODEL, missing, new_embeddings)
+        by_text = dict(zip(missing, new_embeddings))
+        embeddings = [by_text[t] if e is None else e for t, e in zip(texts, embeddings)]
+    matrix = np.stack(embeddings) if embeddings else np.empty((0, 0), dtype=np.float32)
+    return matrix if as_array else matrix.tolist()
+
+
+_dispatch_executor = ThreadPoolExecutor(
+    max_workers=EMBEDDING_MAX_CONCURRENCY, thread_name_prefix="embeddings"
+)
+# A semaphore binds to the event loop it is first used on, so each loop gets its own
+_dispatch_semaphores = weakref.WeakKeyDictionary()
+# The tiktoken encoding of EMBEDDING_MODEL, False when tiktoken is not installed
+_encoding = None
+
+
+def _get_encoding():
+    """Load the tiktoken encoding on the first call, None when tiktoken is not installed"""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+        except ImportError:
+            _encoding = False
+        else:
+            try:
+                _encoding = tiktoken.encoding_for_model(EMBEDDING_MODEL)
+            except KeyError:
+                _encoding = tiktoken.get_encoding("cl100k_base")
+    return _encoding or None
+
+
+def count_tokens(text: str) -> int:
+    """Count the tokens of a text with tiktoken, or estimate them when it is not installed"""
+    encoding = _get_encoding()
+    if encoding is None:
+        # Conservative estimate, English text averages about 4 bytes per token
+        return len(text.encode("utf-8")) // 3 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def pack_batches(
+    texts: List[str],
+    max_items: int = EMBEDDING_BATCH_MAX_ITEMS,
+    max_tokens: int = EMBEDDING_BATCH_MAX_TOKENS,
+) -> List[List[str]]:
+    """
+    Split texts, in order, into batches that each fit in one embeddings request.
+
+    Args:
+        texts: The list of texts to embed.
+        max_items: The maximum number of texts in a batch.
+        max_tokens: The maximum number of tokens in a batch, a longer text gets a batch of its own.
+
+    Returns:
+        The list of batches.
+    """
+    batches, batch, batch_tokens = [], [], 0
+    for text in texts:
+        tokens = count_tokens(text)
+        if batch and (len(batch) >= max_items or batch_tokens + tokens > max_tokens):
+            batches.append(batch)
+            batch, batch_tokens = [], 0
+        batch.append(text)
+        batch_tokens += tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
+def _embed_batches(texts: List[str]) -> np.ndarray:
+    """Embed the batches concurrently, each one retried on its own, keeping the order of texts"""
+    batches = pack_batches(texts)
+    if len(batches) == 1:
+        return _create_embeddings(batches[0])
+    return np.concatenate(list(_dispatch_executor.map(_create_embeddings, batches)))
+
+
+def _get_dispatch_semaphore() -> asyncio.Semaphore:
+    """The semaphore bounding the requests in flight on the running event loop"""
+    loop = asyncio.get_running_loop()
+    semaphore = _dispatch_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = _dispatch_semaphores[loop] = asyncio.Semaphore(
+            EMBEDDING_MAX_CONCURRENCY
+        )
+    return semaphore
+
+
+async def _embed_batches_async(texts: List[str]) -> np.ndarray:
+    """Async version of _embed_batches"""
+    semaphore = _get_dispatch_semaphore()
+
+    async def _embed(batch: List[str]) -> np.ndarray:
+        async with semaphore:
+            return await _create_embeddings_async(batch)
+
+    return np.concatenate(
+        await asyncio.gather(*[_embed(batch) for batch in pack_batches(texts)])
+    )
+
+
+@retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(3))
+def _create_embeddings(texts: List[str]) -> np.ndarray:
+    """Call the client API to get the embeddings"""
+    response = get_client().embeddings.create(
+        input=texts, model=EMBEDDING_MODEL, encoding_format="base64"
+    )
+    return _decode_embeddings(response.data)  # type: ignore
+
+
+@retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(3))
+async def _create_embeddings_async(texts: List[str]) -> np.ndarray:
+    """Call the async client API to get the embeddings"""
+    response = await get_async_client().embeddings.create(
+        input=texts, model=EMBEDDING_MODEL, encoding_format="base64"
+    )
+    return _decode_embeddings(response.data)  # type: ignore
+
+
+def _decode_embeddings(data) -> np.ndarray:
+    """Decode base64 embeddings straight to a float32 matrix, skipping lists of floats"""
+    data = sorted(data, key=lambda result: result.index)
+    return np.stack(
+        [np.frombuffer(base64.b64decode(r.embedding), dtype=np.float32) for r in data]
+    )
 
 
 @retry(wait=wait_random_exponential(min=1, max=20), stop=stop_after_attempt(3))
@@ -82,7 +315,7 @@ def get_chat_completion(messages, tools=None, tool_choice="auto", model="gpt-4")
         Exception: If the client API call fails.
     """
     # Call the client chat completion API with the given messages and tools
-    response = client.chat.completions.create(
+    response = get_client().chat.completions.create(
         model=model, messages=messages, tools=tools, tool_choice=tool_choice
     )
 
@@ -0,0 +1,347 @@
+from typing import Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+# Rows scored per chunk, bounds the float32 temporaries of a scan over the codes
+SCAN_CHUNK_ROWS = 65536
+# Rows of SQ8 codes converted to float32 at once, 4096 rows of 1536 dims is 24 MB
+SQ_CONVERT_ROWS = 4096
+
+
+class Quantizer:
+    """Compresses float32 vectors to uint8 codes and scores queries against them.
+
+    Scores are inner products computed by asymmetric distance computation (ADC):
+    the query stays in float32 and only the stored vectors are quantized, so
+    codes never have to be decoded to float vectors to be searched.
+    """
+
+    kind = ""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+
+    @property
+    def trained(self) -> bool:
+        raise NotImplementedError
+
+    @property
+    def code_size(self) -> int:
+        """Bytes per encoded vector"""
+        raise NotImplementedError
+
+    def train(self, vectors: np.ndarray):
+        raise NotImplementedError
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def _scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+    def scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        """Approximate inner products of the queries with the encoded vectors
+
+        Args:
+            queries (np.ndarray): float32 queries, one per row.
+            codes (np.ndarray): Codes from encode(), one vector per row.
+
+        Returns:
+            np.ndarray: A (queries, codes) matrix of scores.
+        """
+        queries = np.asarray(queries, dtype=np.float32)
+        if len(codes) <= SCAN_CHUNK_ROWS:
+            return self._scores(queries, codes)
+        return np.concatenate(
+            [
+                self._scores(queries, codes[i : i + SCAN_CHUNK_ROWS])
+                for i in range(0, len(codes), SCAN_CHUNK_ROWS)
+            ],
+            axis=1,
+        )
+
+    def _arrays(self) -> Dict[str, np.ndarray]:
+        raise NotImplementedError
+
+    def save(self, path: str):
+        np.savez(path, kind=np.asarray(self.kind), dim=np.asarray(self.dim), **self._arrays())
+
+
+class ScalarQuantizer(Quantizer):
+    """SQ8, every dimension mapped linearly onto 256 levels between its trained min and max.
+
+    Takes 1 byte per dimension, 4x less than float32.
+    """
+
+    kind = "SQ8"
+
+    def __init__(self, dim: int):
+        super().__init__(dim)
+        self.low: Optional[np.ndarray] = None
+        self.step: Optional[np.ndarray] = None
+
+    @property
+    def trained(self) -> bool:
+        return self.low is not None
+
+    @property
+    def code_size(self) -> int:
+        return self.dim
+
+    def train(self, vectors: np.ndarray):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        self.low = vectors.min(axis=0)
+        step = (vectors.max(axis=0) - self.low) / 255
+        # Constant dimensions encode to 0 and decode back to low
+        self.step = np.where(step > 0, step, 1).astype(np.float32)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        codes = np.rint((vectors - self.low) / self.step)
+        return np.clip(codes, 0, 255).astype(np.uint8)
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return self.low + codes.astype(np.float32) * self.step
+
+    def _scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        # q . (low + codes * step) = q . low + (q * step) . codes
+        scaled = queries * self.step
+        scores = np.empty((len(queries), len(codes)), dtype=np.float32)
+        # matmul needs float codes, converted a block at a time so the copy stays small
+        for i in range(0, len(codes), SQ_CONVERT_ROWS):
+            block = codes[i : i + SQ_CONVERT_ROWS].astype(np.float32)
+            np.matmul(scaled, block.T, out=scores[:, i : i + SQ_CONVERT_ROWS])
+        scores += (queries @ self.low)[:, None]
+        return scores
+
+    def _arrays(self) -> Dict[str, np.ndarray]:
+        return {"low": self.low, "step": self.step}
+
+
+class ProductQuantizer(Quantizer):
+    """PQ, the vector split into subvectors each replaced by the nearest of 256 trained centroids.
+
+    Takes 1 byte per subvector. With the default of one subvector per 4 dimensions
+    that is 16x less than float32.
+
+    Args:
+        dim (int): The dimension of the vectors.
+        subvectors (int, optional): Number of subvectors, must divide dim. Defaults to dim // 4.
+        iterations (int, optional): k-means iterations per subspace.
+        max_train_rows (int, optional): Rows sampled to train the centroids.
+        seed (int, optional): Seed of the sampling and of the centroid initialization.
+    """
+
+    kind = "PQ"
+
+    def __init__(
+        self,
+        dim: int,
+        subvectors: Optional[int] = None,
+        iterations: int = 10,
+        max_train_rows: int = 256 * 40,
+        seed: int = 0,
+    ):
+        super().__init__(dim)
+        self.subvectors = subvectors or max(1, dim // 4)
+        if dim % self.subvectors:
+            raise ValueError(
+                f"Number of subvectors {self.subvectors} does not divide the dimension {dim}"
+            )
+        self.subdim = dim // self.subvectors
+        self.iterations = iterations
+        self.max_train_rows = max_train_rows
+        self.seed = seed
+        # (subvectors, centroids, subdim)
+        self.centroids: Optional[np.ndarray] = None
+
+    @property
+    def trained(self) -> bool:
+        return self.centroids is not None
+
+    @property
+    def code_size(self) -> int:
+        return self.subvectors
+
+    def _split(self, vectors: np.ndarray) -> np.ndarray:
+        """(rows, dim) to (subvectors, rows, subdim)"""
+        return (
+            np.asarray(vectors, dtype=np.float32)
+            .reshape(len(vectors), self.subvectors, self.subdim)
+            .transpose(1, 0, 2)
+        )
+
+    def train(self, vectors: np.ndarray):
+        rng = np.random.default_rng(self.seed)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(vectors) > self.max_train_rows:
+            vectors = vectors[rng.choice(len(vectors), self.max_train_rows, replace=False)]
+        k = min(256, len(vectors))
+        self.centroids = np.stack(
+            [_kmeans(sub, k, self.iterations, rng) for sub in self._split(vectors)]
+        )
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.empty((len(vectors), self.subvectors), dtype=np.uint8)
+        for j, sub in enumerate(self._split(vectors)):
+            codes[:, j] = _nearest(sub, self.centroids[j])
+        return codes
+
+    def decode(self, codes: np.ndarray) -> np.ndarray:
+        return np.concatenate(
+            [self.centroids[j][codes[:, j]] for j in range(self.subvectors)], axis=1
+        )
+
+    def _scores(self, queries: np.ndarray, codes: np.ndarray) -> np.ndarray:
+        # One lookup table per query of the inner products of its subvectors with every centroid
+        tables = np.einsum("jqd,jkd->qjk", self._split(queries), self.centroids)
+        scores = np.zeros((len(queries), len(codes)), dtype=np.float32)
+        for j in range(self.subvectors):
+            scores += tables[:, j, codes[:, j]]
+        return scores
+
+    def _arrays(self) -> Dict[str, np.ndarray]:
+        return {"centroids": self.centroids}
+
+
+def _nearest(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """Index of the nearest centroid, by euclidean distance, of each vector"""
+    distances = (centroids**2).sum(axis=1) - 2 * vectors @ centroids.T
+    return distances.argmin(axis=1)
+
+
+def _kmeans(
+    vectors: np.ndarray, k: int, iterations: int, rng: np.random.Generator
+) -> np.ndarray:
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    for _ in range(iterations):
+        assignment = _nearest(vectors, centroids)
+        counts = np.bincount(assignment, minlength=k)
+        sums = np.stack(
+            [np.bincount(assignment, weights=column, minlength=k) for column in vectors.T],
+            axis=1,
+        )
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        # Restart the empty clusters from random vectors
+        centroids[empty] = vectors[rng.choice(len(vectors), int(empty.sum()))]
+    return centroids
+
+
+def make_quantizer(kind: str, dim: int, subvectors: Optional[int] = None) -> Quantizer:
+    """Create an untrained quantizer
+
+    Args:
+        kind (str): "SQ8" or "PQ".
+        dim (int): The dimension of the vectors.
+        subvectors (int, optional): The number of PQ subvectors.
+    """
+    match kind.upper():
+        case "SQ8":
+            return ScalarQuantizer(dim)
+        case "PQ":
+            return ProductQuantizer(dim, subvectors=subvectors)
+        case _:
+            raise ValueError(f"Unsupported quantization: {kind}")
+
+
+def load_quantizer(path: str) -> Quantizer:
+    data = np.load(path)
+    kind, dim = str(data["kind"]), int(data["dim"])
+    if kind == "SQ8":
+        quantizer = ScalarQuantizer(dim)
+        quantizer.low, quantizer.step = data["low"], data["step"]
+    else:
+        centroids = data["centroids"]
+        quantizer = ProductQuantizer(dim, subvectors=centroids.shape[0])
+        quantizer.centroids = centroids
+    return quantizer
+
+
+def top_k_indices(scores: np.ndarray, k: int) -> np.ndarray:
+    """Column indexes of the k best scores of each row, best first"""
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, top, axis=1), axis=1)
+    return np.take_along_axis(top, order, axis=1)
+
+
+def rerank(
+    queries: np.ndarray, candidates: np.ndarray, vectors: np.ndarray, k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Re-score each query's candidate rows with the full precision vectors and keep the k best
+
+    Returns:
+        The rows and exact scores of the hits, best first, one row per query.
+    """
+    exact = np.einsum("qd,qcd->qc", queries, vectors[candidates])
+    best = top_k_indices(exact, k)
+    return (
+        np.take_along_axis(candidates, best, axis=1),
+        np.take_along_axis(exact, best, axis=1),
+    )
+
+
+def recall_report(
+    quantizer: Quantizer,
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    k: int = 10,
+    rerank_factors: Iterable[int] = (1, 4, 16),
+) -> Dict[str, float]:
+    """Recall@k of quantized search against exact float32 search
+
+    The quantizer is trained on vectors if it is not already.
+
+    Args:
+        quantizer (Quantizer): The quantizer to evaluate.
+        vectors (np.ndarray): The corpus, one float32 vector per row.
+        queries (np.ndarray): The queries, one per row.
+        k (int, optional): The number of hits compared.
+        rerank_factors (Iterable[int], optional): Candidates re-ranked in full precision, as multiples of k.
+
+    Returns:
+        Dict[str, float]: The compression ratio, the recall of ADC alone and of each re-ranking factor.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    queries = np.asarray(queries, dtype=np.float32)
+    if not quantizer.trained:
+        quantizer.train(vectors)
+    codes = quantizer.encode(vectors)
+    exact = top_k_indices(queries @ vectors.T, k)
+    approximate = quantizer.scores(queries, codes)
+
+    def recall(hits: np.ndarray) -> float:
+        return float(
+            np.mean([len(set(h) & set(e)) / len(e) for h, e in zip(hits.tolist(), exact.tolist())])
+        )
+
+    report = {
+        "bytes_per_vector": float(quantizer.code_size),
+        "compression": 4 * quantizer.dim / quantizer.code_size,
+        "recall": recall(top_k_indices(approximate, k)),
+    }
+    for factor in rerank_factors:
+        candidates = top_k_indices(approximate, k * factor)
+        report[f"recall_rerank_{factor}x"] = recall(rerank(queries, candidates, vectors, k)[0])
+    return report
+
+
+def compress_vector(vector: np.ndarray) -> Tuple[np.ndarray, float, float]:
+    """SQ8 encode a single vector against its own min and max, needs no training
+
+    Returns:
+        The uint8 codes, the low value and the step to decode them.
+    """
+    vector = np.asarray(vector, dtype=np.float32)
+    low = float(vector.min())
+    step = float(vector.max() - low) / 255 or 1.0
+    codes = np.clip(np.rint((vector - low) / step), 0, 255).astype(np.uint8)
+    return codes, low, step
+
+
+def decompress_vector(codes: np.ndarray, low: float, step: float) -> np.ndarray:
+    return (low + codes.astype(np.float32) * step).astype(np.float32)
@@ -1,45 +1,78 @@
-import sentence_transformers
-import torch
+import numpy as np
+import threading
 from typing import List
 import os
 
 model_dir = os.getenv("TRANSFORMERS_MODEL_DIR")
 
-# Load the CodeBERT model and tokenizer
 model_name = "krlvi/sentence-msmarco-bert-base-dot-v5-nlpl-code_search_net"
+# Size of the embeddings, the hidden size of the BERT base model
+EMBEDDING_DIM = 768
 
-device = torch.device(
-    "cuda"
-    if torch.cuda.is_available()
-    else ("mps" if torch.backends.mps.is_available() else "cpu")
-)
+# Loaded on first use by load_model, so importing this module does not import torch
+_model = None
+_lock = threading.Lock()
 
-if model_dir:
-    print(f"Loading from local disk {model_dir}")
-    model = sentence_transformers.SentenceTransformer(model_dir, device=device)
-else:
-    model = sentence_transformers.SentenceTransformer(model_name, device=device)
+
+def load_model():
+    """
+    Load the sentence transformer, once, on the first call.
+
+    Returns:
+        The SentenceTransformer model.
+    """
+    global _model
+    with _lock:
+        if _model is None:
+            import sentence_transformers
+            import torch
+
+            device = torch.device(
+                "cuda"
+                if torch.cuda.is_available()
+                else ("mps" if torch.backends.mps.is_available() else "cpu")
+            )
+            if model_dir:
+                print(f"Loading from local disk {model_dir}")
+                _model = sentence_transformers.SentenceTransformer(model_dir, device=device)
+            else:
+                _model = sentence_transformers.SentenceTransformer(model_name, device=device)
+    return _model
+
+
+def warmup():
+    """Load the model now rather than on the first get_embeddings call"""
+    load_model()
+
+
+def __getattr__(name):
+    # Keep sentence_msmarco_bert.model and .device working, loading on access
+    if name == "model":
+        return load_model()
+    if name == "device":
+        return load_model().device
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
-def get_embeddings(texts: List[str]) -> List[List[float]]:
+def get_embeddings(texts: List[str], as_array: bool = False):
     """
     Embed texts using either OpenAI's ada model or CodeBERT.
 
     Args:
         texts: The list of texts to embed.
-        use_openai: If True, use OpenAI's ada model. Otherwise, use CodeBERT.
+        as_array: If True, return a float32 numpy matrix instead of nested lists.
 
     Returns:
-        A list of embeddings, each of which is a list of floats.
+        A list of embeddings, each of which is a list of floats, or a (len(texts), dim) matrix.
     """
     if isinstance(texts, str):
         texts = [texts]
 
     # Get the embeddings from the model
-    embeddings = model.encode(texts, convert_to_tensor=True, show_progress_bar=False)
-    embeddings = embeddings.cpu().numpy().tolist()
+    embeddings = load_model().encode(texts, convert_to_numpy=True, show_progress_bar=False)
+    embeddings = embeddings.astype(np.float32, copy=False)
 
-    return embeddings
+    return embeddings if as_array else embeddings.tolist()
 
 
 # setup a main function so we can run this file to test the code
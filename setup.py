@@ -35,6 +35,7 @@ setup(
         "tree_sitter",
         "tree_sitter_languages",
         "arrow",
+        "numpy",
         "torch",
         "transformers",
     ],
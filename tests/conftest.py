@@ -0,0 +1,50 @@
+import hashlib
+import os
+
+import numpy as np
+import pytest
+
+from gptretrieval.datastore.providers.local_datastore import LocalDataStore
+from gptretrieval.services.embedders import Embedder
+
+DIM = 16
+
+
+class HashEmbedder(Embedder):
+    """Deterministic unit vectors seeded by each text, so equal texts embed equally"""
+
+    def __init__(self, dim: int = DIM):
+        super().__init__("hash", dim)
+
+    def get_embeddings(self, texts, as_array=False):
+        rows = []
+        for text in texts:
+            seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "little")
+            vector = np.random.default_rng(seed).standard_normal(self.dim).astype(np.float32)
+            rows.append(vector / np.linalg.norm(vector))
+        embeddings = np.asarray(rows, dtype=np.float32).reshape(len(texts), self.dim)
+        return embeddings if as_array else embeddings.tolist()
+
+
+@pytest.fixture
+def embedder():
+    return HashEmbedder()
+
+
+@pytest.fixture
+def make_datastore(tmp_path, embedder):
+    """Create LocalDataStores embedding with HashEmbedder and tuning kept under tmp_path"""
+
+    def make(**kwargs):
+        kwargs.setdefault("output_dim", DIM)
+        kwargs.setdefault("search_tuning_path", os.path.join(tmp_path, "tuning.json"))
+        kwargs.setdefault("path", None)
+        kwargs.setdefault("embedder", embedder)
+        return LocalDataStore(**kwargs)
+
+    return make
+
+
+def chunk(id: str, text: str, **fields):
+    """A row in the format taken by insert"""
+    return {"id": id, "text": text, "document_id": id, "source": "file", **fields}
@@ -0,0 +1,40 @@
+import numpy as np
+
+from gptretrieval.services.cache import EmbeddingCache
+
+
+def test_texts_differing_in_whitespace_are_cached_apart():
+    cache = EmbeddingCache()
+    cache.put_many("model", ["text", " text\n"], [[1.0, 0.0], [0.0, 1.0]])
+
+    cached = cache.get_many("model", ["text", " text\n", "other"])
+
+    assert cached[0].tolist() == [1.0, 0.0]
+    assert cached[1].tolist() == [0.0, 1.0]
+    assert cached[2] is None
+
+
+def test_models_are_cached_apart():
+    cache = EmbeddingCache()
+    cache.put_many("a", ["text"], [[1.0]])
+
+    assert cache.get_many("b", ["text"]) == [None]
+
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    EmbeddingCache(path=str(tmp_path)).put_many("model", ["text"], [[0.5, 0.25]])
+
+    (embedding,) = EmbeddingCache(path=str(tmp_path)).get_many("model", ["text"])
+
+    assert embedding.dtype == np.float32
+    assert embedding.tolist() == [0.5, 0.25]
+
+
+def test_quantized_tier_is_close():
+    cache = EmbeddingCache(quantize=True)
+    vector = np.linspace(-1, 1, 32, dtype=np.float32)
+    cache.put_many("model", ["text"], [vector])
+
+    (embedding,) = cache.get_many("model", ["text"])
+
+    np.testing.assert_allclose(embedding, vector, atol=2 / 255)
@@ -0,0 +1,199 @@
+import json
+import os
+
+import pytest
+
+from gptretrieval.models.models import DocumentMetadataFilter
+from gptretrieval.services import code_chunker
+from gptretrieval.services.code_chunker import (
+    _merge_small,
+    _split_lines,
+    chunk_file,
+    chunk_source,
+    ingest_repository,
+    iter_chunks,
+    list_files,
+)
+
+
+def write(root, path, content):
+    full_path = os.path.join(root, path)
+    os.makedirs(os.path.dirname(full_path), exist_ok=True)
+    mode = "wb" if isinstance(content, bytes) else "w"
+    with open(full_path, mode) as f:
+        f.write(content)
+
+
+@pytest.fixture
+def repo(tmp_path):
+    root = str(tmp_path / "repo")
+    write(root, "pkg/a.py", "import os\n\n\ndef a():\n    return os.getcwd()\n")
+    write(root, "pkg/b.py", "def b():\n    return 2\n")
+    write(root, "README.md", "# Title\n\nSome documentation.\n")
+    write(root, "pkg/data.bin", b"\0\1\2")
+    write(root, "node_modules/dep.js", "module.exports = 1\n")
+    write(root, ".hidden/c.py", "x = 1\n")
+    return root
+
+
+def test_list_files_skips_vendored_hidden_and_unknown_files(repo):
+    expected = ["README.md", os.path.join("pkg", "a.py"), os.path.join("pkg", "b.py")]
+    assert list_files(repo) == expected
+    assert list_files(repo, ["docs"]) == ["README.md"]
+
+
+def test_split_lines_respects_max_chars_and_overlaps():
+    text = "\n".join(f"line {i:02d}" for i in range(20))
+    pieces = _split_lines(text, 10, "module", "", max_chars=40, overlap_lines=1)
+
+    assert all(len(piece["text"]) <= 40 for piece in pieces)
+    assert pieces[0]["start_line"] == 10
+    assert pieces[-1]["end_line"] == 29
+    for previous, piece in zip(pieces, pieces[1:]):
+        assert piece["start_line"] == previous["end_line"]
+    lines = {line for piece in pieces for line in piece["text"].split("\n")}
+    assert lines == set(text.split("\n"))
+
+
+def test_split_lines_drops_blank_pieces():
+    assert _split_lines("\n\n\n", 1, "module", "", max_chars=10, overlap_lines=0) == []
+
+
+def test_merge_small_joins_adjacent_chunks_of_the_same_kind():
+    chunks = [
+        {"text": "x" * 50, "kind": "module", "symbol": "", "start_line": 1, "end_line": 3},
+        {"text": "y", "kind": "module", "symbol": "", "start_line": 4, "end_line": 4},
+        {"text": "z", "kind": "function", "symbol": "f", "start_line": 5, "end_line": 5},
+        {"text": "w", "kind": "module", "symbol": "", "start_line": 20, "end_line": 20},
+    ]
+    merged = _merge_small(chunks, min_chars=10, max_chars=100)
+
+    assert [c["text"] for c in merged] == ["x" * 50 + "\ny", "z", "w"]
+    assert merged[0]["end_line"] == 4
+
+
+def test_merge_small_keeps_chunks_that_would_not_fit():
+    chunks = [
+        {"text": "x" * 95, "kind": "module", "symbol": "", "start_line": 1, "end_line": 1},
+        {"text": "y" * 5, "kind": "module", "symbol": "", "start_line": 2, "end_line": 2},
+    ]
+    assert len(_merge_small(chunks, min_chars=10, max_chars=100)) == 2
+
+
+def test_docs_are_chunked_by_lines():
+    source = "\n".join(f"paragraph {i}" for i in range(100))
+    chunks = chunk_source(source, "docs", max_chars=200, min_chars=10, overlap_lines=0)
+
+    assert all(chunk["kind"] == "module" for chunk in chunks)
+    assert "\n".join(chunk["text"] for chunk in chunks) == source
+
+
+def test_chunk_file_rows(repo):
+    path, digest, rows = chunk_file(repo, "README.md")
+
+    assert path == "README.md" and digest
+    (row,) = rows
+    assert row["document_id"] == "README.md"
+    assert row["source"] == "file"
+    assert row["partition"] == "docs"
+    assert row["url"] == "README.md#L1-L4"
+    assert len(row["id"]) == 32
+    # Ids are stable across runs
+    assert chunk_file(repo, "README.md")[2][0]["id"] == row["id"]
+
+
+def test_chunk_file_skips_unchanged_large_and_binary_files(repo, monkeypatch):
+    _, digest, _ = chunk_file(repo, "README.md")
+    assert chunk_file(repo, "README.md", previous_digest=digest) == ("README.md", digest, [])
+
+    write(repo, "pkg/data.py", b"\0binary")
+    assert chunk_file(repo, "pkg/data.py") == ("pkg/data.py", None, [])
+
+    monkeypatch.setattr(code_chunker, "CHUNK_MAX_FILE_BYTES", 4)
+    assert chunk_file(repo, "README.md") == ("README.md", None, [])
+
+
+def test_iter_chunks(repo):
+    chunks = list(iter_chunks(repo, workers=1))
+
+    document_ids = {chunk.metadata.document_id for chunk in chunks}
+    assert document_ids == {"README.md", "pkg/a.py", "pkg/b.py"}
+
+
+def test_python_definitions_become_chunks():
+    pytest.importorskip("tree_sitter_languages")
+    source = (
+        "import os\n\n\n"
+        "def first():\n    return 1\n\n\n"
+        "class Second:\n    def method(self):\n        return 2\n"
+    )
+    chunks = chunk_source(source, "python", max_chars=4000, min_chars=0, overlap_lines=0)
+
+    kinds = {(chunk["kind"], chunk["symbol"]) for chunk in chunks}
+    assert ("function", "first") in kinds
+    assert ("class", "Second") in kinds
+    assert [chunk["start_line"] for chunk in chunks] == sorted(
+        chunk["start_line"] for chunk in chunks
+    )
+
+
+def document_ids(datastore, partition=None):
+    """The distinct document_ids of the live rows, in a partition or in all of them"""
+    mask = datastore._candidates(None, [partition] if partition else None)
+    return sorted({datastore._rows[i]["document_id"] for i in mask.nonzero()[0]})
+
+
+def text(datastore, document_id):
+    mask = datastore._candidates(DocumentMetadataFilter(document_id=document_id), None)
+    return "\n".join(datastore._rows[i]["text"] for i in mask.nonzero()[0])
+
+
+def test_ingest_repository_is_incremental(repo, make_datastore, tmp_path):
+    datastore = make_datastore()
+    manifest = str(tmp_path / "manifest.json")
+
+    stats = ingest_repository(datastore, repo, manifest, workers=1)
+    assert stats["files"] == 3 and stats["removed"] == 0
+    assert document_ids(datastore, "pythoncode") == ["pkg/a.py", "pkg/b.py"]
+    assert document_ids(datastore, "docs") == ["README.md"]
+
+    write(repo, "pkg/a.py", "def a():\n    return 'changed'\n")
+    os.remove(os.path.join(repo, "pkg", "b.py"))
+    stats = ingest_repository(datastore, repo, manifest, workers=1)
+
+    assert (stats["files"], stats["unchanged"], stats["removed"]) == (1, 1, 1)
+    assert document_ids(datastore) == ["README.md", "pkg/a.py"]
+    assert "'changed'" in text(datastore, "pkg/a.py")
+    with open(manifest) as f:
+        assert sorted(json.load(f)) == ["README.md", "pkg/a.py"]
+
+
+def test_ingest_repository_leaves_other_languages_alone(repo, make_datastore, tmp_path):
+    datastore = make_datastore()
+    manifest = str(tmp_path / "manifest.json")
+    ingest_repository(datastore, repo, manifest, workers=1)
+
+    stats = ingest_repository(datastore, repo, manifest, languages=["python"], workers=1)
+
+    assert stats["removed"] == 0
+    assert document_ids(datastore, "docs") == ["README.md"]
+    with open(manifest) as f:
+        assert "README.md" in json.load(f)
+
+
+def test_ingest_repository_deletes_files_that_became_too_large(
+    repo, make_datastore, tmp_path, monkeypatch
+):
+    datastore = make_datastore()
+    manifest = str(tmp_path / "manifest.json")
+    ingest_repository(datastore, repo, manifest, workers=1)
+
+    write(repo, "README.md", "# Title\n\n" + "generated\n" * 100)
+    monkeypatch.setattr(code_chunker, "CHUNK_MAX_FILE_BYTES", 200)
+    stats = ingest_repository(datastore, repo, manifest, workers=1)
+
+    assert stats["removed"] == 1
+    assert document_ids(datastore, "docs") == []
+    with open(manifest) as f:
+        assert "README.md" not in json.load(f)
+
@@ -0,0 +1,42 @@
+import pytest
+
+from gptretrieval.services.date import to_unix_timestamp
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("1700000000", 1700000000),
+        ("1700000000.9", 1700000000),
+        ("-86400", -86400),
+        ("12", 12),
+        (1700000000, 1700000000),
+        (1700000000.5, 1700000000),
+        ("2023-01-15", 1673740800),
+        ("2023-01-15T12:00:00", 1673784000),
+        ("2023-01-15T12:00:00Z", 1673784000),
+        ("2023-01-15T14:00:00+02:00", 1673784000),
+        (" 2023-01-15 ", 1673740800),
+    ],
+)
+def test_to_unix_timestamp(value, expected):
+    assert to_unix_timestamp(value) == expected
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [
+        ("2023", 1672531200),
+        ("1970", 0),
+        ("20230115", 1673740800),
+    ],
+)
+def test_year_and_basic_dates_are_not_epoch_seconds(value, expected):
+    assert to_unix_timestamp(value) == expected
+
+
+def test_other_formats_fall_back_to_arrow():
+    pytest.importorskip("arrow")
+    assert to_unix_timestamp("2023-01-15 12:00:00+00:00") == 1673784000
+    with pytest.raises(ValueError):
+        to_unix_timestamp("not a date")
@@ -0,0 +1,45 @@
+import numpy as np
+import pytest
+
+from gptretrieval.services.embedding_pool import EmbeddingPool
+
+
+@pytest.fixture
+def pool():
+    with EmbeddingPool(
+        "fake", workers=2, threads_per_worker=1, batch_size=3, module="tests.fake_embedder"
+    ) as pool:
+        yield pool
+
+
+def test_embeddings_keep_the_order_of_the_texts(pool):
+    texts = ["a" * n for n in (5, 1, 7, 3, 2, 9, 4)]
+    embeddings = pool.get_embeddings(texts, as_array=True)
+
+    assert embeddings.dtype == np.float32
+    assert embeddings[:, 0].tolist() == [5, 1, 7, 3, 2, 9, 4]
+    assert pool.get_embeddings(["abc"]) == [[3.0, 1.0, 2.0, 3.0]]
+
+
+def test_warmup_twice_then_embed(pool):
+    pool.warmup()
+    pool.warmup()
+
+    assert pool.get_embeddings(["ab"], as_array=True).tolist() == [[2, 1, 2, 3]]
+
+
+def test_empty_input_does_not_start_the_workers():
+    pool = EmbeddingPool("fake", workers=1, module="tests.fake_embedder")
+
+    embeddings = pool.get_embeddings([], as_array=True)
+
+    assert embeddings.shape == (0, 4) and embeddings.dtype == np.float32
+    assert pool.get_embeddings([]) == []
+    assert not pool._processes
+    pool.close()
+
+
+def test_closed_pool_cannot_restart(pool):
+    pool.close()
+    with pytest.raises(RuntimeError):
+        pool.get_embeddings(["a"])
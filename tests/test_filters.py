@@ -0,0 +1,103 @@
+import pytest
+
+from gptretrieval.datastore.filters import (
+    canonical_filter,
+    compile_filter,
+    compile_predicate,
+    like_prefix,
+    merge_filters,
+)
+from gptretrieval.models.models import DocumentMetadataFilter, Source
+
+
+def test_empty_filter_compiles_to_none():
+    assert compile_filter(DocumentMetadataFilter()) is None
+
+
+def test_fields_are_joined_in_a_fixed_order():
+    filter = DocumentMetadataFilter(author="don", document_id="doc", source=Source.file)
+    assert compile_filter(filter) == (
+        '(document_id == "doc") and (source == "file") and (author == "don")'
+    )
+
+
+def test_lists_compile_to_a_sorted_in_expression():
+    filter = DocumentMetadataFilter(source_id=["b", "a", "b"])
+    assert compile_filter(filter) == '(source_id in ["a", "b"])'
+
+
+def test_equivalent_filters_share_a_canonical_form():
+    a = DocumentMetadataFilter(source_id=["b", "a"], source=Source.chat)
+    b = DocumentMetadataFilter(source="chat", source_id=["a", "b"])
+    assert canonical_filter(a) == canonical_filter(b)
+
+
+def test_dates_compile_to_created_at_bounds():
+    filter = DocumentMetadataFilter(start_date="2023-01-01", end_date="1700000000")
+    assert compile_filter(filter) == "(created_at >= 1672531200) and (created_at <= 1700000000)"
+
+
+def test_values_are_escaped():
+    filter = DocumentMetadataFilter(author='a "quoted" \\ name')
+    assert compile_filter(filter) == '(author == "a \\"quoted\\" \\\\ name")'
+
+
+def test_prefix_filter():
+    filter = DocumentMetadataFilter(prefix={"url": "src/"})
+    assert compile_filter(filter) == '(url like "src/%")'
+
+
+def test_prefix_wildcards_are_escaped():
+    # like_prefix escapes them, then quote escapes the backslashes for the string literal
+    filter = DocumentMetadataFilter(prefix={"source_id": "my_mod%"})
+    assert compile_filter(filter) == '(source_id like "my\\\\_mod\\\\%%")'
+
+
+@pytest.mark.parametrize(
+    "prefix, expected",
+    [("src/", "src/%"), ("a_b", "a\\_b%"), ("100%", "100\\%%"), ("a\\b", "a\\\\b%")],
+)
+def test_like_prefix(prefix, expected):
+    assert like_prefix(prefix) == expected
+
+
+def test_prefix_rejects_invalid_field_names():
+    with pytest.raises(ValueError):
+        compile_filter(DocumentMetadataFilter(prefix={"url) or (1": "x"}))
+
+
+def test_merge_filters():
+    merged = merge_filters(
+        DocumentMetadataFilter(author="a"), None, DocumentMetadataFilter(source_id="s")
+    )
+    assert merged == '(author == "a") and (source_id == "s")'
+    assert merge_filters(DocumentMetadataFilter()) is None
+
+
+@pytest.mark.parametrize(
+    "filter, row, expected",
+    [
+        (DocumentMetadataFilter(author="a"), {"author": "a"}, True),
+        (DocumentMetadataFilter(author="a"), {"author": "b"}, False),
+        (DocumentMetadataFilter(source=Source.file), {"source": "file"}, True),
+        (DocumentMetadataFilter(document_id=["x", "y"]), {"document_id": "y"}, True),
+        (DocumentMetadataFilter(document_id=["x", "y"]), {"document_id": "z"}, False),
+        (DocumentMetadataFilter(start_date="2023"), {"created_at": 1672531200}, True),
+        (DocumentMetadataFilter(start_date="2023"), {"created_at": 1672531199}, False),
+        (DocumentMetadataFilter(end_date="2023-01-01"), {"created_at": 1672531200}, True),
+        (DocumentMetadataFilter(end_date="2023-01-01"), {"created_at": None}, True),
+        (DocumentMetadataFilter(start_date="2023-01-01"), {"created_at": None}, False),
+        (DocumentMetadataFilter(prefix={"url": "src/"}), {"url": "src/a.py"}, True),
+        (DocumentMetadataFilter(prefix={"url": "src/"}), {"url": None}, False),
+        (DocumentMetadataFilter(prefix={"url": "my_"}), {"url": "my_mod.py"}, True),
+        (DocumentMetadataFilter(prefix={"url": "my_"}), {"url": "myXmod.py"}, False),
+        (
+            DocumentMetadataFilter(author="a", source_id="s"),
+            {"author": "a", "source_id": "t"},
+            False,
+        ),
+        (DocumentMetadataFilter(), {"author": "a"}, True),
+    ],
+)
+def test_compile_predicate(filter, row, expected):
+    assert compile_predicate(filter)(row) is expected
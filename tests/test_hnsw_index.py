@@ -0,0 +1,90 @@
+import numpy as np
+import pytest
+
+from gptretrieval.datastore.providers.hnsw_index import HNSWIndex, recall_at_k
+
+
+@pytest.fixture
+def vectors():
+    vectors = np.random.default_rng(0).standard_normal((400, 16)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+@pytest.fixture
+def queries():
+    return np.random.default_rng(1).standard_normal((20, 16)).astype(np.float32)
+
+
+def exact(queries, vectors, k, allowed=None):
+    scores = queries @ vectors.T
+    if allowed is not None:
+        scores[:, ~allowed] = -np.inf
+    return [np.argsort(-row)[:k] for row in scores]
+
+
+def build(vectors, **kwargs):
+    index = HNSWIndex(M=8, ef_construction=64, seed=0, **kwargs)
+    index.add(range(len(vectors)), vectors)
+    return index
+
+
+def test_empty_index_returns_nothing(vectors, queries):
+    rows, scores = HNSWIndex().search(queries[0], 5, vectors)
+    assert len(rows) == 0 and len(scores) == 0
+
+
+def test_search_recall(vectors, queries):
+    index = build(vectors)
+    found = [index.search(q, 10, vectors, ef=64)[0] for q in queries]
+
+    assert len(index) == len(vectors)
+    assert recall_at_k(found, exact(queries, vectors, 10)) >= 0.9
+
+
+def test_hits_are_sorted_with_their_scores(vectors, queries):
+    index = build(vectors)
+    rows, scores = index.search(queries[0], 10, vectors, ef=64)
+
+    np.testing.assert_allclose(scores, vectors[rows] @ queries[0], rtol=1e-5)
+    assert list(scores) == sorted(scores, reverse=True)
+
+
+def test_allowed_mask_excludes_rows(vectors, queries):
+    index = build(vectors)
+    allowed = np.arange(len(vectors)) % 2 == 0
+
+    found = [index.search(q, 10, vectors, allowed=allowed, ef=64)[0] for q in queries]
+
+    assert all(allowed[rows].all() for rows in found)
+    assert recall_at_k(found, exact(queries, vectors, 10, allowed)) >= 0.8
+
+
+def test_save_and_load_keeps_the_graph(vectors, queries, tmp_path):
+    index = build(vectors)
+    path = str(tmp_path / "hnsw.npz")
+    index.save(path, vectors)
+
+    loaded = HNSWIndex.load(path)
+
+    for q in queries:
+        expected = index.search(q, 10, vectors, ef=64)[0]
+        assert loaded.search(q, 10, vectors, ef=64)[0].tolist() == expected.tolist()
+
+
+def test_save_drops_rows_and_renumbers(vectors, queries, tmp_path):
+    index = build(vectors)
+    kept = np.flatnonzero(np.arange(len(vectors)) % 4 != 0)
+    path = str(tmp_path / "hnsw.npz")
+    index.save(path, vectors, rows=kept)
+
+    loaded = HNSWIndex.load(path)
+    compacted = vectors[kept]
+    found = [loaded.search(q, 10, compacted, ef=64)[0] for q in queries]
+
+    assert len(loaded) == len(kept)
+    assert recall_at_k(found, exact(queries, compacted, 10)) >= 0.9
+
+
+def test_recall_at_k():
+    assert recall_at_k([np.asarray([1, 2])], [np.asarray([2, 3])]) == 0.5
+    assert recall_at_k([], []) == 1.0
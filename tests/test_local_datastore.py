@@ -0,0 +1,168 @@
+import numpy as np
+import pytest
+
+from gptretrieval.models.models import DocumentMetadataFilter, Query
+
+from .conftest import DIM, HashEmbedder, chunk
+
+
+def ids(result):
+    return [hit.id for hit in result.results]
+
+
+def test_query_finds_the_inserted_text_first(make_datastore):
+    datastore = make_datastore()
+    datastore.insert([chunk(f"c{i}", f"text {i}") for i in range(20)])
+
+    (result,) = datastore.query_synch([Query(query="text 7")], top_k=3)
+
+    assert ids(result)[0] == "c7"
+    assert len(result.results) == 3
+    assert result.results[0].score == pytest.approx(1.0, abs=1e-5)
+    scores = [hit.score for hit in result.results]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_filter_by_document_id_list(make_datastore):
+    datastore = make_datastore()
+    datastore.insert([chunk(f"c{i}", f"text {i}") for i in range(20)])
+
+    query = Query(query="text 7", filter=DocumentMetadataFilter(document_id=["c1", "c2"]))
+    (result,) = datastore.query_synch([query])
+
+    assert sorted(ids(result)) == ["c1", "c2"]
+
+
+def test_broad_filter_returns_only_matching_rows(make_datastore):
+    # Most rows pass, so the rows are scored in place and the others masked out
+    datastore = make_datastore()
+    datastore.insert(
+        [chunk(f"c{i}", f"text {i}", author="a" if i else "b") for i in range(20)]
+    )
+
+    (result,) = datastore.query_synch(
+        [Query(query="text 0", filter=DocumentMetadataFilter(author="a"))], top_k=50
+    )
+
+    assert len(result.results) == 19
+    assert "c0" not in ids(result)
+
+
+def test_exact_search_matches_brute_force(make_datastore, embedder):
+    datastore = make_datastore()
+    texts = [f"text {i}" for i in range(50)]
+    datastore.insert(
+        [chunk(f"c{i}", t, author="most" if i % 3 else "few") for i, t in enumerate(texts)]
+    )
+    vectors = embedder.get_embeddings(texts, as_array=True)
+    query = embedder.get_embeddings(["question"], as_array=True)[0]
+
+    # "most" is scored in place and masked, "few" gathers its rows
+    for author, rows in (
+        ("most", [i for i in range(50) if i % 3]),
+        ("few", list(range(0, 50, 3))),
+    ):
+        expected = [f"c{rows[i]}" for i in np.argsort(-(vectors[rows] @ query))[:5]]
+        (result,) = datastore.query_synch(
+            [Query(query="question", filter=DocumentMetadataFilter(author=author))], top_k=5
+        )
+        assert ids(result) == expected
+
+
+def test_partitions_restrict_the_search(make_datastore):
+    datastore = make_datastore()
+    datastore.insert([chunk("p1", "python code")], partition="pythoncode")
+    datastore.insert([chunk("d1", "some docs")], partition="docs")
+
+    (result,) = datastore.query_synch([Query(query="python code")], partitions=["docs"])
+    assert ids(result) == ["d1"]
+    (result,) = datastore.query_synch([Query(query="python code")], partitions=["all"])
+    assert sorted(ids(result)) == ["d1", "p1"]
+
+
+def test_insert_with_an_existing_id_replaces_it(make_datastore):
+    datastore = make_datastore()
+    datastore.insert([chunk("c1", "old text")])
+    datastore.insert([chunk("c1", "new text")])
+
+    assert datastore.get_count() == 1
+    (result,) = datastore.query_synch([Query(query="new text")])
+    assert [hit.text for hit in result.results] == ["new text"]
+
+
+def test_delete_by_id_and_by_filter(make_datastore):
+    datastore = make_datastore()
+    datastore.insert([chunk(f"c{i}", f"text {i}") for i in range(5)])
+
+    assert datastore.delete(ids=["c0"])
+    assert datastore.delete(filter=DocumentMetadataFilter(document_id="c1"))
+    assert not datastore.delete()
+
+    assert datastore.get_count() == 3
+    (result,) = datastore.query_synch([Query(query="text 0")])
+    assert sorted(ids(result)) == ["c2", "c3", "c4"]
+
+
+def test_delete_within_a_partition(make_datastore):
+    datastore = make_datastore()
+    datastore.insert([chunk("a", "text a")], partition="one")
+    datastore.insert([chunk("b", "text b")], partition="two")
+
+    datastore.delete(delete_all=True, partition="one")
+
+    (result,) = datastore.query_synch([Query(query="text a")])
+    assert ids(result) == ["b"]
+
+
+def test_save_and_load(make_datastore, tmp_path):
+    datastore = make_datastore()
+    datastore.insert([chunk(f"c{i}", f"text {i}") for i in range(10)], partition="docs")
+    datastore.delete(ids=["c3"])
+    datastore.save(str(tmp_path / "store"))
+
+    loaded = make_datastore(path=str(tmp_path / "store"))
+
+    assert loaded.get_count() == 9
+    (result,) = loaded.query_synch([Query(query="text 4")], top_k=1, partitions=["docs"])
+    assert ids(result) == ["c4"]
+
+
+def test_wrong_embedding_dimension_is_rejected(make_datastore):
+    datastore = make_datastore()
+    with pytest.raises(ValueError):
+        datastore.insert([chunk("c1", "text", embedding=[0.0] * (DIM + 1))])
+
+
+def test_embedder_dimension_must_match_output_dim(make_datastore):
+    with pytest.raises(ValueError):
+        make_datastore(embedder=HashEmbedder(DIM + 1))
+
+
+def test_hnsw_index_recall(make_datastore, embedder):
+    datastore = make_datastore(index_type="HNSW", search_params={"ef": 64})
+    datastore.insert([chunk(f"c{i}", f"text {i}") for i in range(300)])
+    queries = embedder.get_embeddings([f"query {i}" for i in range(20)], as_array=True)
+
+    assert datastore.measure_recall(queries, top_k=5) >= 0.9
+
+
+@pytest.mark.parametrize("quantization", ["SQ8", "PQ"])
+def test_quantized_search_finds_the_exact_match(make_datastore, quantization):
+    datastore = make_datastore(quantization=quantization, quantization_train_size=100)
+    datastore.insert([chunk(f"c{i}", f"text {i}") for i in range(200)])
+    assert datastore._codes is not None
+
+    (result,) = datastore.query_synch([Query(query="text 42")], top_k=3)
+
+    assert ids(result)[0] == "c42"
+
+
+def test_query_cache_is_invalidated_by_inserts(make_datastore):
+    datastore = make_datastore(query_cache_size=16)
+    datastore.insert([chunk("c1", "text 1")])
+    query = Query(query="text 2")
+
+    assert ids(datastore.query_synch([query])[0]) == ["c1"]
+    datastore.insert([chunk("c2", "text 2")])
+
+    assert ids(datastore.query_synch([query])[0])[0] == "c2"
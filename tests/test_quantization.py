@@ -0,0 +1,120 @@
+import numpy as np
+import pytest
+
+from gptretrieval.services import quantization
+from gptretrieval.services.quantization import (
+    ProductQuantizer,
+    ScalarQuantizer,
+    compress_vector,
+    decompress_vector,
+    load_quantizer,
+    make_quantizer,
+    recall_report,
+    rerank,
+    top_k_indices,
+)
+
+
+@pytest.fixture
+def vectors():
+    return np.random.default_rng(0).standard_normal((500, 32)).astype(np.float32)
+
+
+@pytest.fixture
+def queries():
+    return np.random.default_rng(1).standard_normal((10, 32)).astype(np.float32)
+
+
+def test_top_k_indices_are_sorted_best_first():
+    scores = np.asarray([[0.1, 0.9, 0.5, 0.7], [4.0, 3.0, 2.0, 1.0]])
+    assert top_k_indices(scores, 2).tolist() == [[1, 3], [0, 1]]
+    assert top_k_indices(scores, 10).shape == (2, 4)
+
+
+def test_sq8_codes_decode_close_to_the_vectors(vectors):
+    quantizer = ScalarQuantizer(32)
+    quantizer.train(vectors)
+    codes = quantizer.encode(vectors)
+
+    assert codes.dtype == np.uint8
+    assert codes.shape == (500, quantizer.code_size)
+    step = (vectors.max(axis=0) - vectors.min(axis=0)) / 255
+    assert np.all(np.abs(quantizer.decode(codes) - vectors) <= step / 2 + 1e-5)
+
+
+@pytest.mark.parametrize("kind", ["SQ8", "PQ"])
+def test_scores_are_inner_products_with_the_decoded_vectors(kind, vectors, queries):
+    quantizer = make_quantizer(kind, 32)
+    quantizer.train(vectors)
+    codes = quantizer.encode(vectors)
+
+    expected = queries @ quantizer.decode(codes).T
+    np.testing.assert_allclose(quantizer.scores(queries, codes), expected, rtol=1e-4, atol=1e-3)
+
+
+@pytest.mark.parametrize("kind", ["SQ8", "PQ"])
+def test_chunked_scans_match_a_single_scan(kind, vectors, queries, monkeypatch):
+    quantizer = make_quantizer(kind, 32)
+    quantizer.train(vectors)
+    codes = quantizer.encode(vectors)
+    expected = quantizer.scores(queries, codes)
+
+    # Chunks and conversion blocks that do not divide the rows
+    monkeypatch.setattr(quantization, "SCAN_CHUNK_ROWS", 128)
+    monkeypatch.setattr(quantization, "SQ_CONVERT_ROWS", 37)
+
+    np.testing.assert_allclose(quantizer.scores(queries, codes), expected, rtol=1e-5, atol=1e-5)
+
+
+def test_pq_code_size():
+    quantizer = ProductQuantizer(32, subvectors=8)
+    assert quantizer.code_size == 8
+    with pytest.raises(ValueError):
+        ProductQuantizer(32, subvectors=5)
+
+
+def test_unknown_quantization():
+    with pytest.raises(ValueError):
+        make_quantizer("IVF", 32)
+
+
+@pytest.mark.parametrize("kind", ["SQ8", "PQ"])
+def test_save_and_load(kind, vectors, queries, tmp_path):
+    quantizer = make_quantizer(kind, 32)
+    quantizer.train(vectors)
+    codes = quantizer.encode(vectors)
+    quantizer.save(str(tmp_path / "quantizer.npz"))
+
+    loaded = load_quantizer(str(tmp_path / "quantizer.npz"))
+
+    assert loaded.kind == kind
+    np.testing.assert_array_equal(loaded.encode(vectors), codes)
+    np.testing.assert_allclose(loaded.scores(queries, codes), quantizer.scores(queries, codes))
+
+
+def test_rerank_restores_exact_order(vectors, queries):
+    candidates = top_k_indices(queries @ vectors.T, 50)[:, ::-1].copy()
+    rows, scores = rerank(queries, candidates, vectors, 5)
+
+    expected = top_k_indices(queries @ vectors.T, 5)
+    assert rows.tolist() == expected.tolist()
+    np.testing.assert_allclose(
+        scores, np.take_along_axis(queries @ vectors.T, expected, axis=1), rtol=1e-5
+    )
+
+
+def test_recall_report(vectors, queries):
+    report = recall_report(ScalarQuantizer(32), vectors, queries, k=10, rerank_factors=(4,))
+
+    assert report["compression"] == 4.0
+    assert report["recall"] >= 0.8
+    assert report["recall_rerank_4x"] >= report["recall"]
+
+
+def test_compress_vector_round_trip():
+    vector = np.linspace(-1, 1, 64, dtype=np.float32)
+    codes, low, step = compress_vector(vector)
+    np.testing.assert_allclose(decompress_vector(codes, low, step), vector, atol=step / 2 + 1e-6)
+
+    codes, low, step = compress_vector(np.ones(4, dtype=np.float32))
+    np.testing.assert_array_equal(decompress_vector(codes, low, step), np.ones(4))
@@ -0,0 +1,85 @@
+import numpy as np
+
+from gptretrieval.datastore.query_cache import QueryResultCache
+from gptretrieval.models.models import DocumentMetadataFilter, QueryResult, QueryWithEmbedding
+
+
+def query(text="question", embedding=(1.0, 0.0), **kwargs):
+    return QueryWithEmbedding(query=text, embedding=list(embedding), **kwargs)
+
+
+def cached(cache, queries, top_k=10, partitions=None):
+    """Look the queries up, storing a result for every miss, and return which ones hit"""
+    results, keys, snapshot = cache.lookup(queries, top_k, partitions)
+    misses = [i for i, result in enumerate(results) if result is None]
+    cache.store(
+        [keys[i] for i in misses],
+        [QueryResult(query=queries[i].query, results=[]) for i in misses],
+        snapshot,
+    )
+    return [result is not None for result in results]
+
+
+def test_second_lookup_hits():
+    cache = QueryResultCache()
+    assert cached(cache, [query()]) == [False]
+    assert cached(cache, [query()]) == [True]
+
+
+def test_key_covers_embedding_filter_top_k_and_partitions():
+    cache = QueryResultCache()
+    cached(cache, [query()], partitions=["docs"])
+
+    assert cached(cache, [query(embedding=(0.0, 1.0))], partitions=["docs"]) == [False]
+    assert cached(
+        cache, [query(filter=DocumentMetadataFilter(author="a"))], partitions=["docs"]
+    ) == [False]
+    assert cached(cache, [query()], top_k=5, partitions=["docs"]) == [False]
+    assert cached(cache, [query()], partitions=["code"]) == [False]
+
+
+def test_equivalent_arguments_share_a_key():
+    cache = QueryResultCache()
+    cached(cache, [query(embedding=np.asarray([1.0, 0.0]))], partitions=["b", "a"])
+    assert cached(cache, [query()], partitions=["a", "b"]) == [True]
+    cached(cache, [query()], partitions=None)
+    assert cached(cache, [query()], partitions=["docs", "all"]) == [True]
+
+
+def test_write_to_a_partition_invalidates_only_results_that_searched_it():
+    cache = QueryResultCache()
+    cached(cache, [query("docs")], partitions=["docs"])
+    cached(cache, [query("code")], partitions=["code"])
+    cached(cache, [query("everything")])
+
+    cache.invalidate("docs")
+
+    assert cached(cache, [query("docs")], partitions=["docs"]) == [False]
+    assert cached(cache, [query("code")], partitions=["code"]) == [True]
+    assert cached(cache, [query("everything")]) == [False]
+
+
+def test_write_to_the_whole_collection_invalidates_everything():
+    cache = QueryResultCache()
+    cached(cache, [query("code")], partitions=["code"])
+    cached(cache, [query("everything")])
+
+    cache.invalidate()
+
+    assert cached(cache, [query("code")], partitions=["code"]) == [False]
+    assert cached(cache, [query("everything")]) == [False]
+
+
+def test_result_of_a_query_racing_a_write_is_not_served():
+    cache = QueryResultCache()
+    results, keys, snapshot = cache.lookup([query()], 10, ["docs"])
+    # The write lands while the query runs, after its snapshot was taken
+    cache.invalidate("docs")
+    cache.store(keys, [QueryResult(query="question", results=[])], snapshot)
+
+    assert cached(cache, [query()], partitions=["docs"]) == [False]
+
+
+def test_partition_names_accepts_the_select_partition_mapping():
+    partitions = {"python": {"name": "pythoncode", "description": "Python code"}}
+    assert QueryResultCache.partition_names(partitions) == ("pythoncode",)
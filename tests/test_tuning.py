@@ -0,0 +1,22 @@
+import numpy as np
+
+from gptretrieval.datastore.tuning import exact_top_k_ids, recall
+
+
+def test_exact_top_k_ids_cosine():
+    vectors = np.array([[1, 0], [0, 2], [3, 3]], dtype=np.float32)
+    batches = [(["a", "b"], vectors[:2]), (["c"], vectors[2:])]
+    assert exact_top_k_ids([[0, 1]], batches, 2, metric_type="COSINE") == [["b", "c"]]
+
+
+def test_exact_top_k_ids_cosine_zero_vectors():
+    vectors = np.array([[0, 0], [1, 0]], dtype=np.float32)
+    batches = [(["zero", "x"], vectors)]
+    # A zero vector scores 0 instead of NaN, so it ranks below any similar vector
+    with np.errstate(invalid="raise"):
+        assert exact_top_k_ids([[1, 0]], batches, 2, metric_type="COSINE") == [["x", "zero"]]
+        assert len(exact_top_k_ids([[0, 0]], batches, 2, metric_type="COSINE")[0]) == 2
+
+
+def test_recall():
+    assert recall([["a", "b"]], [["a", "c"]]) == 0.5